@@ -7,20 +7,123 @@ class Settings:
     # OpenAI Configuration
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     OPENAI_MODEL = "gpt-4o"
+    # Point at another OpenAI-compatible endpoint, e.g. the local mock server
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+    # Several keys/deployments: a JSON list of {"name", "api_key" or "api_key_env", "base_url",
+    # "model", "requests_per_second", "tokens_per_minute", "weight"}; overrides the single key
+    OPENAI_ENDPOINTS_FILE = os.getenv("OPENAI_ENDPOINTS_FILE", "")
+    OPENAI_ENDPOINTS = []  # same format, set in code
     MAX_TOKENS = 500
     TEMPERATURE = 0.7
+    # Bias toward a scale's digit options (0 = off); per-question budgets are in src/ai/generation.py
+    SCALE_LOGIT_BIAS = float(os.getenv("SCALE_LOGIT_BIAS", "0"))
+    # Answer scale questions with the option distribution from one call's top logprobs
+    SCALE_LOGPROBS = os.getenv("SCALE_LOGPROBS", "false").lower() == "true"
+    SCALE_TOP_LOGPROBS = 20  # alternatives returned for the answer token (API maximum)
+    # "shared-prefix": static instructions + questionnaire first (prompt-cache friendly), persona and
+    # question last; "persona-first": the original persona-as-system-message layout
+    PROMPT_LAYOUT = os.getenv("PROMPT_LAYOUT", "shared-prefix")
+    # Extra answer guidance (realism, full scale range, short open answers) in either layout; changes results
+    PROMPT_GUIDANCE = os.getenv("PROMPT_GUIDANCE", "false").lower() == "true"
+    # Sampled answers per question, all from one request (the API's n parameter)
+    SURVEY_REPLICATES = int(os.getenv("SURVEY_REPLICATES", "1"))
     
     # Rate Limiting
-    REQUESTS_PER_SECOND = 3
+    REQUESTS_PER_SECOND = float(os.getenv("REQUESTS_PER_SECOND", "3"))
+    RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "3"))
+    # Shared by every process on this host; set to "" for a per-process limiter
+    RATE_LIMIT_STATE_FILE = os.getenv("RATE_LIMIT_STATE_FILE", "data/rate_limit_requests.json")
+    # Prompt + max_tokens are reserved per call, then reconciled with response.usage
+    TOKENS_PER_MINUTE = int(os.getenv("TOKENS_PER_MINUTE", "30000"))
+    TOKEN_LIMIT_STATE_FILE = os.getenv("TOKEN_LIMIT_STATE_FILE", "data/rate_limit_tokens.json")
     MAX_RETRIES = 3
     RETRY_DELAY = 1  # seconds
     
+    # Concurrency (async engine)
+    MAX_CONCURRENT_PERSONAS = int(os.getenv("MAX_CONCURRENT_PERSONAS", "5"))
+    
+    # Adaptive (AIMD) window of in-flight requests, shared by all clients in a process
+    AIMD_INITIAL_WINDOW = int(os.getenv("AIMD_INITIAL_WINDOW", "4"))
+    AIMD_MIN_WINDOW = 1
+    AIMD_MAX_WINDOW = int(os.getenv("AIMD_MAX_WINDOW", "64"))
+    
+    # Shared HTTP connection pool (one per process and endpoint)
+    HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", str(AIMD_MAX_WINDOW)))
+    HTTP_KEEPALIVE_SECONDS = 60
+    HTTP_CONNECT_TIMEOUT = 10  # seconds
+    HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "120"))
+    HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() == "true"  # needs httpx[http2] (the h2 package)
+    
+    # Singleflight: concurrent identical requests share one upstream call
+    COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "true").lower() == "true"
+    # Treat every call as an independent sample (no coalescing) when TEMPERATURE > 0
+    INDEPENDENT_SAMPLES = os.getenv("INDEPENDENT_SAMPLES", "false").lower() == "true"
+    
+    # Circuit breaker: stop calling an endpoint whose recent calls mostly fail
+    CIRCUIT_FAILURE_THRESHOLD = 0.5  # failure rate over the window that opens it
+    CIRCUIT_WINDOW = 20  # recent calls considered
+    CIRCUIT_MIN_CALLS = 5
+    CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))  # before a half-open probe
+    # Total pause per engine (summed over concurrent surveys) before questions are recorded as errors
+    CIRCUIT_MAX_PAUSE_SECONDS = float(os.getenv("CIRCUIT_MAX_PAUSE_SECONDS", "1800"))
+    
+    # Hedged requests: duplicate a call that outlives the p95 of recent latencies
+    HEDGING_ENABLED = os.getenv("HEDGING_ENABLED", "false").lower() == "true"
+    HEDGE_PERCENTILE = 0.95
+    HEDGE_MIN_SAMPLES = 20  # latencies observed before hedging starts
+    HEDGE_MAX_RATIO = float(os.getenv("HEDGE_MAX_RATIO", "0.1"))  # hedges per request
+    HEDGE_MAX_EXTRA_TOKENS = int(os.getenv("HEDGE_MAX_EXTRA_TOKENS", "50000"))
+    
+    # Per-question fan-out: a persona's questions asked concurrently, under the shared limiters
+    QUESTION_CONCURRENCY = int(os.getenv("QUESTION_CONCURRENCY", "1"))
+    INTERACTIVE_QUESTION_CONCURRENCY = 8  # single-persona tests in the web interface
+    
+    # Budget/deadline scheduler (survey --budget / --deadline)
+    SCHEDULER_MAX_CONCURRENCY = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "8"))  # personas in flight at most
+    SCHEDULER_STRATA = ["department", "location"]  # persona fields a stopped run stays balanced over
+    
+    # Multi-persona packing for closed questions
+    PACK_SIZE = 10
+    PACKING_MAX_PROMPT_TOKENS = 4000
+    
+    # Task queue for survey workers (python src/main.py worker)
+    QUEUE_LEASE_SECONDS = float(os.getenv("QUEUE_LEASE_SECONDS", "120"))  # visibility timeout, renewed by heartbeats
+    QUEUE_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", "3"))
+    QUEUE_POLL_SECONDS = 2  # idle workers check for new tasks this often
+    
     # Database Configuration
-    DATABASE_PATH = "data/personas.db"
+    DATABASE_PATH = os.getenv("DATABASE_PATH", "data/personas.db")  # point a node at its shard database
+    
+    # Sharded panels (python src/main.py shard / merge-shards)
+    SHARDS_DIR = os.getenv("SHARDS_DIR", "data/shards")
+    SHARD_VIRTUAL_NODES = 64  # points per shard on the hash ring
+    
+    # LLM call ledger: every API request recorded in the llm_calls table of the survey database
+    LLM_LEDGER_ENABLED = os.getenv("LLM_LEDGER_ENABLED", "true").lower() == "true"
+    # USD per million tokens; used for llm_calls.cost_usd and cost estimates
+    MODEL_PRICES = {
+        "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+        "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+        "gpt-4.1": {"input": 2.00, "cached_input": 0.50, "output": 8.00},
+        "gpt-4.1-mini": {"input": 0.40, "cached_input": 0.10, "output": 1.60},
+        "gpt-4.1-nano": {"input": 0.10, "cached_input": 0.025, "output": 0.40}
+    }
+    BATCH_PRICE_DISCOUNT = 0.5  # Batch API requests cost half the live price
+    
+    # Response Cache (policy: use, read-only, refresh, bypass)
+    RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "data/response_cache.db")
+    RESPONSE_CACHE_POLICY = os.getenv("RESPONSE_CACHE_POLICY", "use")
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "100000"))
+    RESPONSE_CACHE_MAX_AGE_DAYS = float(os.getenv("RESPONSE_CACHE_MAX_AGE_DAYS", "30"))
     
     # Output Configuration
     OUTPUT_DIR = "output"
     PERSONAS_DIR = "output/personas"
+    BATCH_DIR = "output/batches"
+    BATCH_POLL_INTERVAL = 60  # seconds
+    
+    # Local mock OpenAI server (python src/main.py mock-server)
+    MOCK_SERVER_PORT = int(os.getenv("MOCK_SERVER_PORT", "8765"))
     
     # Survey Configuration
     SURVEY_FILE = "survey.json"
@@ -28,7 +131,7 @@ class Settings:
     @classmethod
     def validate(cls):
         """Validate required settings"""
-        if not cls.OPENAI_API_KEY:
+        if not cls.OPENAI_API_KEY and not (cls.OPENAI_ENDPOINTS or cls.OPENAI_ENDPOINTS_FILE):
             raise ValueError("OPENAI_API_KEY environment variable is required")
         
         # Create directories if they don't exist
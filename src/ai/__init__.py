@@ -1,3 +1,5 @@
 from .gpt_client import GPTClient
+from .async_gpt_client import AsyncGPTClient
+from .circuit_breaker import CircuitOpenError
 
-__all__ = ['GPTClient']
\ No newline at end of file
+__all__ = ['GPTClient', 'AsyncGPTClient', 'CircuitOpenError']
\ No newline at end of file
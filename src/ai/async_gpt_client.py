@@ -0,0 +1,268 @@
+import asyncio
+import json
+import time
+import openai
+from typing import Dict, Any, Callable, List
+from config.settings import Settings
+from .gpt_client import GPTClient
+from .tokens import estimate_request_tokens
+from .concurrency import retry_after_from_error
+from .endpoints import Endpoint
+from .circuit_breaker import CircuitOpenError
+from .generation import current_question_type, generation_params
+from .prompts import PromptTemplates
+
+class AsyncGPTClient(GPTClient):
+    """Asyncio variant of GPTClient for running many persona surveys concurrently"""
+
+    def __init__(self, cache_policy: str = None, hedging: bool = None, coalesce: bool = None):
+        self._init_limits()
+        self.prompts = PromptTemplates(model=self.endpoints.primary.model)
+        self._init_cache(cache_policy)
+        self._init_hedging(hedging)
+        self._init_coalescing(coalesce)
+        self._init_ledger()
+        self._hedge_tasks = set()
+
+    @property
+    def client(self) -> openai.AsyncOpenAI:
+        """Primary endpoint's shared AsyncOpenAI client for the running event loop"""
+        return self.endpoints.primary.async_client()
+
+    async def _rate_limit(self, estimated_tokens: int = 0, endpoint: Endpoint = None):
+        """Wait for request and token budgets without blocking the event loop"""
+        endpoint = endpoint or self.endpoints.primary
+        await endpoint.request_limiter.acquire_async()
+        if estimated_tokens:
+            await endpoint.token_limiter.acquire_async(estimated_tokens)
+
+    async def _make_request_with_retry(self, messages: list, max_tokens: int = None, **params) -> str:
+        """Make API request with retry logic"""
+        response = await self._request_completion(messages, max_tokens, **params)
+        return self._message_text(response)
+
+    async def _cached_request(self, messages: list, max_tokens: int = None,
+                              extract: Callable[[Any], str] = None, **params) -> str:
+        """Serve a request from the response cache, calling the API on a miss"""
+        max_tokens = max_tokens or Settings.MAX_TOKENS
+        key = self._cache_key(messages, max_tokens, **params)
+
+        # The cache and the call ledger are SQLite; their I/O runs off the event loop
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            return cached
+
+        async def fetch() -> str:
+            completion = await self._request_completion(messages, max_tokens, **params)
+            response = (extract or self._message_text)(completion)
+            await asyncio.to_thread(self.cache.put, key, response, self._served_model(completion))
+            return response
+
+        if self.singleflight is None:
+            return await fetch()
+
+        # Identical prompts already in flight (same fingerprint) share that call
+        response, shared = await self.singleflight.do_async(key, fetch)
+        self._record_coalesced(shared)
+        return response
+
+    async def _request_completion(self, messages: list, max_tokens: int = None, **params):
+        """Make API request with retry logic, returning the raw completion"""
+        max_tokens = max_tokens or Settings.MAX_TOKENS
+        estimated_tokens = estimate_request_tokens(messages, max_tokens * params.get("n", 1))
+
+        start = time.time()
+        for attempt in range(Settings.MAX_RETRIES):
+            try:
+                if self.hedging:
+                    response = await self._hedged_attempt(messages, max_tokens, estimated_tokens, **params)
+                else:
+                    response = await self._attempt(messages, max_tokens, estimated_tokens, **params)
+                await asyncio.to_thread(self._log_call, start, attempt, response=response)
+                return response
+
+            except CircuitOpenError:
+                raise
+            except openai.RateLimitError as e:
+                if attempt < Settings.MAX_RETRIES - 1:
+                    wait_time = retry_after_from_error(e) or Settings.RETRY_DELAY * (2 ** attempt)
+                    print(f"Rate limit hit, waiting {wait_time:.1f} seconds...")
+                    await asyncio.sleep(wait_time)
+                else:
+                    await asyncio.to_thread(self._log_call, start, attempt, error=e)
+                    raise
+            except openai.APIError as e:
+                if attempt < Settings.MAX_RETRIES - 1:
+                    wait_time = Settings.RETRY_DELAY * (2 ** attempt)
+                    print(f"API error: {e}, retrying in {wait_time} seconds...")
+                    await asyncio.sleep(wait_time)
+                else:
+                    await asyncio.to_thread(self._log_call, start, attempt, error=e)
+                    raise
+            except Exception as e:
+                print(f"Unexpected error: {e}")
+                if attempt < Settings.MAX_RETRIES - 1:
+                    await asyncio.sleep(Settings.RETRY_DELAY)
+                else:
+                    await asyncio.to_thread(self._log_call, start, attempt, error=e)
+                    raise
+
+        raise Exception("Max retries exceeded")
+
+    async def _attempt(self, messages: list, max_tokens: int, estimated_tokens: int, **params):
+        """One call, failing over to another endpoint when the chosen one throttles"""
+        tried = []
+        while True:
+            endpoint = self.endpoints.choose(exclude=tried)
+            tried.append(endpoint.name)
+            try:
+                return await self._call_endpoint(endpoint, messages, max_tokens, estimated_tokens, **params)
+            except openai.RateLimitError:
+                if not self.endpoints.has_available(exclude=tried):
+                    raise
+                print(f"Endpoint {endpoint.name} throttled, failing over...")
+
+    async def _call_endpoint(self, endpoint: Endpoint, messages: list, max_tokens: int,
+                             estimated_tokens: int, **params):
+        """One rate-limited call to a single endpoint"""
+        endpoint.breaker.before_call()
+        endpoint.start()
+
+        try:
+            await self._rate_limit(estimated_tokens, endpoint)
+            await self.concurrency.acquire_async()
+
+            try:
+                response = await endpoint.async_client().chat.completions.create(
+                    model=endpoint.model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=Settings.TEMPERATURE,
+                    **params
+                )
+            except Exception as e:
+                self._record_failure(e, estimated_tokens, endpoint)
+                raise
+            finally:
+                self.concurrency.release()
+        finally:
+            endpoint.finish()
+
+        self.concurrency.on_success()
+        endpoint.breaker.record_success()
+        self._record_usage(response, estimated_tokens, endpoint)
+        self._record_generation(response, max_tokens)
+        return response
+
+    def _spawn(self, coroutine) -> asyncio.Task:
+        """Start a task and keep it referenced until done (losing hedges outlive their caller)"""
+        task = asyncio.ensure_future(coroutine)
+        self._hedge_tasks.add(task)
+        task.add_done_callback(self._hedge_tasks.discard)
+        return task
+
+    async def _hedged_attempt(self, messages: list, max_tokens: int, estimated_tokens: int, **params):
+        """One call, duplicated if it outlives the learned latency deadline; first success wins"""
+        policy = self.hedging
+        policy.start_request()
+        deadline = policy.deadline(max_tokens)
+
+        async def timed_attempt():
+            response = await self._attempt(messages, max_tokens, estimated_tokens, **params)
+            return response, time.time()
+
+        start = time.time()
+        primary = self._spawn(timed_attempt())
+        primary.add_done_callback(
+            lambda t: not t.cancelled() and t.exception() is None
+            and policy.record_latency(max_tokens, t.result()[1] - start)
+        )
+
+        if deadline is None:
+            return (await primary)[0]
+        done, _ = await asyncio.wait({primary}, timeout=deadline)
+        if done or not policy.try_hedge(estimated_tokens):
+            return (await primary)[0]
+
+        # The duplicate goes through _attempt, so it draws on the shared rate budget
+        hedge = self._spawn(timed_attempt())
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = error or task.exception()
+                    continue
+                response, finished = task.result()
+                if task is hedge:
+                    policy.record_win()
+                    primary.add_done_callback(
+                        lambda t: not t.cancelled() and t.exception() is None
+                        and policy.record_saved(t.result()[1] - finished)
+                    )
+                return response
+
+        raise error
+
+    async def get_persona_response(self, persona_context: str, question: Dict[str, Any]) -> str:
+        """Get persona response to a survey question"""
+        messages = self.build_persona_messages(persona_context, question)
+
+        token = current_question_type.set(question["type"])
+        try:
+            response = await self._cached_request(messages, **generation_params(question))
+        finally:
+            current_question_type.reset(token)
+
+        return self._validate_response(response, question)
+
+    async def get_persona_responses(self, persona_context: str, question: Dict[str, Any], n: int) -> List[str]:
+        """Get n independently sampled, validated answers from one request (the API's n parameter)"""
+        messages = self.build_persona_messages(persona_context, question)
+
+        token = current_question_type.set(question["type"])
+        try:
+            content = await self._cached_request(messages, extract=self._extract_choices, n=n,
+                                                 **generation_params(question))
+        finally:
+            current_question_type.reset(token)
+
+        return [self._validate_response(answer, question) for answer in json.loads(content)]
+
+    async def get_scale_distribution(self, persona_context: str, question: Dict[str, Any]) -> Dict[str, Any]:
+        """Answer a scale question with the probability of every option, from one token's logprobs"""
+        messages = self.build_persona_messages(persona_context, question)
+
+        token = current_question_type.set(question["type"])
+        try:
+            content = await self._cached_request(messages, 1, extract=self._extract_top_logprobs,
+                                                 logprobs=True, top_logprobs=Settings.SCALE_TOP_LOGPROBS)
+        finally:
+            current_question_type.reset(token)
+
+        return self._scale_distribution(json.loads(content), question)
+
+    async def get_persona_survey_page(self, persona_context: str, questions: List[Dict[str, Any]]) -> Dict[int, str]:
+        """Answer several questions in one JSON-mode request, keyed by question number"""
+        messages = self.build_survey_page_messages(persona_context, questions)
+
+        content = await self._cached_request(
+            messages,
+            self._page_max_tokens(questions),
+            response_format={"type": "json_object"}
+        )
+
+        return self._parse_survey_page(content, questions)
+
+    async def test_connection(self) -> bool:
+        """Test OpenAI API connection"""
+        try:
+            messages = [
+                {"role": "user", "content": "Hello, this is a test. Please respond with 'OK'."}
+            ]
+            response = await self._make_request_with_retry(messages, max_tokens=10)
+            return "ok" in response.lower()
+        except Exception as e:
+            print(f"API connection test failed: {e}")
+            return False
@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Dict
+import openai
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint the breaker considers down"""
+
+    def __init__(self, retry_in: float):
+        super().__init__(f"LLM endpoint circuit is open; next probe in {retry_in:.1f}s")
+        self.retry_in = retry_in
+
+
+def is_endpoint_failure(error: Exception) -> bool:
+    """Errors that say the endpoint is degraded (not throttling or a bad request)"""
+    if isinstance(error, (openai.APIConnectionError, openai.InternalServerError)):
+        return True
+    status = getattr(error, "status_code", None)
+    return isinstance(status, int) and status >= 500
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker over a window of recent calls.
+
+    Opens when the failure rate over the last `window` calls reaches
+    `failure_threshold` (after at least `min_calls`). While open, calls fail
+    fast with CircuitOpenError. After `open_seconds` one probe is let through:
+    success closes the breaker, failure re-opens it for twice as long (capped).
+    """
+
+    def __init__(self, failure_threshold: float = 0.5, window: int = 20, min_calls: int = 5,
+                 open_seconds: float = 30, max_open_seconds: float = 300):
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.current_open_seconds = open_seconds
+        self.times_opened = 0
+        self.fast_failures = 0
+        self._results = deque(maxlen=window)
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def _probe_is_stale(self) -> bool:
+        # A probe that never reported back (e.g. a cancelled task) doesn't block forever
+        return time.time() - self._probe_started > self.current_open_seconds
+
+    def allows_call(self) -> bool:
+        """Whether before_call() would admit a call now (without claiming the probe)"""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open":
+                return time.time() >= self.opened_at + self.current_open_seconds
+            return not self._probe_in_flight or self._probe_is_stale()
+
+    def before_call(self):
+        """Admit a call, or raise CircuitOpenError"""
+        with self._lock:
+            if self.state == "closed":
+                return
+
+            remaining = self.opened_at + self.current_open_seconds - time.time()
+            if self.state == "open" and remaining <= 0:
+                self.state = "half-open"
+
+            if self.state == "half-open" and (not self._probe_in_flight or self._probe_is_stale()):
+                self._probe_in_flight = True
+                self._probe_started = time.time()
+                return
+
+            self.fast_failures += 1
+            raise CircuitOpenError(max(remaining, 1.0))
+
+    def record_success(self):
+        with self._lock:
+            if self.state == "half-open":
+                print("LLM endpoint recovered; circuit closed")
+                self.state = "closed"
+                self.current_open_seconds = self.open_seconds
+                self._results.clear()
+            self._probe_in_flight = False
+            self._results.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            self._probe_in_flight = False
+            if self.state == "half-open":
+                self.current_open_seconds = min(self.max_open_seconds, self.current_open_seconds * 2)
+                self._open()
+                return
+
+            self._results.append(False)
+            failures = self._results.count(False)
+            if (self.state == "closed" and len(self._results) >= self.min_calls
+                    and failures / len(self._results) >= self.failure_threshold):
+                self._open()
+
+    def _open(self):
+        self.state = "open"
+        self.opened_at = time.time()
+        self.times_opened += 1
+        print(f"LLM endpoint failing; circuit open for {self.current_open_seconds:.0f}s")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "times_opened": self.times_opened,
+                "fast_failures": self.fast_failures,
+                "recent_failure_rate": round(self._results.count(False) / len(self._results) * 100, 1)
+                if self._results else 0
+            }
+
+
+_shared_breakers: Dict[str, CircuitBreaker] = {}
+_shared_lock = threading.Lock()
+
+def get_shared_breaker(name: str, **options) -> CircuitBreaker:
+    """Get the process-wide breaker for an endpoint, creating it on first use"""
+    with _shared_lock:
+        if name not in _shared_breakers:
+            _shared_breakers[name] = CircuitBreaker(**options)
+        return _shared_breakers[name]
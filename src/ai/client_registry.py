@@ -0,0 +1,143 @@
+import asyncio
+import importlib.util
+import threading
+import time
+import weakref
+from typing import Any, Dict, Optional, Tuple
+import httpx
+import openai
+from config.settings import Settings
+
+class PoolStats:
+    """Connection pool counters fed by httpx request hooks and httpcore trace events"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self.connect_seconds = 0.0
+        self.tls_seconds = 0.0
+        self._started: Dict[Tuple[int, str], float] = {}
+
+    def on_request(self, request):
+        with self._lock:
+            self.requests += 1
+
+    def on_trace(self, event_name: str, owner: int):
+        """Time TCP connects and TLS handshakes; requests on pooled connections skip both"""
+        step, _, phase = event_name.rpartition(".")
+        if step not in ("connection.connect_tcp", "connection.start_tls"):
+            return
+
+        key = (owner, step)
+        with self._lock:
+            if phase == "started":
+                self._started[key] = time.perf_counter()
+            elif phase == "complete":
+                elapsed = time.perf_counter() - self._started.pop(key, time.perf_counter())
+                if step == "connection.connect_tcp":
+                    self.new_connections += 1
+                    self.connect_seconds += elapsed
+                else:
+                    self.tls_handshakes += 1
+                    self.tls_seconds += elapsed
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            reused = max(0, self.requests - self.new_connections)
+            return {
+                "requests": self.requests,
+                "max_connections": Settings.HTTP_MAX_CONNECTIONS,
+                "http2": http2_available(),
+                "new_connections": self.new_connections,
+                "connection_reuse_rate": round(reused / self.requests * 100, 1) if self.requests else 0,
+                "tls_handshakes": self.tls_handshakes,
+                "connect_seconds": round(self.connect_seconds, 3),
+                "tls_seconds": round(self.tls_seconds, 3)
+            }
+
+
+_pool_stats = PoolStats()
+_sync_clients: Dict[Tuple[str, str], openai.OpenAI] = {}
+# Async connections belong to the event loop that opened them, so each loop gets its own clients
+_async_clients = weakref.WeakKeyDictionary()
+_registry_lock = threading.Lock()
+_http2_warned = False
+
+def http2_available() -> bool:
+    """HTTP/2 when HTTP2_ENABLED asks for it and the optional h2 package is installed"""
+    global _http2_warned
+    if not Settings.HTTP2_ENABLED:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        if not _http2_warned:
+            _http2_warned = True
+            print("⚠️  HTTP2_ENABLED is set but the h2 package is missing (pip install 'httpx[http2]'); using HTTP/1.1")
+        return False
+    return True
+
+def _pool_options() -> Dict[str, Any]:
+    return {
+        "http2": http2_available(),
+        "limits": httpx.Limits(
+            max_connections=Settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=Settings.HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=Settings.HTTP_KEEPALIVE_SECONDS
+        ),
+        "timeout": httpx.Timeout(
+            Settings.HTTP_READ_TIMEOUT,
+            connect=Settings.HTTP_CONNECT_TIMEOUT
+        ),
+        "follow_redirects": True
+    }
+
+def _build_sync_http_client() -> httpx.Client:
+    def trace(event_name, info):
+        _pool_stats.on_trace(event_name, threading.get_ident())
+
+    def add_trace(request):
+        request.extensions["trace"] = trace
+        _pool_stats.on_request(request)
+
+    return httpx.Client(event_hooks={"request": [add_trace]}, **_pool_options())
+
+def _build_async_http_client() -> httpx.AsyncClient:
+    async def trace(event_name, info):
+        _pool_stats.on_trace(event_name, id(asyncio.current_task()))
+
+    async def add_trace(request):
+        request.extensions["trace"] = trace
+        _pool_stats.on_request(request)
+
+    return httpx.AsyncClient(event_hooks={"request": [add_trace]}, **_pool_options())
+
+def get_openai_client(api_key: str = None, base_url: Optional[str] = None) -> openai.OpenAI:
+    """Process-wide OpenAI client for this key and endpoint, sharing one connection pool"""
+    api_key = api_key or Settings.OPENAI_API_KEY
+    base_url = base_url or Settings.OPENAI_BASE_URL
+    key = (api_key, base_url or "")
+
+    with _registry_lock:
+        if key not in _sync_clients:
+            _sync_clients[key] = openai.OpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                                               http_client=_build_sync_http_client())
+        return _sync_clients[key]
+
+def get_async_openai_client(api_key: str = None, base_url: Optional[str] = None) -> openai.AsyncOpenAI:
+    """AsyncOpenAI client shared by every task on the running event loop"""
+    api_key = api_key or Settings.OPENAI_API_KEY
+    base_url = base_url or Settings.OPENAI_BASE_URL
+    key = (api_key, base_url or "")
+    loop = asyncio.get_running_loop()
+
+    with _registry_lock:
+        clients = _async_clients.setdefault(loop, {})
+        if key not in clients:
+            clients[key] = openai.AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                                              http_client=_build_async_http_client())
+        return clients[key]
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Request, connection reuse and handshake counters for all shared clients"""
+    return _pool_stats.get_stats()
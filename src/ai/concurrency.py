@@ -0,0 +1,147 @@
+import asyncio
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+def _parse_duration(value: str) -> Optional[float]:
+    """Parse x-ratelimit-reset style durations such as '20ms', '1s' or '6m0s'"""
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(amount) * scale[unit] for amount, unit in parts)
+
+def retry_after_from_error(error: Exception) -> Optional[float]:
+    """Extract the server's requested back-off (seconds) from a throttling error"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    resets = [
+        _parse_duration(headers.get(name, ""))
+        for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")
+    ]
+    resets = [reset for reset in resets if reset is not None]
+    return max(resets) if resets else None
+
+class AIMDController:
+    """Concurrency window shared by all in-flight requests.
+
+    The window grows by about one slot per window's worth of successes
+    (additive increase) and halves on throttling (multiplicative decrease), at
+    most once per `decrease_cooldown` so a burst of 429s from the same window
+    counts as one congestion event. A Retry-After pauses every caller.
+    """
+
+    def __init__(self, initial: float = 4, minimum: float = 1, maximum: float = 64,
+                 increase: float = 1.0, decrease: float = 0.5, decrease_cooldown: float = 1.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.decrease_cooldown = decrease_cooldown
+        self.window = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.throttle_events = 0
+        self.successes = 0
+        self.peak_window = self.window
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def _admit(self) -> Optional[float]:
+        """Take a slot if one is free; otherwise return how long to wait before retrying"""
+        now = time.time()
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.in_flight < int(self.window):
+            self.in_flight += 1
+            return None
+        return 0.05
+
+    def acquire(self):
+        """Block until the window has a free slot"""
+        with self._cond:
+            while True:
+                wait = self._admit()
+                if wait is None:
+                    return
+                self._cond.wait(timeout=wait)
+
+    async def acquire_async(self):
+        """Asyncio variant of acquire()"""
+        while True:
+            with self._cond:
+                wait = self._admit()
+            if wait is None:
+                return
+            await asyncio.sleep(wait)
+
+    def release(self):
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            self._cond.notify()
+
+    def on_success(self):
+        """Additive increase"""
+        with self._cond:
+            self.successes += 1
+            self.window = min(self.maximum, self.window + self.increase / self.window)
+            self.peak_window = max(self.peak_window, self.window)
+            self._cond.notify_all()
+
+    def on_throttle(self, retry_after: Optional[float] = None):
+        """Multiplicative decrease, plus a global pause when the server asks for one"""
+        with self._cond:
+            now = time.time()
+            self.throttle_events += 1
+            if now - self._last_decrease >= self.decrease_cooldown:
+                self.window = max(self.minimum, self.window * self.decrease)
+                self._last_decrease = now
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Current window and throttling counters"""
+        with self._cond:
+            return {
+                "window": round(self.window, 2),
+                "peak_window": round(self.peak_window, 2),
+                "in_flight": self.in_flight,
+                "throttle_events": self.throttle_events,
+                "successes": self.successes,
+                "paused_seconds_remaining": round(max(0.0, self.paused_until - time.time()), 2)
+            }
+
+
+_shared_controller: Optional[AIMDController] = None
+_shared_lock = threading.Lock()
+
+def get_shared_controller(initial: float, minimum: float, maximum: float) -> AIMDController:
+    """Get the process-wide concurrency controller, creating it on first use"""
+    global _shared_controller
+
+    with _shared_lock:
+        if _shared_controller is None:
+            _shared_controller = AIMDController(initial=initial, minimum=minimum, maximum=maximum)
+        return _shared_controller
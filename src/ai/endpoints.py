@@ -0,0 +1,210 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+import openai
+from config.settings import Settings
+from .rate_limiter import get_shared_bucket
+from .circuit_breaker import CircuitBreaker, get_shared_breaker
+from .client_registry import get_openai_client, get_async_openai_client
+
+def _state_file(path: str, suffix: str) -> Optional[str]:
+    """Per-endpoint limiter state file next to the configured one"""
+    if not path:
+        return None
+    if not suffix:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}{suffix}{ext}"
+
+
+class Endpoint:
+    """One OpenAI-compatible deployment: key, base URL, model and its own limits"""
+
+    # How long to route around an endpoint that throttled without a Retry-After
+    DEFAULT_THROTTLE_SECONDS = 1.0
+
+    def __init__(self, name: str, api_key: str, base_url: Optional[str] = None, model: str = None,
+                 requests_per_second: float = None, burst: int = None, tokens_per_minute: int = None,
+                 weight: float = 1.0):
+        self.name = name
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model or Settings.OPENAI_MODEL
+        self.weight = max(float(weight), 0.01)
+
+        # The default endpoint keeps the original limiter names and state files
+        suffix = "" if name == "default" else f"_{name}"
+        self.request_limiter = get_shared_bucket(
+            f"requests{suffix}",
+            rate=requests_per_second or Settings.REQUESTS_PER_SECOND,
+            capacity=burst or Settings.RATE_LIMIT_BURST,
+            state_file=_state_file(Settings.RATE_LIMIT_STATE_FILE, suffix)
+        )
+        tokens_per_minute = tokens_per_minute or Settings.TOKENS_PER_MINUTE
+        self.token_limiter = get_shared_bucket(
+            f"tokens{suffix}",
+            rate=tokens_per_minute / 60.0,
+            capacity=tokens_per_minute,
+            state_file=_state_file(Settings.TOKEN_LIMIT_STATE_FILE, suffix)
+        )
+        self.breaker: CircuitBreaker = get_shared_breaker(
+            f"{name}:{base_url or 'api.openai.com'}",
+            failure_threshold=Settings.CIRCUIT_FAILURE_THRESHOLD,
+            window=Settings.CIRCUIT_WINDOW,
+            min_calls=Settings.CIRCUIT_MIN_CALLS,
+            open_seconds=Settings.CIRCUIT_OPEN_SECONDS
+        )
+
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.throttled_until = 0.0
+        self.stats = {"requests": 0, "successes": 0, "throttles": 0, "failures": 0,
+                      "prompt_tokens": 0, "completion_tokens": 0}
+
+    def client(self) -> openai.OpenAI:
+        return get_openai_client(self.api_key, self.base_url)
+
+    def async_client(self) -> openai.AsyncOpenAI:
+        return get_async_openai_client(self.api_key, self.base_url)
+
+    def is_available(self) -> bool:
+        """Not cooling off after a 429 and not behind an open circuit"""
+        return time.time() >= self.throttled_until and self.breaker.allows_call()
+
+    def load(self) -> tuple:
+        """Routing key: endpoints whose request budget is spent sort last, then weighted
+        least-connections, with ties broken by weighted round-robin"""
+        saturated = self.request_limiter.available() < 1
+        with self._lock:
+            return saturated, self.in_flight / self.weight, self.stats["requests"] / self.weight
+
+    def start(self):
+        with self._lock:
+            self.in_flight += 1
+            self.stats["requests"] += 1
+
+    def finish(self):
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+
+    def on_success(self, prompt_tokens: int, completion_tokens: int):
+        with self._lock:
+            self.stats["successes"] += 1
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["completion_tokens"] += completion_tokens
+
+    def on_throttle(self, retry_after: Optional[float]):
+        with self._lock:
+            self.stats["throttles"] += 1
+            self.throttled_until = max(self.throttled_until,
+                                       time.time() + (retry_after or self.DEFAULT_THROTTLE_SECONDS))
+
+    def on_failure(self):
+        with self._lock:
+            self.stats["failures"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = self.in_flight
+        stats.update({
+            "model": self.model,
+            "base_url": self.base_url or "https://api.openai.com/v1",
+            "weight": self.weight,
+            "circuit": self.breaker.state
+        })
+        return stats
+
+
+class EndpointPool:
+    """Routes each request to the least-loaded available endpoint (weighted least-connections)"""
+
+    def __init__(self, endpoints: List[Endpoint]):
+        if not endpoints:
+            raise ValueError("At least one endpoint is required")
+        self.endpoints = endpoints
+
+    @property
+    def primary(self) -> Endpoint:
+        """First configured endpoint; used for the Batch API and connection tests"""
+        return self.endpoints[0]
+
+    @property
+    def models(self) -> List[str]:
+        """Every model a request may be routed to"""
+        return sorted({e.model for e in self.endpoints})
+
+    def choose(self, exclude: List[str] = ()) -> Endpoint:
+        """Least-loaded available endpoint; if none is available, the one that recovers first"""
+        candidates = [e for e in self.endpoints if e.name not in exclude] or self.endpoints
+        available = [e for e in candidates if e.is_available()]
+        if available:
+            return min(available, key=lambda e: e.load())
+        return min(candidates, key=lambda e: e.throttled_until)
+
+    def has_available(self, exclude: List[str] = ()) -> bool:
+        return any(e.is_available() for e in self.endpoints if e.name not in exclude)
+
+    def all_closed(self) -> bool:
+        """True when no endpoint's circuit breaker is tripped"""
+        return all(e.breaker.state == "closed" for e in self.endpoints)
+
+    def get_circuit_stats(self) -> Dict[str, Any]:
+        """Breaker counters summed over endpoints; state is 'closed' only if every breaker is"""
+        per_endpoint = [e.breaker.get_stats() for e in self.endpoints]
+        states = [stats["state"] for stats in per_endpoint]
+        return {
+            "state": "closed" if self.all_closed() else ("open" if "open" in states else "half-open"),
+            "times_opened": sum(stats["times_opened"] for stats in per_endpoint),
+            "fast_failures": sum(stats["fast_failures"] for stats in per_endpoint),
+            "recent_failure_rate": max(stats["recent_failure_rate"] for stats in per_endpoint)
+        }
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-endpoint counters, plus each endpoint's share of requests"""
+        stats = {e.name: e.get_stats() for e in self.endpoints}
+        total = sum(s["requests"] for s in stats.values())
+        for s in stats.values():
+            s["share"] = round(s["requests"] / total * 100, 1) if total else 0
+        return stats
+
+
+def load_endpoint_configs() -> List[Dict[str, Any]]:
+    """Endpoint definitions from Settings.OPENAI_ENDPOINTS, the endpoints file, or the single-key settings"""
+    configs = Settings.OPENAI_ENDPOINTS
+    if not configs and Settings.OPENAI_ENDPOINTS_FILE:
+        with open(Settings.OPENAI_ENDPOINTS_FILE, "r", encoding="utf-8") as f:
+            configs = json.load(f)
+    if not configs:
+        configs = [{"name": "default"}]
+
+    resolved = []
+    for i, config in enumerate(configs):
+        config = dict(config)
+        # Keys can stay out of the file: "api_key_env": "OPENAI_API_KEY_EAST"
+        if "api_key_env" in config:
+            config["api_key"] = os.getenv(config.pop("api_key_env"))
+        config.setdefault("name", f"endpoint{i + 1}")
+        config.setdefault("api_key", Settings.OPENAI_API_KEY)
+        config.setdefault("base_url", Settings.OPENAI_BASE_URL)
+        resolved.append(config)
+    return resolved
+
+
+_pools: Dict[str, EndpointPool] = {}
+_pools_lock = threading.Lock()
+
+def get_endpoint_pool() -> EndpointPool:
+    """Process-wide endpoint pool for the current configuration"""
+    configs = load_endpoint_configs()
+    # Endpoints take their defaults from Settings, so changed limits give a fresh pool
+    defaults = [Settings.OPENAI_MODEL, Settings.REQUESTS_PER_SECOND, Settings.RATE_LIMIT_BURST,
+                Settings.TOKENS_PER_MINUTE, Settings.RATE_LIMIT_STATE_FILE, Settings.TOKEN_LIMIT_STATE_FILE]
+    key = json.dumps([configs, defaults], sort_keys=True, default=str)
+
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = EndpointPool([Endpoint(**config) for config in configs])
+        return _pools[key]
@@ -0,0 +1,113 @@
+import contextvars
+import threading
+from typing import Any, Dict, List, Optional
+from config.settings import Settings
+from .tokens import estimate_text_tokens
+
+# Question type of the single-question request being made (unset for pages and packed requests)
+current_question_type = contextvars.ContextVar("current_question_type", default=None)
+
+# Completion allowance and stop sequences per question type. Closed questions get
+# room for their longest valid answer plus a small margin; "max_tokens" of None
+# means "size from the options".
+GENERATION_PROFILES = {
+    "scale": {"max_tokens": 2, "stop": ["\n"]},
+    "multiple choice": {"max_tokens": None, "stop": ["\n"]},
+    "checkbox": {"max_tokens": None, "stop": ["\n"]},
+    "open-ended": {"max_tokens": 200, "stop": None}
+}
+OPTION_TOKEN_MARGIN = 5
+
+# Single digits are tokens 15-24 ("0"-"9") in both cl100k_base and o200k_base
+DIGIT_TOKEN_OFFSET = 15
+
+def _digit_token_ids(options: List[str]) -> Optional[List[int]]:
+    """Token IDs of single-digit scale options, or None if the options aren't all digits"""
+    if not options or not all(len(option) == 1 and option.isdigit() for option in options):
+        return None
+    try:
+        import tiktoken
+        encoding = tiktoken.encoding_for_model(Settings.OPENAI_MODEL)
+        return [encoding.encode(option)[0] for option in options]
+    except Exception:
+        return [DIGIT_TOKEN_OFFSET + int(option) for option in options]
+
+def _options_max_tokens(question: Dict[str, Any]) -> int:
+    options = question.get("options", [])
+    if question["type"] == "checkbox":
+        longest = estimate_text_tokens(", ".join(options))
+    else:
+        longest = max((estimate_text_tokens(option) for option in options), default=0)
+    return longest + OPTION_TOKEN_MARGIN
+
+def generation_params(question: Dict[str, Any]) -> Dict[str, Any]:
+    """max_tokens, stop and logit_bias for one question.
+
+    Defaults come from GENERATION_PROFILES and Settings.SCALE_LOGIT_BIAS; a
+    question's "generation" entry in survey.json overrides any of them. Its
+    "logit_bias" may be a number (bias for the scale's digit options) or a
+    ready-made {token_id: bias} map.
+    """
+    profile = dict(GENERATION_PROFILES.get(question["type"], {}))
+    if question["type"] == "scale":
+        profile["logit_bias"] = Settings.SCALE_LOGIT_BIAS
+    profile.update(question.get("generation") or {})
+
+    max_tokens = profile.get("max_tokens")
+    if max_tokens is None:
+        max_tokens = _options_max_tokens(question) if question.get("options") else Settings.MAX_TOKENS
+    params = {"max_tokens": max_tokens}
+    if profile.get("stop"):
+        params["stop"] = profile["stop"]
+
+    bias = profile.get("logit_bias")
+    if isinstance(bias, dict):
+        params["logit_bias"] = {str(token): value for token, value in bias.items()}
+    elif bias:
+        token_ids = _digit_token_ids(question.get("options", []))
+        if token_ids:
+            params["logit_bias"] = {str(token): bias for token in token_ids}
+
+    return params
+
+
+class GenerationStats:
+    """Per-question-type completion counters, against the flat MAX_TOKENS allowance"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._types: Dict[str, Dict[str, int]] = {}
+
+    def record(self, question_type: str, max_tokens: int, completion_tokens: int, truncated: int,
+               answers: int = 1):
+        """One request; with n > 1 it returns several answers, each allowed max_tokens"""
+        with self._lock:
+            counters = self._types.setdefault(question_type, {
+                "requests": 0, "answers": 0, "max_tokens": 0, "completion_tokens": 0, "truncated": 0
+            })
+            counters["requests"] += 1
+            counters["answers"] += answers
+            counters["max_tokens"] += max_tokens * answers
+            counters["completion_tokens"] += completion_tokens
+            counters["truncated"] += int(truncated)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            types = {name: dict(counters) for name, counters in self._types.items()}
+
+        for counters in types.values():
+            flat = counters["answers"] * Settings.MAX_TOKENS
+            counters["avg_completion_tokens"] = round(counters["completion_tokens"] / counters["answers"], 1)
+            counters["reserved_tokens_saved"] = flat - counters["max_tokens"]
+
+        answers = sum(c["answers"] for c in types.values())
+        saved = sum(c["reserved_tokens_saved"] for c in types.values())
+        return {
+            "by_type": types,
+            "requests": sum(c["requests"] for c in types.values()),
+            "answers": answers,
+            "completion_tokens": sum(c["completion_tokens"] for c in types.values()),
+            "truncated": sum(c["truncated"] for c in types.values()),
+            "reserved_tokens_saved": saved,
+            "reserved_saving_rate": round(saved / (answers * Settings.MAX_TOKENS) * 100, 1) if answers else 0
+        }
@@ -1,51 +1,319 @@
 import openai
 import time
 import json
-from typing import Dict, Any, Optional
+import math
+import re
+import threading
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Any, Callable, List, Optional
 from config.settings import Settings
+from .tokens import estimate_request_tokens
+from .concurrency import get_shared_controller, retry_after_from_error
+from .response_cache import ResponseCache
+from .hedging import HedgePolicy
+from .client_registry import get_pool_stats
+from .endpoints import Endpoint, get_endpoint_pool
+from .singleflight import get_shared_singleflight
+from .circuit_breaker import CircuitOpenError, is_endpoint_failure
+from .generation import GenerationStats, current_question_type, generation_params
+from .prompts import PromptTemplates
+from .ledger import CallLedger, compute_cost
 
 class GPTClient:
     """OpenAI GPT-4o client for persona responses"""
     
-    def __init__(self):
-        self.client = openai.OpenAI(api_key=Settings.OPENAI_API_KEY)
-        self.last_request_time = 0
+    # Completion allowance per question when several are answered in one request
+    PAGE_TOKENS_PER_QUESTION = {"open-ended": 200}
+    PAGE_TOKENS_DEFAULT = 30
+    
+    # Threads for hedged requests; losing duplicates run to completion in the background
+    HEDGE_WORKERS = 32
+    
+    def __init__(self, cache_policy: str = None, hedging: bool = None, coalesce: bool = None):
+        self._init_limits()
+        self.client = self.endpoints.primary.client()
+        self.prompts = PromptTemplates(model=self.endpoints.primary.model)
+        self._init_cache(cache_policy)
+        self._init_hedging(hedging)
+        self._init_coalescing(coalesce)
+        self._init_ledger()
+    
+    def _init_ledger(self, db_path: str = None):
+        """Record every API request in the llm_calls table (the personas database by default)"""
+        # Opened on first use, so a client handed another database by use_ledger() never touches this one
+        self._ledger_path = db_path or Settings.DATABASE_PATH
+        self._ledger = None
+        self._ledger_lock = threading.Lock()
+    
+    @property
+    def ledger(self) -> Optional[CallLedger]:
+        if not Settings.LLM_LEDGER_ENABLED:
+            return None
+        with self._ledger_lock:
+            if self._ledger is None:
+                self._ledger = CallLedger(self._ledger_path)
+            return self._ledger
+    
+    def use_ledger(self, db_path: str):
+        """Write the call ledger to another database (the survey engine's)"""
+        if self._ledger_path != db_path:
+            self._init_ledger(db_path)
+    
+    def _log_call(self, start: float, retries: int, response=None, error: Exception = None):
+        ledger = self.ledger
+        if ledger is None:
+            return
+        if response is not None:
+            model = self._served_model(response)
+        else:
+            model = getattr(error, "endpoint_model", None) or self.endpoints.primary.model
+        ledger.record(model, time.time() - start, retries, response, error)
+    
+    def _init_coalescing(self, coalesce: bool = None):
+        """Share one upstream call between concurrent identical requests (singleflight)"""
+        enabled = Settings.COALESCE_REQUESTS if coalesce is None else coalesce
+        # Independent samples at temperature > 0 must each get their own call
+        if Settings.INDEPENDENT_SAMPLES and Settings.TEMPERATURE > 0:
+            enabled = False
+        self.singleflight = get_shared_singleflight() if enabled else None
+        self.coalesced_requests = 0
+    
+    def _record_coalesced(self, shared: bool):
+        if shared:
+            with self._usage_lock:
+                self.coalesced_requests += 1
+    
+    def get_coalescing_stats(self) -> Dict[str, Any]:
+        """Get how many duplicate in-flight requests this client avoided"""
+        with self._usage_lock:
+            return {
+                "enabled": self.singleflight is not None,
+                "duplicates_suppressed": self.coalesced_requests
+            }
+    
+    def _init_hedging(self, hedging: bool = None):
+        """Set up request hedging when enabled (explicitly or in Settings)"""
+        enabled = Settings.HEDGING_ENABLED if hedging is None else hedging
+        self.hedging = HedgePolicy(
+            percentile=Settings.HEDGE_PERCENTILE,
+            min_samples=Settings.HEDGE_MIN_SAMPLES,
+            max_ratio=Settings.HEDGE_MAX_RATIO,
+            max_extra_tokens=Settings.HEDGE_MAX_EXTRA_TOKENS
+        ) if enabled else None
+        self._hedge_executor = None
+    
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """Get connection reuse and handshake counters for the shared HTTP pool"""
+        return get_pool_stats()
+    
+    def get_hedging_stats(self) -> Optional[Dict[str, Any]]:
+        """Get hedge counters, or None when hedging is off"""
+        return self.hedging.get_stats() if self.hedging else None
+    
+    def _init_cache(self, cache_policy: str = None):
+        """Open the on-disk response cache with the given (or configured) policy"""
+        self.cache = ResponseCache(
+            Settings.RESPONSE_CACHE_PATH,
+            policy=cache_policy or Settings.RESPONSE_CACHE_POLICY,
+            max_entries=Settings.RESPONSE_CACHE_MAX_ENTRIES,
+            max_age_days=Settings.RESPONSE_CACHE_MAX_AGE_DAYS
+        )
+    
+    def _cache_key(self, messages: list, max_tokens: int, **params) -> str:
+        # The endpoint is chosen after the cache lookup, so the key covers every model the pool may route to
+        return ResponseCache.fingerprint(messages, ",".join(self.endpoints.models), Settings.TEMPERATURE,
+                                         max_tokens, **params)
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Get response cache hit/miss counters"""
+        return self.cache.get_stats()
+    
+    def _init_limits(self):
+        """Attach the shared endpoint pool, concurrency window and usage counters"""
+        # Each endpoint has its own request/token limiters and circuit breaker
+        self.endpoints = get_endpoint_pool()
+        self.concurrency = get_shared_controller(
+            initial=Settings.AIMD_INITIAL_WINDOW,
+            minimum=Settings.AIMD_MIN_WINDOW,
+            maximum=Settings.AIMD_MAX_WINDOW
+        )
         self.request_count = 0
+        self.generation = GenerationStats()
+        self.usage = {
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cached_tokens": 0,
+            "estimated_tokens": 0,
+            "cost_usd": 0.0
+        }
+        self._usage_lock = threading.Lock()
     
-    def _rate_limit(self):
-        """Implement rate limiting"""
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
+    def _rate_limit(self, estimated_tokens: int = 0, endpoint: Endpoint = None):
+        """Wait until both the request and tokens-per-minute budgets admit the call"""
+        endpoint = endpoint or self.endpoints.primary
+        endpoint.request_limiter.acquire()
+        if estimated_tokens:
+            endpoint.token_limiter.acquire(estimated_tokens)
+    
+    def _record_usage(self, response, estimated_tokens: int, endpoint: Endpoint = None):
+        """Reconcile the TPM reservation with the usage the API reported"""
+        endpoint = endpoint or self.endpoints.primary
+        usage = getattr(response, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        # Prompt tokens the provider served from its prefix cache (billed at a discount)
+        cached_tokens = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", 0) or 0
         
-        if time_since_last < (1.0 / Settings.REQUESTS_PER_SECOND):
-            sleep_time = (1.0 / Settings.REQUESTS_PER_SECOND) - time_since_last
-            time.sleep(sleep_time)
+        if usage is not None:
+            endpoint.token_limiter.adjust(estimated_tokens - (prompt_tokens + completion_tokens))
+        endpoint.on_success(prompt_tokens, completion_tokens)
+        # Priced per call, since a pool's endpoints can serve different models
+        cost = (compute_cost(self._served_model(response), prompt_tokens, completion_tokens, cached_tokens)
+                or compute_cost(endpoint.model, prompt_tokens, completion_tokens, cached_tokens) or 0.0)
         
-        self.last_request_time = time.time()
+        with self._usage_lock:
+            self.request_count += 1
+            self.usage["prompt_tokens"] += prompt_tokens
+            self.usage["completion_tokens"] += completion_tokens
+            self.usage["cached_tokens"] += cached_tokens
+            self.usage["estimated_tokens"] += estimated_tokens
+            self.usage["cost_usd"] += cost
     
-    def _make_request_with_retry(self, messages: list, max_tokens: int = None) -> str:
+    def _record_failure(self, error: Exception, estimated_tokens: int, endpoint: Endpoint = None):
+        """Return the TPM reservation and feed throttling back to routing and the concurrency window"""
+        endpoint = endpoint or self.endpoints.primary
+        # The ledger logs a failed call under the model of the endpoint that failed it
+        error.endpoint_model = endpoint.model
+        # Failed calls don't consume the provider's token budget
+        endpoint.token_limiter.adjust(estimated_tokens)
+        if isinstance(error, openai.RateLimitError):
+            retry_after = retry_after_from_error(error)
+            endpoint.on_throttle(retry_after)
+            # Shrink the shared window only when there is nowhere else to send traffic
+            if not self.endpoints.has_available():
+                self.concurrency.on_throttle(retry_after)
+        else:
+            endpoint.on_failure()
+        
+        # Throttling and bad requests mean the endpoint is up; only outages trip the breaker
+        if is_endpoint_failure(error):
+            endpoint.breaker.record_failure()
+        else:
+            endpoint.breaker.record_success()
+    
+    def _record_generation(self, response, max_tokens: int):
+        """Count completion tokens against the budget of the question type being asked"""
+        question_type = current_question_type.get()
+        if question_type is None:
+            return
+        usage = getattr(response, "usage", None)
+        truncated = sum(1 for choice in response.choices if choice.finish_reason == "length")
+        self.generation.record(question_type, max_tokens, getattr(usage, "completion_tokens", 0) or 0,
+                               truncated, answers=len(response.choices))
+    
+    def get_generation_stats(self) -> Dict[str, Any]:
+        """Get per-question-type completion budgets, usage and savings"""
+        return self.generation.get_stats()
+    
+    def circuit_closed(self) -> bool:
+        """True unless some endpoint's circuit breaker has tripped"""
+        return self.endpoints.all_closed()
+    
+    def get_circuit_stats(self) -> Dict[str, Any]:
+        """Get circuit breaker state across endpoints"""
+        return self.endpoints.get_circuit_stats()
+    
+    def get_endpoint_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get per-endpoint request, throttle and token counters"""
+        return self.endpoints.get_stats()
+    
+    def get_concurrency_stats(self) -> Dict[str, Any]:
+        """Get the shared AIMD concurrency window and throttle counters"""
+        return self.concurrency.get_stats()
+    
+    def get_usage_stats(self) -> Dict[str, int]:
+        """Get request and token counters for this client"""
+        with self._usage_lock:
+            stats = dict(self.usage)
+            stats["requests"] = self.request_count
+        stats["total_tokens"] = stats["prompt_tokens"] + stats["completion_tokens"]
+        stats["cached_prompt_rate"] = (round(stats["cached_tokens"] / stats["prompt_tokens"] * 100, 1)
+                                       if stats["prompt_tokens"] else 0)
+        return stats
+    
+    def get_prompt_stats(self) -> Dict[str, Any]:
+        """Get the prompt layout and the size of its shared, cacheable prefix"""
+        return self.prompts.get_stats()
+    
+    @staticmethod
+    def _message_text(response) -> str:
+        return response.choices[0].message.content.strip()
+    
+    def _served_model(self, response) -> str:
+        """Model that answered, as the API reports it"""
+        return getattr(response, "model", None) or self.endpoints.primary.model
+    
+    def _make_request_with_retry(self, messages: list, max_tokens: int = None, **params) -> str:
         """Make API request with retry logic"""
+        response = self._request_completion(messages, max_tokens, **params)
+        return self._message_text(response)
+    
+    def _cached_request(self, messages: list, max_tokens: int = None,
+                        extract: Callable[[Any], str] = None, **params) -> str:
+        """Serve a request from the response cache, calling the API on a miss.
+        
+        extract turns the raw completion into the string to return and cache;
+        by default that is the message text.
+        """
         max_tokens = max_tokens or Settings.MAX_TOKENS
+        key = self._cache_key(messages, max_tokens, **params)
+        
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
         
+        def fetch() -> str:
+            completion = self._request_completion(messages, max_tokens, **params)
+            response = (extract or self._message_text)(completion)
+            self.cache.put(key, response, self._served_model(completion))
+            return response
+        
+        if self.singleflight is None:
+            return fetch()
+        
+        # Identical prompts already in flight (same fingerprint) share that call
+        response, shared = self.singleflight.do(key, fetch)
+        self._record_coalesced(shared)
+        return response
+    
+    def _request_completion(self, messages: list, max_tokens: int = None, **params):
+        """Make API request with retry logic, returning the raw completion"""
+        max_tokens = max_tokens or Settings.MAX_TOKENS
+        # Each of n completions may use max_tokens; the prompt is paid once
+        estimated_tokens = estimate_request_tokens(messages, max_tokens * params.get("n", 1))
+        
+        start = time.time()
         for attempt in range(Settings.MAX_RETRIES):
             try:
-                self._rate_limit()
-                
-                response = self.client.chat.completions.create(
-                    model=Settings.OPENAI_MODEL,
-                    messages=messages,
-                    max_tokens=max_tokens,
-                    temperature=Settings.TEMPERATURE
-                )
-                
-                return response.choices[0].message.content.strip()
+                if self.hedging:
+                    response = self._hedged_attempt(messages, max_tokens, estimated_tokens, **params)
+                else:
+                    response = self._attempt(messages, max_tokens, estimated_tokens, **params)
+                self._log_call(start, attempt, response=response)
+                return response
                 
-            except openai.RateLimitError:
+            except CircuitOpenError:
+                # Fail fast; retrying against a dead endpoint only burns time
+                raise
+            except openai.RateLimitError as e:
                 if attempt < Settings.MAX_RETRIES - 1:
-                    wait_time = Settings.RETRY_DELAY * (2 ** attempt)
-                    print(f"Rate limit hit, waiting {wait_time} seconds...")
+                    # Honor the server's Retry-After when it sends one
+                    wait_time = retry_after_from_error(e) or Settings.RETRY_DELAY * (2 ** attempt)
+                    print(f"Rate limit hit, waiting {wait_time:.1f} seconds...")
                     time.sleep(wait_time)
                 else:
+                    self._log_call(start, attempt, error=e)
                     raise
             except openai.APIError as e:
                 if attempt < Settings.MAX_RETRIES - 1:
@@ -53,72 +321,320 @@ class GPTClient:
                     print(f"API error: {e}, retrying in {wait_time} seconds...")
                     time.sleep(wait_time)
                 else:
+                    self._log_call(start, attempt, error=e)
                     raise
             except Exception as e:
                 print(f"Unexpected error: {e}")
                 if attempt < Settings.MAX_RETRIES - 1:
                     time.sleep(Settings.RETRY_DELAY)
                 else:
+                    self._log_call(start, attempt, error=e)
                     raise
         
         raise Exception("Max retries exceeded")
     
+    def _attempt(self, messages: list, max_tokens: int, estimated_tokens: int, **params):
+        """One call, failing over to another endpoint when the chosen one throttles"""
+        tried = []
+        while True:
+            endpoint = self.endpoints.choose(exclude=tried)
+            tried.append(endpoint.name)
+            try:
+                return self._call_endpoint(endpoint, messages, max_tokens, estimated_tokens, **params)
+            except openai.RateLimitError:
+                if not self.endpoints.has_available(exclude=tried):
+                    raise
+                print(f"Endpoint {endpoint.name} throttled, failing over...")
+    
+    def _call_endpoint(self, endpoint: Endpoint, messages: list, max_tokens: int, estimated_tokens: int, **params):
+        """One rate-limited call to a single endpoint"""
+        endpoint.breaker.before_call()
+        endpoint.start()
+        
+        try:
+            self._rate_limit(estimated_tokens, endpoint)
+            self.concurrency.acquire()
+            
+            try:
+                response = endpoint.client().chat.completions.create(
+                    model=endpoint.model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=Settings.TEMPERATURE,
+                    **params
+                )
+            except Exception as e:
+                self._record_failure(e, estimated_tokens, endpoint)
+                raise
+            finally:
+                self.concurrency.release()
+        finally:
+            endpoint.finish()
+        
+        self.concurrency.on_success()
+        endpoint.breaker.record_success()
+        self._record_usage(response, estimated_tokens, endpoint)
+        self._record_generation(response, max_tokens)
+        return response
+    
+    def _hedged_attempt(self, messages: list, max_tokens: int, estimated_tokens: int, **params):
+        """One call, duplicated if it outlives the learned latency deadline; first success wins"""
+        policy = self.hedging
+        policy.start_request()
+        deadline = policy.deadline(max_tokens)
+        
+        if self._hedge_executor is None:
+            self._hedge_executor = ThreadPoolExecutor(max_workers=self.HEDGE_WORKERS, thread_name_prefix="hedge")
+        
+        def timed_attempt():
+            response = self._attempt(messages, max_tokens, estimated_tokens, **params)
+            return response, time.time()
+        
+        start = time.time()
+        primary = self._hedge_executor.submit(contextvars.copy_context().run, timed_attempt)
+        primary.add_done_callback(
+            lambda f: f.exception() is None and policy.record_latency(max_tokens, f.result()[1] - start)
+        )
+        
+        if deadline is None or wait([primary], timeout=deadline).done or not policy.try_hedge(estimated_tokens):
+            return primary.result()[0]
+        
+        # The duplicate goes through _attempt, so it draws on the shared rate budget
+        hedge = self._hedge_executor.submit(contextvars.copy_context().run, timed_attempt)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                response, finished = future.result()
+                if future is hedge:
+                    policy.record_win()
+                    primary.add_done_callback(
+                        lambda f: f.exception() is None and policy.record_saved(f.result()[1] - finished)
+                    )
+                return response
+        
+        raise error
+    
+    def build_persona_messages(self, persona_context: str, question: Dict[str, Any]) -> list:
+        """Build the chat messages asking a persona one survey question"""
+        return self.prompts.messages(persona_context, self._build_question_prompt(question))
+    
     def get_persona_response(self, persona_context: str, question: Dict[str, Any]) -> str:
         """Get persona response to a survey question"""
+        messages = self.build_persona_messages(persona_context, question)
         
-        # Build the prompt based on question type
-        question_prompt = self._build_question_prompt(question)
-        
-        messages = [
-            {
-                "role": "system",
-                "content": persona_context
-            },
-            {
-                "role": "user", 
-                "content": question_prompt
-            }
-        ]
-        
-        response = self._make_request_with_retry(messages)
+        token = current_question_type.set(question["type"])
+        try:
+            response = self._cached_request(messages, **generation_params(question))
+        finally:
+            current_question_type.reset(token)
         
         # Validate and clean response based on question type
         return self._validate_response(response, question)
     
-    def _build_question_prompt(self, question: Dict[str, Any]) -> str:
-        """Build question-specific prompt"""
-        question_text = question["text"]
-        question_type = question["type"]
+    def get_scale_distribution(self, persona_context: str, question: Dict[str, Any]) -> Dict[str, Any]:
+        """Answer a scale question with the probability of every option, from one token's logprobs"""
+        messages = self.build_persona_messages(persona_context, question)
         
-        prompt = f"Question: {question_text}\n\n"
+        # No logit bias or stop sequences here: they would skew the distribution being measured
+        token = current_question_type.set(question["type"])
+        try:
+            content = self._cached_request(messages, 1, extract=self._extract_top_logprobs,
+                                           logprobs=True, top_logprobs=Settings.SCALE_TOP_LOGPROBS)
+        finally:
+            current_question_type.reset(token)
         
-        if question_type == "scale":
-            options = question.get("options", ["1", "2", "3", "4", "5"])
-            prompt += f"Rate on a scale from {options[0]} to {options[-1]}.\n"
-            prompt += "Respond with only the number."
-            
-        elif question_type == "multiple choice":
-            options = question.get("options", [])
-            prompt += "Choose one of the following options:\n"
-            for i, option in enumerate(options, 1):
-                prompt += f"{i}. {option}\n"
-            prompt += "Respond with only the option text (not the number)."
-            
-        elif question_type == "checkbox":
-            options = question.get("options", [])
-            prompt += "Select all that apply from the following options:\n"
-            for i, option in enumerate(options, 1):
-                prompt += f"{i}. {option}\n"
-            prompt += "Respond with the selected option texts separated by commas."
-            
-        elif question_type == "open-ended":
-            prompt += "Provide a thoughtful response based on your role and experience. "
-            prompt += "Keep your answer concise but authentic to your background."
+        return self._scale_distribution(json.loads(content), question)
+    
+    @staticmethod
+    def _extract_top_logprobs(response) -> str:
+        """Sampled text and the first token's alternatives, as JSON (what the cache stores)"""
+        choice = response.choices[0]
+        first = choice.logprobs.content[0] if choice.logprobs and choice.logprobs.content else None
+        alternatives = {item.token: item.logprob for item in first.top_logprobs} if first else {}
+        return json.dumps({"text": (choice.message.content or "").strip(), "top_logprobs": alternatives})
+    
+    def _scale_distribution(self, data: Dict[str, Any], question: Dict[str, Any]) -> Dict[str, Any]:
+        """Normalise option-token probabilities into a distribution with argmax and expected value"""
+        options = question.get("options", ["1", "2", "3", "4", "5"])
+        probabilities = {option: 0.0 for option in options}
+        for token, logprob in data["top_logprobs"].items():
+            if token.strip() in probabilities:
+                probabilities[token.strip()] += math.exp(logprob)
+        
+        mass = sum(probabilities.values())
+        if mass == 0:
+            # No option among the top tokens: keep the sampled answer, without a distribution
+            answer = self._validate_response(data["text"], question)
+            return {"argmax": answer, "expected_value": None, "distribution": {}, "option_mass": 0.0}
         
-        return prompt
+        distribution = {option: round(p / mass, 4) for option, p in probabilities.items()}
+        try:
+            expected_value = round(sum(float(option) * p for option, p in distribution.items()), 3)
+        except ValueError:
+            expected_value = None
+        
+        return {
+            "argmax": max(options, key=lambda option: probabilities[option]),
+            "expected_value": expected_value,
+            "distribution": distribution,
+            "option_mass": round(mass, 4)
+        }
     
-    def _validate_response(self, response: str, question: Dict[str, Any]) -> str:
-        """Validate and clean response based on question type"""
+    def get_persona_responses(self, persona_context: str, question: Dict[str, Any], n: int) -> List[str]:
+        """Get n independently sampled, validated answers from one request (the API's n parameter)"""
+        messages = self.build_persona_messages(persona_context, question)
+        
+        token = current_question_type.set(question["type"])
+        try:
+            content = self._cached_request(messages, extract=self._extract_choices, n=n,
+                                           **generation_params(question))
+        finally:
+            current_question_type.reset(token)
+        
+        return [self._validate_response(answer, question) for answer in json.loads(content)]
+    
+    @staticmethod
+    def _extract_choices(response) -> str:
+        """Text of every returned choice, as a JSON list (what the cache stores)"""
+        return json.dumps([(choice.message.content or "").strip() for choice in response.choices])
+    
+    def build_survey_page_messages(self, persona_context: str, questions: List[Dict[str, Any]]) -> list:
+        """Build chat messages asking a persona several survey questions at once"""
+        prompt = "Answer each of the following survey questions, following the instructions given for each.\n\n"
+        
+        for question in questions:
+            prompt += f"### Question {question['question']}\n{self._build_question_prompt(question)}\n\n"
+        
+        prompt += ("Reply with a single JSON object. Use each question number (as a string) as a key "
+                   "and your answer as the value. Where several options apply, give them as one "
+                   "comma-separated string.")
+        
+        return self.prompts.messages(persona_context, prompt)
+    
+    def _page_max_tokens(self, questions: List[Dict[str, Any]]) -> int:
+        return 20 + sum(self.PAGE_TOKENS_PER_QUESTION.get(q["type"], self.PAGE_TOKENS_DEFAULT) for q in questions)
+    
+    def _parse_survey_page(self, content: str, questions: List[Dict[str, Any]]) -> Dict[int, str]:
+        """Parse a JSON page reply; answers that fail validation are left out"""
+        try:
+            data = json.loads(content)
+        except json.JSONDecodeError:
+            return {}
+        if not isinstance(data, dict):
+            return {}
+        
+        # Accept "9", "Q9", "question_9" and similar keys
+        answers_by_number = {}
+        for key, value in data.items():
+            digits = re.sub(r"\D", "", str(key))
+            if digits:
+                answers_by_number[int(digits)] = value
+        
+        parsed = {}
+        for question in questions:
+            value = answers_by_number.get(question["question"])
+            if value is None:
+                continue
+            if isinstance(value, list):
+                value = ", ".join(str(v) for v in value)
+            answer = self._parse_response(str(value).strip(), question)
+            if answer is not None:
+                parsed[question["question"]] = answer
+        
+        return parsed
+    
+    def get_persona_survey_page(self, persona_context: str, questions: List[Dict[str, Any]]) -> Dict[int, str]:
+        """Answer several questions in one JSON-mode request, keyed by question number"""
+        messages = self.build_survey_page_messages(persona_context, questions)
+        
+        content = self._cached_request(
+            messages,
+            self._page_max_tokens(questions),
+            response_format={"type": "json_object"}
+        )
+        
+        return self._parse_survey_page(content, questions)
+    
+    def build_packed_messages(self, persona_descriptions: Dict[str, str], question: Dict[str, Any]) -> list:
+        """Build chat messages asking several personas the same question at once"""
+        return self.prompts.packed_messages(self.prompts.packed_prompt(persona_descriptions, question))
+    
+    def get_packed_responses(self, persona_descriptions: Dict[str, str], question: Dict[str, Any]) -> Dict[str, str]:
+        """Answer one closed question for several personas in one request, keyed by persona ID"""
+        messages = self.build_packed_messages(persona_descriptions, question)
+        max_tokens = 20 + self.PAGE_TOKENS_DEFAULT * len(persona_descriptions)
+        
+        content = self._cached_request(messages, max_tokens, response_format={"type": "json_object"})
+        
+        try:
+            data = json.loads(content)
+        except json.JSONDecodeError:
+            return {}
+        if not isinstance(data, dict):
+            return {}
+        
+        answers = {}
+        for persona_id, value in data.items():
+            persona_id = str(persona_id).strip("[] ")
+            if persona_id not in persona_descriptions or value is None:
+                continue
+            answer = self._parse_response(str(value).strip(), question)
+            if answer is not None:
+                answers[persona_id] = answer
+        
+        return answers
+    
+    def build_batch_request(self, custom_id: str, messages: list, max_tokens: int = None, **params) -> Dict[str, Any]:
+        """Build one line of a Batch API input file"""
+        request = {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": self.endpoints.primary.model,
+                "messages": messages,
+                "max_tokens": max_tokens or Settings.MAX_TOKENS,
+                "temperature": Settings.TEMPERATURE
+            }
+        }
+        request["body"].update(params)
+        return request
+    
+    def submit_batch(self, input_path: str, metadata: Dict[str, str] = None) -> str:
+        """Upload a Batch API input file and start the batch; returns the batch ID"""
+        with open(input_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+            metadata=metadata
+        )
+        return batch.id
+    
+    def get_batch(self, batch_id: str):
+        """Retrieve the current state of a batch"""
+        return self.client.batches.retrieve(batch_id)
+    
+    def download_file(self, file_id: str, output_path: str) -> str:
+        """Download a Batch API output or error file"""
+        content = self.client.files.content(file_id)
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(content.text)
+        return output_path
+    
+    def _build_question_prompt(self, question: Dict[str, Any]) -> str:
+        """Build question-specific prompt"""
+        return self.prompts.question_prompt(question)
+    
+    def _parse_response(self, response: str, question: Dict[str, Any]) -> Optional[str]:
+        """Match a response against the question's options; None if it can't be parsed"""
         question_type = question["type"]
         
         if question_type == "scale":
@@ -127,8 +643,7 @@ class GPTClient:
             for option in options:
                 if option in response:
                     return option
-            # If no valid option found, return middle value
-            return options[len(options) // 2]
+            return None
             
         elif question_type == "multiple choice":
             # Check if response matches any option
@@ -144,8 +659,7 @@ class GPTClient:
                 if any(word in response_lower for word in option.lower().split()):
                     return option
             
-            # Default to first option if no match
-            return options[0] if options else response
+            return None
             
         elif question_type == "checkbox":
             # Parse comma-separated responses
@@ -159,11 +673,33 @@ class GPTClient:
                     if (option.lower() in part_lower or part_lower in option.lower()) and option not in matched_options:
                         matched_options.append(option)
             
-            return ", ".join(matched_options) if matched_options else response
+            return ", ".join(matched_options) if matched_options else None
         
         # For open-ended questions, return as-is but limit length
+        if not response.strip():
+            return None
         return response[:500] if len(response) > 500 else response
     
+    def _validate_response(self, response: str, question: Dict[str, Any]) -> str:
+        """Validate and clean response based on question type"""
+        parsed = self._parse_response(response, question)
+        if parsed is not None:
+            return parsed
+        
+        question_type = question["type"]
+        
+        if question_type == "scale":
+            # If no valid option found, return middle value
+            options = question.get("options", ["1", "2", "3", "4", "5"])
+            return options[len(options) // 2]
+            
+        elif question_type == "multiple choice":
+            # Default to first option if no match
+            options = question.get("options", [])
+            return options[0] if options else response
+        
+        return response
+    
     def test_connection(self) -> bool:
         """Test OpenAI API connection"""
         try:
@@ -0,0 +1,101 @@
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+
+class LatencyTracker:
+    """Sliding window of recent request latencies"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Latency below which `fraction` of recent requests finished"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(fraction * len(samples)))
+        return samples[index]
+
+
+class HedgePolicy:
+    """Decides when a slow request gets a duplicate, and keeps hedging counters.
+
+    The deadline is a percentile of recent latencies, learned separately per
+    request kind (single answers and JSON pages take very different times).
+    Hedges are capped as a fraction of requests and by total extra tokens.
+    """
+
+    def __init__(self, percentile: float = 0.95, min_samples: int = 20,
+                 max_ratio: float = 0.1, max_extra_tokens: int = 50000):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        self.max_extra_tokens = max_extra_tokens
+        self._trackers: Dict[Any, LatencyTracker] = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedges_issued = 0
+        self.hedges_won = 0
+        self.extra_tokens = 0
+        self.latency_saved = 0.0
+
+    def _tracker(self, kind: Any) -> LatencyTracker:
+        with self._lock:
+            if kind not in self._trackers:
+                self._trackers[kind] = LatencyTracker()
+            return self._trackers[kind]
+
+    def record_latency(self, kind: Any, seconds: float):
+        self._tracker(kind).record(seconds)
+
+    def deadline(self, kind: Any) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there is too little history"""
+        tracker = self._tracker(kind)
+        if tracker.count() < self.min_samples:
+            return None
+        return tracker.percentile(self.percentile)
+
+    def start_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def try_hedge(self, estimated_tokens: int) -> bool:
+        """Claim a hedge if the ratio and spend caps allow one"""
+        with self._lock:
+            if self.hedges_issued + 1 > self.max_ratio * self.requests:
+                return False
+            if self.extra_tokens + estimated_tokens > self.max_extra_tokens:
+                return False
+            self.hedges_issued += 1
+            self.extra_tokens += estimated_tokens
+            return True
+
+    def record_win(self):
+        with self._lock:
+            self.hedges_won += 1
+
+    def record_saved(self, seconds: float):
+        """Credit the time a winning hedge beat the original request by"""
+        with self._lock:
+            self.latency_saved += max(0.0, seconds)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedges_issued": self.hedges_issued,
+                "hedges_won": self.hedges_won,
+                "hedge_ratio": round(self.hedges_issued / self.requests, 3) if self.requests else 0,
+                "extra_tokens": self.extra_tokens,
+                "latency_saved_seconds": round(self.latency_saved, 2)
+            }
@@ -0,0 +1,222 @@
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+from config.settings import Settings
+
+# Who a call is for (survey, persona, question, kind); set by the engines around each request
+_call_context = contextvars.ContextVar("llm_call_context", default={})
+
+@contextmanager
+def call_context(**fields):
+    """Tag LLM calls made inside the block (and in threads/tasks it spawns) with these fields"""
+    token = _call_context.set({**_call_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
+
+def model_prices(model: str) -> Optional[Dict[str, float]]:
+    """USD per million tokens for a model; dated snapshots use their family's price"""
+    matches = [name for name in Settings.MODEL_PRICES if model == name or model.startswith(f"{name}-")]
+    return Settings.MODEL_PRICES[max(matches, key=len)] if matches else None
+
+def compute_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> Optional[float]:
+    """Cost of one call from the price table; None for models without a price"""
+    prices = model_prices(model)
+    if prices is None:
+        return None
+    uncached = prompt_tokens - cached_tokens
+    cost = (uncached * prices["input"]
+            + cached_tokens * prices.get("cached_input", prices["input"])
+            + completion_tokens * prices["output"]) / 1_000_000
+    return round(cost, 8)
+
+
+class CallLedger:
+    """One llm_calls row per API request: who it was for, tokens, latency, retries, status and cost.
+
+    Views llm_run_summary and llm_question_summary aggregate the rows per
+    survey run and per question.
+    """
+
+    COLUMNS = ["created_at", "survey_id", "persona_id", "question_number", "kind", "model",
+               "prompt_tokens", "completion_tokens", "cached_tokens", "latency_ms", "retries",
+               "status", "error", "cost_usd"]
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.init_database()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def init_database(self):
+        """Initialize the ledger table and its summary views"""
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS llm_calls (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at REAL NOT NULL,
+                    survey_id TEXT,
+                    persona_id TEXT,
+                    question_number INTEGER,
+                    kind TEXT,
+                    model TEXT NOT NULL,
+                    prompt_tokens INTEGER DEFAULT 0,
+                    completion_tokens INTEGER DEFAULT 0,
+                    cached_tokens INTEGER DEFAULT 0,
+                    latency_ms REAL,
+                    retries INTEGER DEFAULT 0,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    cost_usd REAL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_llm_calls_survey ON llm_calls (survey_id, question_number)')
+            conn.execute('''
+                CREATE VIEW IF NOT EXISTS llm_run_summary AS
+                SELECT survey_id,
+                       COUNT(*) AS calls,
+                       SUM(status != 'ok') AS failed_calls,
+                       SUM(retries) AS retries,
+                       SUM(prompt_tokens) AS prompt_tokens,
+                       SUM(cached_tokens) AS cached_tokens,
+                       SUM(completion_tokens) AS completion_tokens,
+                       ROUND(SUM(cost_usd), 6) AS cost_usd,
+                       ROUND(AVG(latency_ms), 1) AS avg_latency_ms,
+                       COUNT(DISTINCT persona_id) AS personas,
+                       MIN(created_at) AS started_at,
+                       MAX(created_at) AS finished_at
+                FROM llm_calls
+                GROUP BY survey_id
+            ''')
+            conn.execute('''
+                CREATE VIEW IF NOT EXISTS llm_question_summary AS
+                SELECT survey_id, question_number,
+                       COUNT(*) AS calls,
+                       SUM(status != 'ok') AS failed_calls,
+                       SUM(retries) AS retries,
+                       ROUND(AVG(prompt_tokens), 1) AS avg_prompt_tokens,
+                       ROUND(AVG(completion_tokens), 1) AS avg_completion_tokens,
+                       ROUND(SUM(cost_usd), 6) AS cost_usd,
+                       ROUND(AVG(latency_ms), 1) AS avg_latency_ms,
+                       MAX(latency_ms) AS max_latency_ms
+                FROM llm_calls
+                GROUP BY survey_id, question_number
+            ''')
+            conn.commit()
+
+    def record(self, model: str, latency: float, retries: int = 0, response=None, error: Exception = None):
+        """Record one request (its final outcome after retries) under the current call context"""
+        context = _call_context.get()
+        usage = getattr(response, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        cached_tokens = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", 0) or 0
+        if response is not None:
+            model = getattr(response, "model", None) or model
+
+        row = {
+            "created_at": time.time(),
+            "survey_id": context.get("survey_id"),
+            "persona_id": context.get("persona_id"),
+            "question_number": context.get("question_number"),
+            "kind": context.get("kind"),
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+            "latency_ms": round(latency * 1000, 1),
+            "retries": retries,
+            "status": "ok" if error is None else type(error).__name__,
+            "error": str(error)[:500] if error is not None else None,
+            "cost_usd": compute_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+        }
+
+        self._insert(row)
+
+    def record_batch(self, survey_id: str, persona_id: str, question_number: int, model: str,
+                     body: Dict[str, Any] = None, error: Exception = None):
+        """Record one Batch API result, at the batch discount; a result already recorded is skipped"""
+        usage = (body or {}).get("usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0) or 0
+        completion_tokens = usage.get("completion_tokens", 0) or 0
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
+        model = (body or {}).get("model") or model
+        cost = compute_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+
+        row = {
+            "created_at": time.time(),
+            "survey_id": survey_id,
+            "persona_id": persona_id,
+            "question_number": question_number,
+            "kind": "batch",
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+            # Batch requests wait in the provider's queue, so there is no per-call latency to report
+            "latency_ms": None,
+            "retries": 0,
+            "status": "ok" if error is None else type(error).__name__,
+            "error": str(error)[:500] if error is not None else None,
+            "cost_usd": round(cost * Settings.BATCH_PRICE_DISCOUNT, 8) if cost is not None else None
+        }
+        self._insert(row, unless='survey_id = ? AND persona_id = ? AND question_number = ? AND kind = ?',
+                     unless_params=(survey_id, persona_id, question_number, "batch"))
+
+    def _insert(self, row: Dict[str, Any], unless: str = None, unless_params: tuple = ()):
+        """Insert one row; with `unless`, only if no row matches that condition"""
+        sql = f'INSERT INTO llm_calls ({", ".join(self.COLUMNS)}) SELECT {", ".join("?" * len(self.COLUMNS))}'
+        if unless:
+            sql += f' WHERE NOT EXISTS (SELECT 1 FROM llm_calls WHERE {unless})'
+        try:
+            with self._lock, self._connect() as conn:
+                conn.execute(sql, [row[column] for column in self.COLUMNS] + list(unless_params))
+                conn.commit()
+        except sqlite3.Error as e:
+            # Bookkeeping must never fail the survey itself
+            print(f"Warning: could not record LLM call: {e}")
+
+    def _query(self, sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            return [dict(row) for row in conn.execute(sql, params).fetchall()]
+
+    def run_summary(self, survey_id: str) -> Optional[Dict[str, Any]]:
+        """Totals for one survey run"""
+        rows = self._query('SELECT * FROM llm_run_summary WHERE survey_id = ?', (survey_id,))
+        return rows[0] if rows else None
+
+    def question_summary(self, survey_id: str) -> List[Dict[str, Any]]:
+        """Per-question totals for one survey run"""
+        return self._query('SELECT * FROM llm_question_summary WHERE survey_id = ? ORDER BY question_number',
+                           (survey_id,))
+
+    def cost_per_persona(self) -> Optional[float]:
+        """Average cost of surveying one persona over past runs, if any were recorded"""
+        rows = self._query('SELECT SUM(cost_usd) AS cost, SUM(personas) AS personas FROM llm_run_summary '
+                           'WHERE survey_id IS NOT NULL AND cost_usd IS NOT NULL')
+        if not rows or not rows[0]["personas"]:
+            return None
+        return rows[0]["cost"] / rows[0]["personas"]
+
+    def completion_history(self) -> Dict[int, float]:
+        """Average completion tokens per question number over past single-question calls"""
+        rows = self._query("SELECT question_number, AVG(completion_tokens) AS tokens FROM llm_calls "
+                           "WHERE status = 'ok' AND kind = 'question' AND question_number IS NOT NULL "
+                           "GROUP BY question_number")
+        return {row["question_number"]: row["tokens"] for row in rows}
+
+    def average_latency(self) -> Optional[float]:
+        """Average latency of past successful calls in seconds, if any were recorded"""
+        rows = self._query("SELECT AVG(latency_ms) AS latency FROM llm_calls WHERE status = 'ok'")
+        return rows[0]["latency"] / 1000 if rows and rows[0]["latency"] is not None else None
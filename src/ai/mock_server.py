@@ -0,0 +1,399 @@
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from .tokens import CHARS_PER_TOKEN, estimate_prompt_tokens, estimate_text_tokens
+
+OPEN_ENDED_ANSWERS = [
+    "Mostly for drafting documents and summarising long threads; I still review everything myself.",
+    "Research and brainstorming. It speeds up the first draft, but the judgement calls stay with me.",
+    "Code and data questions, plus meeting notes. Useful, though I double-check the details.",
+    "I use it sparingly, mainly for writing support, because of data privacy concerns at work.",
+    "Planning and reporting. It saves time on routine work so the team can focus on harder problems."
+]
+
+class MockResponder:
+    """Deterministic, persona-aware answers for survey prompts.
+
+    The same persona context and question always get the same answer; different
+    personas spread across the options. `salt` varies answers between samples
+    of the same prompt (for n > 1).
+    """
+
+    def _pick(self, seed_text: str, choices: List[str]) -> str:
+        digest = hashlib.sha256(seed_text.encode("utf-8")).hexdigest()
+        return choices[int(digest, 16) % len(choices)]
+
+    def answer_question(self, persona: str, prompt: str, salt: int = 0) -> str:
+        seed = f"{persona}|{prompt}|{salt}"
+
+        scale = re.search(r"Rate on a scale from (\S+) to (\S+?)\.", prompt)
+        if scale:
+            try:
+                low, high = int(scale.group(1)), int(scale.group(2))
+                return self._pick(seed, [str(value) for value in range(low, high + 1)])
+            except ValueError:
+                return scale.group(1)
+
+        options = re.findall(r"^\d+\. (.+)$", prompt, flags=re.MULTILINE)
+        if options and "Select all that apply" in prompt:
+            first = self._pick(seed, options)
+            second = self._pick(seed + "|2", options)
+            return first if first == second else f"{first}, {second}"
+        if options:
+            return self._pick(seed, options)
+
+        return self._pick(seed, OPEN_ENDED_ANSWERS)
+
+    @staticmethod
+    def _respondent_and_prompt(body: Dict[str, Any]) -> Tuple[str, str]:
+        """Who is answering (the "## Respondent" line, else the system message) and the last message"""
+        messages = body.get("messages", [])
+        system = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+        prompt = messages[-1].get("content") or "" if messages else ""
+        respondent = re.search(r"^## Respondent\n(.+)$", prompt, flags=re.MULTILINE)
+        return (respondent.group(1) if respondent else system), prompt
+
+    def top_logprobs(self, body: Dict[str, Any], content: str, salt: int = 0) -> List[Dict[str, Any]]:
+        """Alternatives for the first answer token: a spread around the answer for scale
+        questions (the answer stays most likely), otherwise just the answer itself"""
+        system, prompt = self._respondent_and_prompt(body)
+        scale = re.search(r"Rate on a scale from (\d+) to (\d+)\.", prompt)
+        if not scale or not content.isdigit():
+            return [{"token": content, "logprob": 0.0}]
+
+        weights = {}
+        for value in range(int(scale.group(1)), int(scale.group(2)) + 1):
+            digest = hashlib.sha256(f"{system}|{prompt}|{salt}|{value}".encode("utf-8")).hexdigest()
+            jitter = 0.75 + 0.5 * (int(digest[:8], 16) / 0xFFFFFFFF)
+            weights[str(value)] = math.exp(-abs(value - int(content))) * jitter
+        total = sum(weights.values())
+        ranked = sorted(weights.items(), key=lambda item: item[1], reverse=True)
+        return [{"token": token, "logprob": math.log(weight / total)} for token, weight in ranked]
+
+    def answer(self, body: Dict[str, Any], salt: int = 0) -> str:
+        """Answer a chat completion request body"""
+        system, prompt = self._respondent_and_prompt(body)
+        json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+
+        if not json_mode:
+            if "please respond with 'ok'" in prompt.lower():
+                return "OK"
+            return self.answer_question(system, prompt, salt)
+
+        # Multi-persona packed request: one answer per "[ID] description" line
+        people = re.findall(r"^\[([^\]]+)\] (.+)$", prompt, flags=re.MULTILINE)
+        if people:
+            question = prompt.split("\n\n", 1)[1] if "\n\n" in prompt else prompt
+            return json.dumps({pid: self.answer_question(desc, question, salt) for pid, desc in people})
+
+        # Survey page: one answer per "### Question N" block
+        blocks = re.split(r"^### Question (\d+)\n", prompt, flags=re.MULTILINE)
+        answers = {}
+        for i in range(1, len(blocks) - 1, 2):
+            answers[blocks[i]] = self.answer_question(system, blocks[i + 1].strip(), salt)
+        return json.dumps(answers)
+
+
+class MockOpenAIServer:
+    """Local stand-in for the OpenAI chat completions, files and batches endpoints.
+
+    Point GPTClient at it with OPENAI_BASE_URL=http://host:port/v1. Latency is
+    log-normal around `latency_ms` (sigma 0 = fixed), `rate_429` of chat requests
+    are rejected with a Retry-After and `rate_500` fail with a 503, all from a
+    seeded generator. fail_for() simulates an outage.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 200,
+                 latency_sigma: float = 0.5, rate_429: float = 0.0, retry_after_ms: int = 500,
+                 rate_500: float = 0.0, seed: int = 42, responder: Optional[MockResponder] = None):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.rate_429 = rate_429
+        self.retry_after_ms = retry_after_ms
+        self.rate_500 = rate_500
+        self.outage_until = 0.0
+        self.responder = responder or MockResponder()
+        self.files: Dict[str, bytes] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"chat_requests": 0, "throttled": 0, "server_errors": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                      "cached_tokens": 0}
+        self._prefixes = set()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive like the real API; headers and body go out in separate writes
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                server._handle(self, "POST")
+
+            def do_GET(self):
+                server._handle(self, "GET")
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockOpenAIServer":
+        """Serve in a background thread"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _sample_latency(self) -> float:
+        with self._lock:
+            if self.latency_sigma <= 0:
+                return self.latency_ms / 1000
+            return self.latency_ms * math.exp(self._rng.gauss(0, self.latency_sigma)) / 1000
+
+    def _should_throttle(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.rate_429
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            return time.time() < self.outage_until or self._rng.random() < self.rate_500
+
+    def fail_for(self, seconds: float):
+        """Answer every chat request with a 503 for the next `seconds`"""
+        self.outage_until = time.time() + seconds
+
+    # Request handling
+
+    def _handle(self, handler: BaseHTTPRequestHandler, method: str):
+        path = handler.path.split("?", 1)[0]
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length) if length else b""
+
+        try:
+            if method == "POST" and path.endswith("/chat/completions"):
+                self._chat_completions(handler, json.loads(body or b"{}"))
+            elif method == "POST" and path.endswith("/files"):
+                self._upload_file(handler, body)
+            elif method == "GET" and re.search(r"/files/[^/]+/content$", path):
+                self._file_content(handler, path.split("/")[-2])
+            elif method == "POST" and path.endswith("/batches"):
+                self._create_batch(handler, json.loads(body or b"{}"))
+            elif method == "GET" and re.search(r"/batches/[^/]+$", path):
+                self._get_batch(handler, path.split("/")[-1])
+            else:
+                self._send_json(handler, 404, {"error": {"message": f"Unknown endpoint {method} {path}", "type": "invalid_request_error"}})
+        except (BrokenPipeError, ConnectionResetError):
+            # Client gave up (e.g. a cancelled hedge); nothing left to answer
+            pass
+        except Exception as e:
+            self._send_json(handler, 500, {"error": {"message": str(e), "type": "server_error"}})
+
+    def _send_json(self, handler: BaseHTTPRequestHandler, status: int, payload: Dict[str, Any],
+                   headers: Dict[str, str] = None):
+        data = json.dumps(payload).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    @staticmethod
+    def _apply_limits(content: str, body: Dict[str, Any]) -> Tuple[str, str]:
+        """Honour stop sequences and max_tokens like the real API; returns (content, finish_reason)"""
+        stop = body.get("stop") or []
+        for sequence in [stop] if isinstance(stop, str) else stop:
+            if sequence in content:
+                content = content[:content.index(sequence)]
+        max_tokens = body.get("max_tokens")
+        if max_tokens and estimate_text_tokens(content) > max_tokens:
+            return content[:max_tokens * CHARS_PER_TOKEN], "length"
+        return content, "stop"
+
+    def _logprobs(self, body: Dict[str, Any], content: str, salt: int) -> Optional[Dict[str, Any]]:
+        """logprobs for the first token only, when the request asked for them"""
+        if not body.get("logprobs") or not content:
+            return None
+        alternatives = self.responder.top_logprobs(body, content, salt)[:int(body.get("top_logprobs") or 0)]
+        return {"content": [{
+            "token": content,
+            "logprob": next((a["logprob"] for a in alternatives if a["token"] == content), 0.0),
+            "bytes": list(content.encode("utf-8")),
+            "top_logprobs": [dict(a, bytes=list(a["token"].encode("utf-8"))) for a in alternatives]
+        }]}
+
+    def _cached_prefix_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """Prompt caching like the API's: a first message seen before, if at least 1024 tokens,
+        is served from cache in 128-token steps"""
+        if not messages:
+            return 0
+        first = messages[0].get("content") or ""
+        tokens = estimate_text_tokens(first)
+        if tokens < 1024:
+            return 0
+        key = hashlib.sha256(first.encode("utf-8")).hexdigest()
+        with self._lock:
+            seen = key in self._prefixes
+            self._prefixes.add(key)
+        return tokens // 128 * 128 if seen else 0
+
+    def completion(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Build a chat.completion response object for a request body"""
+        n = int(body.get("n") or 1)
+        choices = [self._apply_limits(self.responder.answer(body, salt=i), body) for i in range(n)]
+        contents = [content for content, _ in choices]
+        prompt_tokens = estimate_prompt_tokens(body.get("messages", []))
+        completion_tokens = sum(estimate_text_tokens(content) for content in contents)
+        cached_tokens = self._cached_prefix_tokens(body.get("messages", []))
+
+        with self._lock:
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["completion_tokens"] += completion_tokens
+            self.stats["cached_tokens"] += cached_tokens
+
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [
+                {
+                    "index": i,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": finish_reason,
+                    "logprobs": self._logprobs(body, content, i)
+                }
+                for i, (content, finish_reason) in enumerate(choices)
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens}
+            }
+        }
+
+    def _chat_completions(self, handler: BaseHTTPRequestHandler, body: Dict[str, Any]):
+        with self._lock:
+            self.stats["chat_requests"] += 1
+
+        if self._should_throttle():
+            with self._lock:
+                self.stats["throttled"] += 1
+            self._send_json(handler, 429, {
+                "error": {"message": "Rate limit reached (mock server)", "type": "requests", "code": "rate_limit_exceeded"}
+            }, headers={
+                "retry-after-ms": str(self.retry_after_ms),
+                "x-ratelimit-reset-requests": f"{self.retry_after_ms}ms"
+            })
+            return
+
+        if self._should_fail():
+            with self._lock:
+                self.stats["server_errors"] += 1
+            self._send_json(handler, 503, {
+                "error": {"message": "Service unavailable (mock server)", "type": "server_error"}
+            })
+            return
+
+        time.sleep(self._sample_latency())
+        self._send_json(handler, 200, self.completion(body))
+
+    def _upload_file(self, handler: BaseHTTPRequestHandler, body: bytes):
+        content_type = handler.headers.get("Content-Type", "")
+        message = BytesParser(policy=default_policy).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode("utf-8") + body
+        )
+
+        data, purpose, filename = b"", "batch", "upload.jsonl"
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if name == "file":
+                data = part.get_payload(decode=True) or b""
+                filename = part.get_filename() or filename
+            elif name == "purpose":
+                purpose = part.get_content().strip()
+
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        with self._lock:
+            self.files[file_id] = data
+
+        self._send_json(handler, 200, {
+            "id": file_id, "object": "file", "bytes": len(data), "created_at": int(time.time()),
+            "filename": filename, "purpose": purpose, "status": "processed"
+        })
+
+    def _file_content(self, handler: BaseHTTPRequestHandler, file_id: str):
+        data = self.files.get(file_id)
+        if data is None:
+            self._send_json(handler, 404, {"error": {"message": f"No such file {file_id}", "type": "invalid_request_error"}})
+            return
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/octet-stream")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _create_batch(self, handler: BaseHTTPRequestHandler, body: Dict[str, Any]):
+        """Process a batch immediately; it reports 'completed' on the first poll"""
+        input_data = self.files.get(body.get("input_file_id"), b"")
+        lines = [json.loads(line) for line in input_data.decode("utf-8").splitlines() if line.strip()]
+
+        output = []
+        for request in lines:
+            output.append(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex[:24]}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": self.completion(request["body"])},
+                "error": None
+            }))
+
+        output_file_id = f"file-{uuid.uuid4().hex[:24]}"
+        batch_id = f"batch_{uuid.uuid4().hex[:24]}"
+        now = int(time.time())
+        batch = {
+            "id": batch_id, "object": "batch", "endpoint": body.get("endpoint"),
+            "input_file_id": body.get("input_file_id"), "completion_window": body.get("completion_window", "24h"),
+            "status": "completed", "created_at": now, "completed_at": now,
+            "output_file_id": output_file_id, "error_file_id": None,
+            "request_counts": {"total": len(lines), "completed": len(lines), "failed": 0},
+            "metadata": body.get("metadata")
+        }
+
+        with self._lock:
+            self.files[output_file_id] = ("\n".join(output) + "\n").encode("utf-8")
+            self.batches[batch_id] = batch
+
+        self._send_json(handler, 200, dict(batch, status="validating"))
+
+    def _get_batch(self, handler: BaseHTTPRequestHandler, batch_id: str):
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            self._send_json(handler, 404, {"error": {"message": f"No such batch {batch_id}", "type": "invalid_request_error"}})
+            return
+        self._send_json(handler, 200, batch)
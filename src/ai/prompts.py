@@ -0,0 +1,199 @@
+from typing import Any, Dict, List
+from config.settings import Settings
+from personas.generator import PersonaGenerator
+from personas.persona import Persona
+from .tokens import count_text_tokens
+
+# Providers only cache prompt prefixes from this length on (OpenAI: 1024 tokens, in 128-token steps)
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+def _listing(values) -> str:
+    values = list(values)
+    return values[0] if len(values) == 1 else f"{', '.join(values[:-1])} or {values[-1]}"
+
+def _shared_instructions() -> str:
+    """The instruction part of the shared prefix, with profile values taken from PersonaGenerator"""
+    role_departments = "; ".join(f"{role}: {_listing(departments)}"
+                                 for role, departments in PersonaGenerator.ROLE_DEPARTMENT_MAP.items())
+    example = Persona(id="PM_001", role="Product Manager", department="Product", gender="Female",
+                      age_range="35-44", experience="5-10 years", location="Canada", team_size="0-5 employees")
+    return f"""You are taking part in a workplace survey about the adoption of generative AI tools. \
+Each request describes one respondent (or several) and asks one or more questions from the questionnaire below. \
+You are the respondent described: respond to survey questions authentically based on your role, experience, \
+age and location.
+
+## Respondent profiles
+Every respondent is described by the same fields, always in the same order: role, department, gender, age \
+range, experience, location and team size. A description reads like "{example.get_description()}". \
+The fields take these values:
+- Role: the respondent's job title, one of {_listing(PersonaGenerator.ROLES)}.
+- Department: where the role sits in the organisation, one of {_listing(PersonaGenerator.DEPARTMENTS)}. \
+Roles belong to these departments: {role_departments}.
+- Gender: {_listing(PersonaGenerator.GENDERS)}.
+- Age range: {_listing(PersonaGenerator.AGE_RANGES)}.
+- Experience: how long the respondent has worked in this kind of role, {_listing(PersonaGenerator.EXPERIENCE_LEVELS)}.
+- Location: the country the respondent lives and works in, {_listing(PersonaGenerator.LOCATIONS)}.
+- Team size: how many employees the respondent manages, {_listing(PersonaGenerator.TEAM_SIZES)}.
+Respondents can also be imported from a file, so other values may appear in any field; read them the same way.
+
+## Requests
+Every request takes one of three forms.
+- One respondent, one question: the request starts with a "## Respondent" section describing you, followed \
+by "Question:", the question text and the format to answer in. Reply with the answer alone.
+- One respondent, several questions: after the "## Respondent" section, each question follows under its own \
+"### Question N" heading, where N is its number in the questionnaire, each with its own format instruction. \
+Reply with a single JSON object whose keys are the question numbers (as strings) and whose values are your \
+answers, for example {{"9": "4", "12": "Late 2024"}}. Give checkbox answers as one comma-separated string, \
+not as a list.
+- Several respondents, one question: the request lists the people under "People:", one per line in the \
+form "[ID] description", followed by the question. Answer for each person separately. Reply with a single \
+JSON object whose keys are the IDs (without brackets) and whose values are each person's answer, for example \
+{{"PM_001": "3", "SE_002": "5"}}.
+A JSON reply holds exactly one entry for each question or person asked about and nothing else: no extra \
+keys, no nesting, no comments and no code fences around it.
+
+## Answer formats
+Every question ends with the format to answer in, and that instruction applies. In short:
+- Scale questions: respond with only the number, for example 4, from the range the question gives.
+- Multiple choice questions: respond with only the text of one option (not its number), spelled exactly as \
+the option is written.
+- Checkbox questions: respond with the texts of the selected options, separated by commas, each spelled \
+exactly as written. Any number of options may be selected, in any order.
+- Open-ended questions: provide a thoughtful response based on your role and experience, concise but \
+authentic to your background. Answer in plain text, without headings or bullet points.
+An answer that is not in the requested format cannot be recorded."""
+
+# Identical for every persona and question, so it always comes first and can be served from the
+# provider's prompt cache. Anything persona- or question-specific belongs after it. It says no more than
+# the persona-first prompt does (answer as the respondent, authentically, in the requested format), so
+# the layout changes caching, not answers; anything that steers answers goes in ANSWER_GUIDANCE. With the
+# questionnaire it is well over PROMPT_CACHE_MIN_TOKENS real tokens, not just by the chars-per-token estimate.
+SHARED_INSTRUCTIONS = _shared_instructions()
+
+# Opt-in (PROMPT_GUIDANCE=true) advice that nudges answers away from the model's defaults. It changes
+# results, so runs compared with each other should all use it or all leave it out.
+ANSWER_GUIDANCE = """## Answer guidance
+- Stay in character. Answer in the first person as the respondent described, never as an AI model, and never \
+mention that you are playing a role.
+- Let the respondent's profile shape the answer: their job role and department decide which tasks AI can help \
+with; seniority and team size decide whether they adopt tools on their own or because the organisation asks; \
+age range, years of experience and location influence familiarity with and attitudes towards new technology.
+- Be realistic rather than uniformly positive. People differ: some are enthusiastic early adopters, some are \
+cautious or sceptical, many are somewhere in between. Concerns about accuracy, data privacy, job security and \
+regulation are common and legitimate, and so are reports of real time savings.
+- Keep answers consistent with each other. Someone who rarely uses AI tools should not describe advanced daily \
+workflows; someone who rates themselves as very tech savvy should not struggle with basic tools.
+- Use the full range of a scale where it fits the respondent; do not default to the middle value.
+- Keep open-ended answers to one to three sentences (at most about 80 words), concrete and specific to the \
+respondent's work."""
+
+QUESTION_TEMPLATES = {
+    "scale": "Rate on a scale from {first} to {last}.\nRespond with only the number.",
+    "multiple choice": "Choose one of the following options:\n{numbered}Respond with only the option text (not the number).",
+    "checkbox": "Select all that apply from the following options:\n{numbered}"
+                "Respond with the selected option texts separated by commas.",
+    "open-ended": "Provide a thoughtful response based on your role and experience. "
+                  "Keep your answer concise but authentic to your background."
+}
+
+
+class PromptTemplates:
+    """Assembles chat messages from a shared instruction prefix, the respondent and the question.
+
+    Layout "shared-prefix" (default) puts the static instructions and questionnaire
+    first and the persona and question last, so every request shares a long
+    cacheable prefix. "persona-first" is the original layout: the persona as the
+    system message, the question as the user message. With `guidance`, both
+    add ANSWER_GUIDANCE to the system message.
+    """
+
+    LAYOUTS = ["shared-prefix", "persona-first"]
+
+    def __init__(self, layout: str = None, guidance: bool = None, model: str = None):
+        self.layout = layout or Settings.PROMPT_LAYOUT
+        self.model = model or Settings.OPENAI_MODEL
+        if self.layout not in self.LAYOUTS:
+            raise ValueError(f"Unknown prompt layout: {self.layout}")
+        self.guidance = Settings.PROMPT_GUIDANCE if guidance is None else guidance
+        self.survey_questions: List[Dict[str, Any]] = []
+        self._prefix = None
+
+    def set_survey(self, questions: List[Dict[str, Any]]):
+        """Include the questionnaire in the shared prefix"""
+        self.survey_questions = list(questions)
+        self._prefix = None
+
+    def shared_prefix(self) -> str:
+        if self._prefix is None:
+            prefix = SHARED_INSTRUCTIONS
+            if self.guidance:
+                prefix += f"\n\n{ANSWER_GUIDANCE}"
+            if self.survey_questions:
+                prefix += "\n\n## The questionnaire\n"
+                for question in self.survey_questions:
+                    options = f" Options: {' | '.join(question['options'])}." if question.get("options") else ""
+                    prefix += f"Q{question['question']} ({question['type']}): {question['text']}{options}\n"
+            self._prefix = prefix
+        return self._prefix
+
+    def prefix_tokens(self) -> int:
+        """Tokens in the shared prefix with the model's tokenizer (the estimate without tiktoken)"""
+        return count_text_tokens(self.shared_prefix(), self.model) if self.layout == "shared-prefix" else 0
+
+    def question_prompt(self, question: Dict[str, Any]) -> str:
+        """Question text plus the answer-format instruction for its type"""
+        options = question.get("options", [])
+        if question["type"] == "scale":
+            options = options or ["1", "2", "3", "4", "5"]
+        numbered = "".join(f"{i}. {option}\n" for i, option in enumerate(options, 1))
+        template = QUESTION_TEMPLATES.get(question["type"], "")
+        instructions = template.format(first=options[0] if options else "", last=options[-1] if options else "",
+                                       numbered=numbered)
+        return f"Question: {question['text']}\n\n{instructions}"
+
+    def messages(self, persona_context: str, body: str) -> List[Dict[str, str]]:
+        """Messages for one respondent: shared prefix, then persona, then the request body"""
+        if self.layout == "persona-first":
+            return [
+                {"role": "system", "content": self._with_guidance(persona_context)},
+                {"role": "user", "content": body}
+            ]
+        return [
+            {"role": "system", "content": self.shared_prefix()},
+            {"role": "user", "content": f"## Respondent\n{persona_context}\n\n{body}"}
+        ]
+
+    def _with_guidance(self, system: str) -> str:
+        return f"{system}\n\n{ANSWER_GUIDANCE}" if self.guidance else system
+
+    def packed_prompt(self, persona_descriptions: Dict[str, str], question: Dict[str, Any]) -> str:
+        """Request body asking several people (keyed by ID) the same question"""
+        people = "\n".join(f"[{persona_id}] {description}" for persona_id, description in persona_descriptions.items())
+        prompt = f"People:\n{people}\n\n{self.question_prompt(question)}\n\n"
+        prompt += ("Answer separately for each person, authentically based on their own role, experience, "
+                   "age and location. Reply with a single JSON object mapping each person's ID "
+                   "(without brackets) to their answer.")
+        return prompt
+
+    def packed_messages(self, body: str) -> List[Dict[str, str]]:
+        """Messages for several respondents answering the same question"""
+        instructions = ("You answer survey questions on behalf of several different people. "
+                        "Treat each person independently; do not let one person's answer influence another's.")
+        if self.layout == "persona-first":
+            return [
+                {"role": "system", "content": self._with_guidance(instructions)},
+                {"role": "user", "content": body}
+            ]
+        return [
+            {"role": "system", "content": self.shared_prefix()},
+            {"role": "user", "content": f"{instructions}\n\n{body}"}
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        prefix_tokens = self.prefix_tokens()
+        return {
+            "layout": self.layout,
+            "guidance": self.guidance,
+            "prefix_tokens": prefix_tokens,
+            "prefix_cacheable": prefix_tokens >= PROMPT_CACHE_MIN_TOKENS
+        }
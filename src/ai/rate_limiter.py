@@ -0,0 +1,133 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+class TokenBucket:
+    """Token bucket rate limiter shared by threads, asyncio tasks and processes.
+
+    Callers reserve tokens up front: the bucket may go negative, and each caller
+    sleeps until its own reservation is covered. When `state_file` is set the
+    bucket level lives in that file under an exclusive lock, so every process on
+    the host draws from the same budget.
+    """
+
+    def __init__(self, rate: float, capacity: float, state_file: Optional[str] = None):
+        if rate <= 0:
+            raise ValueError("Token bucket rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(max(capacity, 1))
+        self.state_file = state_file
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._updated = time.time()
+
+        if state_file:
+            directory = os.path.dirname(state_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def _locked_state(self):
+        """Yield the bucket state dict, persisting it when a state file is used"""
+        with self._lock:
+            if not self.state_file:
+                state = {"tokens": self._tokens, "updated": self._updated}
+                yield state
+                self._tokens, self._updated = state["tokens"], state["updated"]
+                return
+
+            with open(self.state_file, "a+") as f:
+                self._lock_file(f)
+                try:
+                    f.seek(0)
+                    try:
+                        state = json.loads(f.read() or "{}")
+                    except json.JSONDecodeError:
+                        state = {}
+                    state.setdefault("tokens", self.capacity)
+                    state.setdefault("updated", time.time())
+                    yield state
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps({"tokens": state["tokens"], "updated": state["updated"]}))
+                    f.flush()
+                finally:
+                    self._unlock_file(f)
+
+    @staticmethod
+    def _lock_file(f):
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+    @staticmethod
+    def _unlock_file(f):
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _refill(self, state: Dict[str, float], now: float):
+        elapsed = max(0.0, now - state["updated"])
+        state["tokens"] = min(self.capacity, state["tokens"] + elapsed * self.rate)
+        state["updated"] = now
+
+    def reserve(self, amount: float = 1) -> float:
+        """Reserve tokens and return how many seconds the caller must wait"""
+        with self._locked_state() as state:
+            self._refill(state, time.time())
+            state["tokens"] -= amount
+            deficit = -state["tokens"]
+        return deficit / self.rate if deficit > 0 else 0.0
+
+    def acquire(self, amount: float = 1) -> float:
+        """Block until `amount` tokens are available; returns the time waited"""
+        wait = self.reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, amount: float = 1) -> float:
+        """Asyncio variant of acquire()"""
+        wait = self.reserve(amount)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def adjust(self, amount: float):
+        """Return (positive) or charge (negative) tokens after the fact"""
+        with self._locked_state() as state:
+            self._refill(state, time.time())
+            state["tokens"] = min(self.capacity, state["tokens"] + amount)
+
+    def available(self) -> float:
+        """Current token level (negative while reservations are outstanding)"""
+        with self._locked_state() as state:
+            self._refill(state, time.time())
+            return state["tokens"]
+
+
+_shared_buckets: Dict[str, TokenBucket] = {}
+_shared_lock = threading.Lock()
+
+def get_shared_bucket(name: str, rate: float, capacity: float, state_file: Optional[str] = None) -> TokenBucket:
+    """Get the process-wide bucket for `name`, creating it on first use"""
+    with _shared_lock:
+        bucket = _shared_buckets.get(name)
+        if bucket is None or bucket.rate != rate or bucket.capacity != max(capacity, 1) or bucket.state_file != state_file:
+            bucket = TokenBucket(rate, capacity, state_file)
+            _shared_buckets[name] = bucket
+        return bucket
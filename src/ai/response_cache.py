@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+class ResponseCache:
+    """SQLite-backed cache of raw completions keyed by prompt fingerprint.
+
+    Policies:
+        use       - read hits and store misses (default)
+        read-only - read hits, never write
+        refresh   - ignore existing entries and overwrite them
+        bypass    - do not touch the cache at all
+    """
+
+    POLICIES = ["use", "read-only", "refresh", "bypass"]
+
+    # Run eviction once every this many writes rather than on every put
+    EVICTION_INTERVAL = 100
+
+    def __init__(self, db_path: str, policy: str = "use", max_entries: int = 100000,
+                 max_age_days: float = 30):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Invalid cache policy: {policy} (expected one of {', '.join(self.POLICIES)})")
+
+        self.db_path = db_path
+        self.policy = policy
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+
+        if policy != "bypass":
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.init_database()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def init_database(self):
+        """Initialize cache table"""
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS llm_response_cache (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_accessed REAL NOT NULL,
+                    hit_count INTEGER DEFAULT 0
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_last_accessed ON llm_response_cache (last_accessed)')
+            conn.commit()
+
+    @staticmethod
+    def fingerprint(messages: List[Dict[str, str]], model: str, temperature: float,
+                    max_tokens: int, **params: Any) -> str:
+        """Hash everything that determines the completion"""
+        payload = {
+            "messages": messages,
+            "model": model,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        payload.update(params)
+        encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    @property
+    def readable(self) -> bool:
+        return self.policy in ("use", "read-only")
+
+    @property
+    def writable(self) -> bool:
+        return self.policy in ("use", "refresh")
+
+    def get(self, key: str) -> Optional[str]:
+        """Look up a cached response; returns None on a miss"""
+        if not self.readable:
+            return None
+
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT response, created_at FROM llm_response_cache WHERE key = ?', (key,)
+            ).fetchone()
+
+            if row and now - row[1] <= self.max_age_seconds:
+                if self.policy == "use":
+                    conn.execute(
+                        'UPDATE llm_response_cache SET last_accessed = ?, hit_count = hit_count + 1 WHERE key = ?',
+                        (now, key)
+                    )
+                    conn.commit()
+                with self._lock:
+                    self.hits += 1
+                return row[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, response: str, model: str):
+        """Store a response under its fingerprint"""
+        if not self.writable:
+            return
+
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO llm_response_cache
+                (key, model, response, created_at, last_accessed, hit_count)
+                VALUES (?, ?, ?, ?, ?, 0)
+            ''', (key, model, response, now, now))
+            conn.commit()
+
+        with self._lock:
+            self.writes += 1
+            run_eviction = self.writes % self.EVICTION_INTERVAL == 0
+
+        if run_eviction:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries, then the least recently used beyond max_entries"""
+        if self.policy == "bypass":
+            return 0
+
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'DELETE FROM llm_response_cache WHERE created_at < ?',
+                (time.time() - self.max_age_seconds,)
+            )
+            removed = cursor.rowcount
+            cursor.execute('''
+                DELETE FROM llm_response_cache WHERE key IN (
+                    SELECT key FROM llm_response_cache
+                    ORDER BY last_accessed DESC
+                    LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_entries,))
+            removed += cursor.rowcount
+            conn.commit()
+            return removed
+
+    def count_entries(self) -> int:
+        """Count cached responses"""
+        if self.policy == "bypass":
+            return 0
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM llm_response_cache').fetchone()[0]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters for this cache instance"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "policy": self.policy,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "hit_rate": round(self.hits / lookups * 100, 1) if lookups else 0.0
+            }
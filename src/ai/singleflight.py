@@ -0,0 +1,128 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+class _Call:
+    """One upstream call that concurrent callers with the same key wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into a single upstream call.
+
+    The first caller (the leader) runs the function; callers arriving while it
+    is in flight wait for its result instead of issuing their own. Nothing is
+    remembered once the call finishes; that is the response cache's job.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._futures: Dict[Tuple[int, str], asyncio.Future] = {}
+        self.leaders = 0
+        self.suppressed = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run fn() once per key at a time; returns (result, shared)"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+            else:
+                self.suppressed += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Asyncio variant of do(); coalesces callers on the same event loop.
+
+        A cancelled leader (say, the losing side of a hedge) doesn't pass its
+        cancellation on: the first waiting follower re-issues the call.
+        """
+        loop = asyncio.get_running_loop()
+        future_key = (id(loop), key)
+        waited = False
+
+        while True:
+            with self._lock:
+                future = self._futures.get(future_key)
+                if future is None:
+                    future = self._futures[future_key] = loop.create_future()
+                    self.leaders += 1
+                    if waited:
+                        # Taking the call over: this caller's duplicate wasn't suppressed after all
+                        self.suppressed -= 1
+                    leader = True
+                else:
+                    if not waited:
+                        self.suppressed += 1
+                    leader = False
+
+            if leader:
+                break
+            waited = True
+            try:
+                # Shielded so a cancelled follower doesn't cancel everyone else's result
+                return await asyncio.shield(future), True
+            except asyncio.CancelledError:
+                # The leader was cancelled rather than this caller; go round and take over
+                if not future.cancelled():
+                    raise
+
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody was waiting
+            raise
+        finally:
+            with self._lock:
+                del self._futures[future_key]
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "upstream_calls": self.leaders,
+                "duplicates_suppressed": self.suppressed,
+                "in_flight": len(self._calls) + len(self._futures)
+            }
+
+
+_shared_singleflight: Optional[SingleFlight] = None
+_shared_lock = threading.Lock()
+
+def get_shared_singleflight() -> SingleFlight:
+    """Get the process-wide request coalescer, creating it on first use"""
+    global _shared_singleflight
+
+    with _shared_lock:
+        if _shared_singleflight is None:
+            _shared_singleflight = SingleFlight()
+        return _shared_singleflight
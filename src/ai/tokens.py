@@ -0,0 +1,61 @@
+import math
+from functools import lru_cache
+from typing import Dict, List
+
+# Heuristic for English prose; good enough to admit requests against a TPM
+# budget, which is reconciled with the real usage once the response arrives
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+
+def estimate_text_tokens(text: str) -> int:
+    """Estimate the token count of a piece of text"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def estimate_prompt_tokens(messages: List[Dict[str, str]]) -> int:
+    """Estimate prompt tokens for a list of chat messages"""
+    total = REPLY_PRIMING_TOKENS
+    for message in messages:
+        total += MESSAGE_OVERHEAD_TOKENS + estimate_text_tokens(message.get("content") or "")
+    return total
+
+def estimate_request_tokens(messages: List[Dict[str, str]], max_tokens: int) -> int:
+    """Estimate the TPM cost of a request: prompt plus the completion allowance"""
+    return estimate_prompt_tokens(messages) + max_tokens
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    """tiktoken encoding for a model, or None when tiktoken (or its data) isn't available"""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+def exact_token_counts(model: str) -> bool:
+    """False when counts for this model fall back to the chars-per-token heuristic"""
+    return _encoding(model) is not None
+
+def tokenizer_name(model: str) -> str:
+    """Which counter count_text_tokens uses for a model"""
+    encoding = _encoding(model)
+    return f"tiktoken/{encoding.name}" if encoding else f"heuristic ({CHARS_PER_TOKEN} chars/token)"
+
+def count_text_tokens(text: str, model: str) -> int:
+    """Exact token count with the model's tokenizer; falls back to the estimate without tiktoken"""
+    encoding = _encoding(model)
+    if encoding is None:
+        return estimate_text_tokens(text)
+    return len(encoding.encode(text)) if text else 0
+
+def count_prompt_tokens(messages: List[Dict[str, str]], model: str) -> int:
+    """Prompt tokens for a list of chat messages, as billed"""
+    total = REPLY_PRIMING_TOKENS
+    for message in messages:
+        total += MESSAGE_OVERHEAD_TOKENS + count_text_tokens(message.get("content") or "", model)
+    return total
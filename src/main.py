@@ -16,10 +16,13 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from config.settings import Settings
 from personas import PersonaGenerator, PersonaDatabase, PersonaImporter
-from survey import SurveyEngine
+from survey import (SurveyEngine, AsyncSurveyEngine, BatchSurveyRunner, PackedSurveyRunner, SurveyEstimator,
+                    SurveyQuestions, SurveyScheduler, SurveyTaskQueue, enqueue_survey, parse_deadline)
+from survey.worker import run_worker_process
 from data import DataExporter
 from ai import GPTClient
-from research import ResearchArchiver
+from ai.ledger import CallLedger
+from research import ResearchArchiver, ShardManager
 
 def setup_environment():
     """Setup and validate environment"""
@@ -172,8 +175,11 @@ def create_manual_persona():
         print(f"✗ Failed to create persona: {e}")
         return None
 
-def run_survey(personas_limit: int = None, test_mode: bool = False):
-    """Run survey for all personas"""
+def run_survey(personas_limit: int = None, test_mode: bool = False, concurrency: int = None,
+               batch: bool = False, batch_id: str = None, batch_results: str = None,
+               page_size: int = None, pack_size: int = None, replicates: int = None, resume: str = None,
+               question_concurrency: int = None, budget: float = None, deadline: datetime = None):
+    """Run survey for all personas (or finish an interrupted run), optionally within a budget or by a deadline"""
     print(f"\n{'Testing survey' if test_mode else 'Running survey'}...")
     
     # Load personas from database
@@ -184,12 +190,45 @@ def run_survey(personas_limit: int = None, test_mode: bool = False):
         print("✗ No personas found in database. Generate personas first.")
         return None
     
-    if personas_limit:
+    survey_file = Settings.SURVEY_FILE
+    if resume:
+        run = database.get_survey_run(resume)
+        if run is None:
+            print(f"✗ Unknown survey run: {resume}")
+            return None
+        if batch or batch_id:
+            print("✗ Batch runs are resumed with --batch-id")
+            return None
+        # The run's own personas and survey file, whatever --limit says
+        by_id = {persona.id: persona for persona in personas}
+        personas = [by_id[persona_id] for persona_id in run["persona_ids"] if persona_id in by_id]
+        survey_file = run["survey_file"]
+        print(f"Resuming run {resume} ({run['status']}, {len(personas)} personas)")
+    elif personas_limit:
         personas = personas[:personas_limit]
         print(f"Limited to first {len(personas)} personas")
     
-    # Initialize survey engine
-    engine = SurveyEngine(Settings.SURVEY_FILE, Settings.DATABASE_PATH)
+    # Initialize survey engine (a budget or deadline schedules personas itself, up to --concurrency at once;
+    # batch and packed runs call the client synchronously, so they always use the sync engine)
+    scheduled = budget is not None or deadline is not None
+    batched = bool(batch or batch_id or batch_results)
+    if scheduled and (batched or pack_size):
+        print("✗ --budget and --deadline schedule live requests per persona; "
+              "they can't be combined with --batch or --pack-size")
+        return None
+    if pack_size and concurrency and concurrency > 1:
+        print("⚠️  --concurrency does not apply to packed runs; personas are packed into shared requests instead")
+    async_run = concurrency and concurrency > 1 and not scheduled and not batched and not pack_size
+    if async_run and question_concurrency and question_concurrency > 1:
+        print("✗ --question-concurrency applies to the serial engine and can't be combined with --concurrency; "
+              "use one or the other (or add --budget/--deadline, whose scheduler runs both)")
+        return None
+    if async_run:
+        engine = AsyncSurveyEngine(survey_file, Settings.DATABASE_PATH, concurrency=concurrency,
+                                   page_size=page_size, replicates=replicates, run_id=resume)
+    else:
+        engine = SurveyEngine(survey_file, Settings.DATABASE_PATH, page_size=page_size,
+                              replicates=replicates, run_id=resume, question_concurrency=question_concurrency)
     
     if test_mode:
         # Test with first persona only
@@ -197,6 +236,293 @@ def run_survey(personas_limit: int = None, test_mode: bool = False):
         result = engine.test_single_persona(test_persona, question_limit=3)
         print(f"✓ Test completed for {test_persona.id}")
         return [result]
+    elif batched:
+        # Run full survey through the Batch API
+        try:
+            runner = BatchSurveyRunner(engine, Settings.BATCH_DIR)
+        except ValueError as e:
+            print(f"✗ {e}")
+            return None
+        results = runner.run(personas, batch_id=batch_id, results_path=batch_results,
+                             poll_interval=Settings.BATCH_POLL_INTERVAL)
+        
+        stats = engine.get_survey_statistics(results)
+        print(f"\n✓ Batch survey ingested!")
+        print(f"  Personas: {stats['total_personas']}")
+        print(f"  Response rate: {stats['response_rate']:.1f}%")
+        
+        return results
+    elif pack_size:
+        # Pack closed questions for several personas into each request
+        runner = PackedSurveyRunner(engine, pack_size)
+        
+        def progress_callback(persona_idx, total_personas, persona_id, question_num, total_questions):
+            if persona_idx == 1:
+                print(f"  Question {question_num}/{total_questions}")
+        
+        results = runner.run(personas, progress_callback)
+        
+        stats = engine.get_survey_statistics(results)
+        print(f"\n✓ Packed survey completed!")
+        print(f"  Success rate: {stats['success_rate']:.1f}%")
+        print(f"  Wall-clock time: {stats['wall_clock_seconds']:.1f} seconds")
+        print(f"  Packed requests: {runner.stats['packed_requests']}, "
+              f"answers: {runner.stats['packed_answers']}, "
+              f"asked individually: {runner.stats['fallback_answers']}")
+        
+        return results
+    else:
+        # Run full survey
+        def progress_callback(persona_idx, total_personas, persona_id, question_num, total_questions):
+            print(f"  [{persona_idx}/{total_personas}] {persona_id}: Question {question_num}/{total_questions}")
+        
+        scheduler = None
+        if scheduled:
+            try:
+                scheduler = SurveyScheduler(engine, budget_usd=budget, deadline=deadline, max_concurrency=concurrency)
+            except ValueError as e:
+                print(f"✗ {e}")
+                return None
+            results = scheduler.run(personas)
+        else:
+            results = engine.run_survey_for_all_personas(personas, progress_callback)
+        
+        # Show statistics
+        stats = engine.get_survey_statistics(results)
+        if scheduler and scheduler.stop_reason:
+            print(f"\n✓ Survey stopped within its {scheduler.stop_reason}: {len(results)} personas surveyed, "
+                  f"{scheduler.skipped} left for --resume {engine.survey_id}")
+        else:
+            print(f"\n✓ Survey completed!")
+        if scheduler:
+            print(f"  Spent: ${scheduler.spent():.4f}"
+                  f"{f' of ${budget:.2f} budget' if budget is not None else ''}")
+        print(f"  Success rate: {stats['success_rate']:.1f}%")
+        print(f"  Total time: {stats['total_time_seconds']:.1f} seconds")
+        print(f"  Wall-clock time: {stats['wall_clock_seconds']:.1f} seconds")
+        print(f"  Average per persona: {stats['average_time_per_persona']:.1f} seconds")
+        if "resume" in stats:
+            print(f"  Resumed: {stats['resume']['personas_skipped']} personas already done, "
+                  f"{stats['resume']['answers_restored']} stored answers reused")
+        if stats["ledger"] and stats["ledger"]["cost_usd"] is not None:
+            print(f"  API cost: ${stats['ledger']['cost_usd']:.4f} over {stats['ledger']['calls']} calls "
+                  f"(${stats['ledger']['cost_usd'] / max(stats['ledger']['personas'], 1):.4f} per persona)")
+        print(f"  Cache: {stats['cache']['hits']} hits, {stats['cache']['misses']} misses ({stats['cache']['policy']})")
+        print(f"  Concurrency window: {stats['concurrency']['window']} "
+              f"(peak {stats['concurrency']['peak_window']}, {stats['concurrency']['throttle_events']} throttles)")
+        print(f"  Connections: {stats['http_pool']['new_connections']} opened, "
+              f"{stats['http_pool']['connection_reuse_rate']:.1f}% of requests reused one")
+        if stats["token_usage"]["prompt_tokens"]:
+            print(f"  Prompt cache: {stats['token_usage']['cached_prompt_rate']:.0f}% of prompt tokens cached "
+                  f"({stats['prompts']['layout']} layout, shared prefix ~{stats['prompts']['prefix_tokens']} tokens)")
+        if stats["generation"]["requests"]:
+            print(f"  Completion budgets: {stats['generation']['reserved_tokens_saved']:,} fewer tokens reserved than a flat "
+                  f"{Settings.MAX_TOKENS} per call ({stats['generation']['reserved_saving_rate']:.0f}%), "
+                  f"{stats['generation']['truncated']} answers cut off")
+        if "replicates" in stats and stats["replicates"]["mean_agreement"] is not None:
+            print(f"  Replicates: {stats['replicates']['per_question']} per question, "
+                  f"mean agreement {stats['replicates']['mean_agreement'] * 100:.0f}%")
+        if "scale_distributions" in stats:
+            print(f"  Scale answers with a logprob distribution: {stats['scale_distributions']}")
+        if len(stats["endpoints"]) > 1:
+            for name, endpoint in stats["endpoints"].items():
+                print(f"  Endpoint {name}: {endpoint['requests']} requests ({endpoint['share']:.0f}%), "
+                      f"{endpoint['throttles']} throttled, circuit {endpoint['circuit']}")
+        if stats["circuit"]["times_opened"]:
+            print(f"  API outages: circuit opened {stats['circuit']['times_opened']} times, "
+                  f"survey paused {stats['circuit']['paused_seconds']:.0f} seconds")
+        if stats["coalescing"]["duplicates_suppressed"]:
+            print(f"  Duplicate in-flight requests coalesced: {stats['coalescing']['duplicates_suppressed']}")
+        if "paging" in stats:
+            print(f"  Paged requests: {stats['paging']['page_requests']}, "
+                  f"re-asked individually: {stats['paging']['reasked']}")
+        if "hedging" in stats:
+            print(f"  Hedges: {stats['hedging']['hedges_issued']} issued, {stats['hedging']['hedges_won']} won, "
+                  f"{stats['hedging']['latency_saved_seconds']:.1f} seconds of tail latency saved")
+        
+        return results
+
+def enqueue_survey_run(personas_limit: int = None, replicates: int = None, resume: str = None):
+    """Queue a survey run for worker processes and return without waiting"""
+    print("\nQueueing survey...")
+    
+    database = PersonaDatabase(Settings.DATABASE_PATH)
+    personas = database.get_all_personas()
+    
+    if not personas:
+        print("✗ No personas found in database. Generate personas first.")
+        return None
+    
+    survey_file = Settings.SURVEY_FILE
+    if resume:
+        run = database.get_survey_run(resume)
+        if run is None:
+            print(f"✗ Unknown survey run: {resume}")
+            return None
+        by_id = {persona.id: persona for persona in personas}
+        personas = [by_id[persona_id] for persona_id in run["persona_ids"] if persona_id in by_id]
+        survey_file = run["survey_file"]
+    elif personas_limit:
+        personas = personas[:personas_limit]
+    
+    engine = SurveyEngine(survey_file, Settings.DATABASE_PATH, replicates=replicates, run_id=resume)
+    counts = enqueue_survey(engine, personas)
+    print(f"✓ Queued {counts['added']} new tasks for {len(personas)} personas as run {engine.survey_id}")
+    if counts["requeued"]:
+        print(f"  {counts['requeued']} failed tasks queued again")
+    print("  Start workers with: python src/main.py worker --processes N")
+    return engine.survey_id
+
+def run_workers(processes: int = 1, follow: bool = False):
+    """Answer queued survey tasks with one or more worker processes"""
+    import multiprocessing
+    
+    queue = SurveyTaskQueue(Settings.DATABASE_PATH, wal=True)
+    print(f"\nStarting {processes} worker{'s' if processes > 1 else ''} "
+          f"({queue.open_tasks()} open tasks{', waiting for more' if follow else ''})...")
+    
+    if processes <= 1:
+        run_worker_process(Settings.DATABASE_PATH, drain=not follow)
+    else:
+        workers = [multiprocessing.Process(target=run_worker_process, args=(Settings.DATABASE_PATH, not follow))
+                   for _ in range(processes)]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            # Leases of interrupted workers expire and their tasks go back to the queue
+            for worker in workers:
+                worker.terminate()
+    
+    for survey_id, counts in queue.progress().items():
+        print(f"  {survey_id}: {counts['done']} done, {counts['pending'] + counts['leased']} open, "
+              f"{counts['failed']} failed")
+
+def shard_panel(shard_count: int, shard_dir: str = None, replicates: int = None, page_size: int = None):
+    """Split the personas into shard databases that independent nodes can survey"""
+    print(f"\nSharding personas into {shard_count} databases...")
+    
+    try:
+        manager = ShardManager(Settings.DATABASE_PATH, shard_dir)
+        # Every node answers with the same options, taken from the run config on --resume
+        config = {"page_size": page_size, "replicates": replicates, "scale_logprobs": Settings.SCALE_LOGPROBS}
+        manifest = manager.partition(shard_count, config=config)
+    except Exception as e:
+        print(f"✗ Sharding failed: {e}")
+        return None
+    
+    print(f"  Run ID: {manifest['run_id']}")
+    print("  On each node: DATABASE_PATH=<shard.db> python src/main.py survey --resume " + manifest["run_id"])
+    print(f"  Then copy the shard files back to {manager.shards_dir} and run: python src/main.py merge-shards")
+    return manifest
+
+def merge_shards(shard_dir: str = None):
+    """Fold the shard databases' survey results back into the main database"""
+    print("\nMerging shards...")
+    
+    try:
+        report = ShardManager(Settings.DATABASE_PATH, shard_dir).merge()
+    except Exception as e:
+        print(f"✗ Merge failed: {e}")
+        return None
+    
+    print(f"  Run {report['run_id']}: {report['history_added']} history entries, "
+          f"{report['calls_added']} ledger rows, {report['personas_added']} new personas")
+    if report["missing_shards"]:
+        print(f"  Missing shards (merge again once they arrive): {', '.join(report['missing_shards'])}")
+    if report["conflicts"]:
+        print(f"  ⚠️  {len(report['conflicts'])} conflicts; the main database was kept for these:")
+        for conflict in report["conflicts"][:10]:
+            print(f"    {conflict}")
+    return report
+
+def estimate_survey(personas_limit: int = None, test_mode: bool = False, concurrency: int = None,
+                    pack_size: int = None, replicates: int = None):
+    """Predict cost and duration of a survey run in each engine mode (no API calls)"""
+    print(f"\nEstimating {'test survey' if test_mode else 'survey'}...")
+    
+    database = PersonaDatabase(Settings.DATABASE_PATH)
+    personas = database.get_all_personas()
+    
+    if not personas:
+        print("✗ No personas found in database. Generate personas first.")
+        return None
+    
+    personas = personas[:1] if test_mode else personas[:personas_limit] if personas_limit else personas
+    questions = SurveyQuestions(Settings.SURVEY_FILE).get_questions()
+    
+    # Past runs in the call ledger calibrate answer lengths and latency
+    ledger = CallLedger(Settings.DATABASE_PATH) if Settings.LLM_LEDGER_ENABLED else None
+    estimator = SurveyEstimator(questions, ledger=ledger, replicates=replicates,
+                                question_limit=3 if test_mode else None)
+    estimate = estimator.estimate_all(personas, concurrency=concurrency, pack_size=pack_size)
+    
+    print(f"  {estimate['personas']} personas x {estimate['questions']} questions on {estimate['model']} "
+          f"(tokens counted with {estimate['tokenizer']})")
+    if estimate["approximate"]:
+        print("  ⚠️  tiktoken isn't installed, so token counts and costs are approximate "
+              "(pip install tiktoken for exact counts)")
+    print(f"  Limits: {estimate['requests_per_second']:g} requests/s, {estimate['tokens_per_minute']:,} tokens/min"
+          f"{'; calibrated from past runs' if estimate['calibrated'] else ''}")
+    for mode, row in estimate["modes"].items():
+        cost = (f"{'~' if estimate['approximate'] else ''}${row['cost_usd']:.2f}" if row["cost_usd"] is not None
+                else "unknown price")
+        print(f"  {mode:>7}: {row['requests']:>6} requests, {row['prompt_tokens']:,} prompt tokens "
+              f"({row['cached_tokens']:,} cached), {row['completion_tokens']:,} completion tokens, {cost}, "
+              f"{SurveyEstimator.format_duration(row['duration_seconds'])} (bound by {row['bottleneck']})")
+    
+    return estimate
+
+def check_packing_consistency(sample_size: int, pack_size: int = None):
+    """Compare packed and unpacked answers on a random sample of personas"""
+    import random
+    
+    print(f"\nChecking packed vs unpacked answers on {sample_size} personas...")
+    
+    database = PersonaDatabase(Settings.DATABASE_PATH)
+    personas = database.get_all_personas()
+    
+    if not personas:
+        print("✗ No personas found in database. Generate personas first.")
+        return None
+    
+    sample = random.sample(personas, min(sample_size, len(personas)))
+    engine = SurveyEngine(Settings.SURVEY_FILE, Settings.DATABASE_PATH)
+    report = PackedSurveyRunner(engine, pack_size).consistency_check(sample)
+    
+    print(f"✓ Compared {report['answers_compared']} answers (pack size {report['pack_size']})")
+    print(f"  Overall agreement: {report['agreement_rate']}%")
+    for question_number, result in report["questions"].items():
+        line = f"  Q{question_number} ({result['type']}): {result['agreement_rate']}% agreement"
+        if result["mean_abs_difference"] is not None:
+            line += f", mean |difference| {result['mean_abs_difference']}"
+        print(line)
+    
+    return report
+
+def run_mock_server(port: int = None, latency_ms: float = 200, latency_sigma: float = 0.5,
+                    rate_429: float = 0.0, rate_500: float = 0.0, seed: int = 42):
+    """Serve a local mock of the OpenAI API for offline load tests"""
+    from ai.mock_server import MockOpenAIServer
+    
+    server = MockOpenAIServer(port=port or Settings.MOCK_SERVER_PORT, latency_ms=latency_ms,
+                              latency_sigma=latency_sigma, rate_429=rate_429, rate_500=rate_500, seed=seed)
+    print(f"✓ Mock OpenAI server listening on {server.base_url}")
+    print(f"  Latency: log-normal, median {latency_ms:.0f} ms, sigma {latency_sigma}")
+    print(f"  429 rate: {rate_429:.0%}, 503 rate: {rate_500:.0%}")
+    print(f"  Use it with: OPENAI_BASE_URL={server.base_url} OPENAI_API_KEY=mock python src/main.py survey")
+    
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(f"\nServed {server.stats['chat_requests']} chat requests "
+              f"({server.stats['throttled']} throttled)")
+
 def archive_research(research_name: str, description: str = ""):
     """Archive current research data"""
     print(f"\nArchiving research: {research_name}")
@@ -314,21 +640,6 @@ def restore_research_archive(archive_name: str, confirm: bool = False):
     except Exception as e:
         print(f"✗ Restore failed: {e}")
         return None
-    else:
-        # Run full survey
-        def progress_callback(persona_idx, total_personas, persona_id, question_num, total_questions):
-            print(f"  [{persona_idx}/{total_personas}] {persona_id}: Question {question_num}/{total_questions}")
-        
-        results = engine.run_survey_for_all_personas(personas, progress_callback)
-        
-        # Show statistics
-        stats = engine.get_survey_statistics(results)
-        print(f"\n✓ Survey completed!")
-        print(f"  Success rate: {stats['success_rate']:.1f}%")
-        print(f"  Total time: {stats['total_time_seconds']:.1f} seconds")
-        print(f"  Average per persona: {stats['average_time_per_persona']:.1f} seconds")
-        
-        return results
 
 def export_data(personas_limit: int = None):
     """Export all data in multiple formats"""
@@ -394,6 +705,20 @@ def show_status():
         print(f"Exported persona files: {persona_files}")
     else:
         print("Output directory: Not created")
+    
+    # Queued work for survey workers
+    for survey_id, counts in SurveyTaskQueue(Settings.DATABASE_PATH).progress().items():
+        if counts["pending"] + counts["leased"]:
+            print(f"Queued run {survey_id}: {counts['pending']} pending, {counts['leased']} in progress, "
+                  f"{counts['done']} done, {counts['failed']} failed")
+    
+    # Survey runs that can be resumed
+    unfinished = [run for run in database.get_survey_runs() if run["status"] != "completed"]
+    if unfinished:
+        print("Unfinished survey runs (resume with: survey --resume RUN_ID):")
+        for run in unfinished[:5]:
+            print(f"  {run['survey_id']}: {run['status']}, started {run['started_at']}, "
+                  f"{len(run['persona_ids'])} personas")
 
 def main():
     """Main application entry point"""
@@ -401,7 +726,8 @@ def main():
     parser.add_argument("command", choices=[
         "setup", "test-api", "generate", "survey", "test-survey", "export", "status", "full-run",
         "import-csv", "import-json", "create-template", "create-persona",
-        "archive-research", "clear-research", "archive-and-clear", "list-archives", "restore-archive"
+        "archive-research", "clear-research", "archive-and-clear", "list-archives", "restore-archive",
+        "mock-server", "worker", "shard", "merge-shards"
     ], help="Command to execute")
     
     parser.add_argument("--count", type=int, default=10, help="Number of personas to generate")
@@ -412,9 +738,66 @@ def main():
     parser.add_argument("--name", type=str, help="Research name for archive operations")
     parser.add_argument("--description", type=str, default="", help="Description for research archive")
     parser.add_argument("--confirm", action="store_true", help="Confirm destructive operations")
+    parser.add_argument("--concurrency", type=int,
+                        help="Survey this many personas concurrently (async engine; the scheduler's maximum "
+                             "with --budget/--deadline)")
+    parser.add_argument("--question-concurrency", type=int,
+                        help="Ask this many of a persona's questions at once (serial engine)")
+    parser.add_argument("--budget", type=float, metavar="USD",
+                        help="Stop cleanly before the survey's API spend would exceed this many dollars")
+    parser.add_argument("--deadline", type=str,
+                        help="Stop cleanly before this time (09:00, 90m, 2h or an ISO date and time)")
+    parser.add_argument("--page-size", type=int,
+                        help="Answer this many questions per request as JSON (0 = whole survey in one request)")
+    parser.add_argument("--pack-size", type=int,
+                        help="Answer closed questions for this many personas per request")
+    parser.add_argument("--pack-check", type=int,
+                        help="Compare packed vs unpacked answers on this many sampled personas (nothing is stored)")
+    parser.add_argument("--batch", action="store_true", help="Run the survey through the OpenAI Batch API")
+    parser.add_argument("--batch-id", type=str, help="Resume waiting on an already submitted batch")
+    parser.add_argument("--batch-results", type=str, help="Ingest a Batch API results file")
+    parser.add_argument("--cache-policy", choices=["use", "read-only", "refresh", "bypass"],
+                        help="Response cache policy for survey runs (default: use)")
+    parser.add_argument("--independent-samples", action="store_true",
+                        help="Give every call its own sample: no coalescing or cache reuse (temperature > 0)")
+    parser.add_argument("--replicates", type=int,
+                        help="Sampled answers per question, from one request each (API n parameter)")
+    parser.add_argument("--scale-logprobs", action="store_true",
+                        help="Answer scale questions with the full option distribution from one call's logprobs")
+    parser.add_argument("--enqueue", action="store_true",
+                        help="Queue the survey for worker processes instead of running it here")
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes to start (worker command)")
+    parser.add_argument("--follow", action="store_true",
+                        help="Keep workers waiting for new tasks instead of exiting when the queue is empty")
+    parser.add_argument("--shards", type=int, default=2, help="Number of shard databases (shard command)")
+    parser.add_argument("--shard-dir", type=str, help=f"Directory of shard databases (default {Settings.SHARDS_DIR})")
+    parser.add_argument("--resume", type=str, metavar="RUN_ID",
+                        help="Finish an interrupted survey run, asking only questions without a stored answer")
+    parser.add_argument("--estimate", action="store_true",
+                        help="Predict the survey's cost and duration per engine mode without calling the API")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Duplicate requests that outlive the p95 latency; the first answer wins")
+    parser.add_argument("--port", type=int, help="Port for the mock server (default 8765)")
+    parser.add_argument("--latency-ms", type=float, default=200, help="Mock server median latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5,
+                        help="Mock server log-normal latency spread (0 = fixed latency)")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of mock requests answered with 429")
+    parser.add_argument("--rate-500", type=float, default=0.0, help="Fraction of mock requests answered with 503")
+    parser.add_argument("--seed", type=int, default=42, help="Mock server random seed")
     
     args = parser.parse_args()
     
+    if args.cache_policy:
+        Settings.RESPONSE_CACHE_POLICY = args.cache_policy
+    if args.hedge:
+        Settings.HEDGING_ENABLED = True
+    if args.scale_logprobs:
+        Settings.SCALE_LOGPROBS = True
+    if args.independent_samples:
+        Settings.INDEPENDENT_SAMPLES = True
+        if not args.cache_policy:
+            Settings.RESPONSE_CACHE_POLICY = "bypass"
+    
     print("=== Digital Persona Survey System ===")
     print(f"Command: {args.command}")
     print(f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -431,12 +814,50 @@ def main():
             generate_personas(args.count, args.balanced)
     
     elif args.command == "survey":
+        deadline = None
+        if args.deadline:
+            try:
+                deadline = parse_deadline(args.deadline)
+            except ValueError:
+                print(f"✗ Unrecognised deadline: {args.deadline} (use 09:00, 90m, 2h or 2025-01-31T09:00)")
+                return
+        if args.estimate:
+            estimate_survey(args.limit, concurrency=args.concurrency, pack_size=args.pack_size,
+                            replicates=args.replicates)
+        elif args.enqueue:
+            # Queueing makes no API calls; workers check the connection themselves
+            enqueue_survey_run(args.limit, replicates=args.replicates, resume=args.resume)
+        elif args.batch_results:
+            # Ingesting a results file makes no API calls
+            if setup_environment():
+                run_survey(args.limit, batch_results=args.batch_results)
+        elif setup_environment() and test_api_connection():
+            if args.pack_check:
+                check_packing_consistency(args.pack_check, args.pack_size)
+            else:
+                run_survey(args.limit, concurrency=args.concurrency,
+                           batch=args.batch, batch_id=args.batch_id,
+                           page_size=args.page_size, pack_size=args.pack_size,
+                           replicates=args.replicates, resume=args.resume,
+                           question_concurrency=args.question_concurrency,
+                           budget=args.budget, deadline=deadline)
+    
+    elif args.command == "worker":
         if setup_environment() and test_api_connection():
-            run_survey(args.limit)
+            run_workers(args.processes, follow=args.follow)
+    
+    elif args.command == "shard":
+        shard_panel(args.shards, args.shard_dir, replicates=args.replicates, page_size=args.page_size)
+    
+    elif args.command == "merge-shards":
+        merge_shards(args.shard_dir)
     
     elif args.command == "test-survey":
-        if setup_environment() and test_api_connection():
-            run_survey(args.limit, test_mode=True)
+        if args.estimate:
+            estimate_survey(test_mode=True)
+        elif setup_environment() and test_api_connection():
+            run_survey(args.limit, test_mode=True, concurrency=args.concurrency,
+                       question_concurrency=args.question_concurrency)
     
     elif args.command == "export":
         export_data(args.limit)
@@ -485,6 +906,9 @@ def main():
     elif args.command == "status":
         show_status()
     
+    elif args.command == "mock-server":
+        run_mock_server(args.port, args.latency_ms, args.latency_sigma, args.rate_429, args.rate_500, args.seed)
+    
     elif args.command == "full-run":
         print("\n=== Full Pipeline Run ===")
         if not setup_environment():
@@ -496,7 +920,8 @@ def main():
         personas = generate_personas(args.count, args.balanced)
         
         # Run survey
-        results = run_survey(args.limit)
+        results = run_survey(args.limit, concurrency=args.concurrency, page_size=args.page_size,
+                             replicates=args.replicates)
         if results:
             # Export data
             export_data(args.limit)
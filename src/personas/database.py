@@ -1,12 +1,20 @@
 import sqlite3
 import json
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 from .persona import Persona
 
 class PersonaDatabase:
     """SQLite database manager for personas"""
     
+    # Columns added after the first release; existing databases get them on open
+    SURVEY_RESPONSE_MIGRATIONS = {
+        "response_distribution": "TEXT",
+        "expected_value": "REAL",
+        "argmax": "TEXT",
+        "replicate_index": "INTEGER NOT NULL DEFAULT 0"
+    }
+    
     def __init__(self, db_path: str):
         self.db_path = db_path
         self.init_database()
@@ -48,19 +56,66 @@ class PersonaDatabase:
                 )
             ''')
             
+            self._migrate_survey_responses(cursor)
+            self._unique_survey_responses(cursor)
+            
+            # Create survey runs table (one row per survey_id, so interrupted runs can resume)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS survey_runs (
+                    survey_id TEXT PRIMARY KEY,
+                    survey_file TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    persona_ids TEXT NOT NULL,
+                    config TEXT,
+                    personas_completed INTEGER DEFAULT 0,
+                    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
             conn.commit()
     
+    def _migrate_survey_responses(self, cursor: sqlite3.Cursor):
+        """Add any survey_responses columns missing from an older database"""
+        cursor.execute('PRAGMA table_info(survey_responses)')
+        existing = {row[1] for row in cursor.fetchall()}
+        for column, column_type in self.SURVEY_RESPONSE_MIGRATIONS.items():
+            if column not in existing:
+                cursor.execute(f'ALTER TABLE survey_responses ADD COLUMN {column} {column_type}')
+    
+    def _unique_survey_responses(self, cursor: sqlite3.Cursor):
+        """One row per (persona, run, question, replicate): queue workers may deliver an answer twice"""
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_survey_responses_unique'")
+        if cursor.fetchone():
+            return
+        # Older databases may hold duplicates already; keep the first copy of each
+        cursor.execute('''
+            DELETE FROM survey_responses WHERE id NOT IN (
+                SELECT MIN(id) FROM survey_responses
+                GROUP BY persona_id, survey_id, question_number, replicate_index
+            )
+        ''')
+        cursor.execute('DROP INDEX IF EXISTS idx_survey_responses_key')
+        cursor.execute('''
+            CREATE UNIQUE INDEX idx_survey_responses_unique
+            ON survey_responses (persona_id, survey_id, question_number, replicate_index)
+        ''')
+    
     def save_persona(self, persona: Persona):
         """Save or update persona in database"""
+        self.save_personas([persona])
+    
+    def save_personas(self, personas: List[Persona]):
+        """Save or update many personas in one transaction"""
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             
-            cursor.execute('''
+            cursor.executemany('''
                 INSERT OR REPLACE INTO personas 
                 (id, role, department, gender, age_range, experience, location, 
                  team_size, response_history, created_at, last_updated)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
+            ''', [(
                 persona.id,
                 persona.role,
                 persona.department,
@@ -72,7 +127,7 @@ class PersonaDatabase:
                 json.dumps(persona.response_history),
                 persona.created_at.isoformat(),
                 persona.last_updated.isoformat()
-            ))
+            ) for persona in personas])
             
             conn.commit()
     
@@ -128,16 +183,24 @@ class PersonaDatabase:
     
     def save_survey_response(self, persona_id: str, survey_id: str, 
                            question_number: int, question_text: str, 
-                           response: str, response_type: str):
-        """Save individual survey response"""
+                           response: str, response_type: str,
+                           distribution: Optional[Dict[str, Any]] = None, replicate_index: int = 0):
+        """Save individual survey response (with its option distribution, for logprob scale answers).
+
+        A response already stored for the same question and replicate is kept.
+        """
+        distribution = distribution or {}
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             
             cursor.execute('''
-                INSERT INTO survey_responses 
-                (persona_id, survey_id, question_number, question_text, response, response_type)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (persona_id, survey_id, question_number, question_text, response, response_type))
+                INSERT OR IGNORE INTO survey_responses 
+                (persona_id, survey_id, question_number, question_text, response, response_type,
+                 response_distribution, expected_value, argmax, replicate_index)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (persona_id, survey_id, question_number, question_text, response, response_type,
+                  json.dumps(distribution["distribution"]) if distribution.get("distribution") else None,
+                  distribution.get("expected_value"), distribution.get("argmax"), replicate_index))
             
             conn.commit()
     
@@ -147,10 +210,11 @@ class PersonaDatabase:
             cursor = conn.cursor()
             
             cursor.execute('''
-                SELECT question_number, question_text, response, response_type, timestamp
+                SELECT question_number, question_text, response, response_type, timestamp,
+                       response_distribution, expected_value, argmax, replicate_index
                 FROM survey_responses 
                 WHERE persona_id = ? AND survey_id = ?
-                ORDER BY question_number
+                ORDER BY question_number, replicate_index
             ''', (persona_id, survey_id))
             
             rows = cursor.fetchall()
@@ -160,11 +224,79 @@ class PersonaDatabase:
                     "question_text": row[1],
                     "response": row[2],
                     "response_type": row[3],
-                    "timestamp": row[4]
+                    "timestamp": row[4],
+                    "distribution": json.loads(row[5]) if row[5] else None,
+                    "expected_value": row[6],
+                    "argmax": row[7],
+                    "replicate_index": row[8]
                 }
                 for row in rows
             ]
     
+    def get_stored_responses(self, survey_id: str, persona_id: str) -> Dict[int, List[dict]]:
+        """Responses already stored for a persona in a survey run, grouped by question number"""
+        stored: Dict[int, List[dict]] = {}
+        for row in self.get_survey_responses(persona_id, survey_id):
+            stored.setdefault(row["question_number"], []).append(row)
+        return stored
+    
+    def save_survey_run(self, survey_id: str, survey_file: str, persona_ids: List[str], config: Dict[str, Any],
+                        status: str = "running"):
+        """Register a survey run (or mark a resumed one as running again)"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT INTO survey_runs (survey_id, survey_file, status, persona_ids, config)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (survey_id) DO UPDATE SET status = excluded.status, updated_at = CURRENT_TIMESTAMP
+            ''', (survey_id, survey_file, status, json.dumps(persona_ids), json.dumps(config)))
+            
+            conn.commit()
+    
+    def update_survey_run(self, survey_id: str, status: str, personas_completed: int):
+        """Record a run's progress or final status"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                UPDATE survey_runs SET status = ?, personas_completed = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE survey_id = ?
+            ''', (status, personas_completed, survey_id))
+            
+            conn.commit()
+    
+    def get_survey_run(self, survey_id: str) -> Optional[dict]:
+        """Retrieve a survey run by ID"""
+        runs = [run for run in self.get_survey_runs() if run["survey_id"] == survey_id]
+        return runs[0] if runs else None
+    
+    def get_survey_runs(self) -> List[dict]:
+        """All survey runs, newest first"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT survey_id, survey_file, status, persona_ids, config, personas_completed,
+                       started_at, updated_at
+                FROM survey_runs
+                ORDER BY started_at DESC, survey_id DESC
+            ''')
+            
+            return [
+                {
+                    "survey_id": row[0],
+                    "survey_file": row[1],
+                    "status": row[2],
+                    "persona_ids": json.loads(row[3]),
+                    "config": json.loads(row[4] or '{}'),
+                    "personas_completed": row[5],
+                    "started_at": row[6],
+                    "updated_at": row[7]
+                }
+                for row in cursor.fetchall()
+            ]
+    
     def count_personas(self) -> int:
         """Count total personas in database"""
         with sqlite3.connect(self.db_path) as conn:
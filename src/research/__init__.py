@@ -1,3 +1,4 @@
 from .archive import ResearchArchiver
+from .sharding import ShardManager, ShardRing
 
-__all__ = ['ResearchArchiver']
\ No newline at end of file
+__all__ = ['ResearchArchiver', 'ShardManager', 'ShardRing']
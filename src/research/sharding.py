@@ -0,0 +1,238 @@
+import bisect
+import hashlib
+import json
+import os
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, List
+from personas import Persona, PersonaDatabase
+from ai.ledger import CallLedger
+from config.settings import Settings
+
+# Fields that identify a persona; a shard copy that differs in any of them is a conflict
+PERSONA_FIELDS = ["role", "department", "gender", "age_range", "experience", "location", "team_size"]
+
+# One stored answer: the same key in two databases must hold the same response
+RESPONSE_KEY = ["persona_id", "survey_id", "question_number", "replicate_index"]
+RESPONSE_COLUMNS = RESPONSE_KEY + ["question_text", "response", "response_type", "timestamp",
+                                   "response_distribution", "expected_value", "argmax"]
+
+# No id survives a copy between databases, so a ledger row is matched on when and for whom it was made
+CALL_KEY = ["created_at", "survey_id", "persona_id", "question_number", "kind"]
+
+
+class ShardRing:
+    """Consistent hash ring mapping persona IDs to shards.
+
+    Each shard owns SHARD_VIRTUAL_NODES points on the ring, so personas spread
+    evenly and adding a shard only moves about 1/N of them.
+    """
+
+    def __init__(self, shard_names: List[str], virtual_nodes: int = None):
+        virtual_nodes = virtual_nodes or Settings.SHARD_VIRTUAL_NODES
+        points = sorted((self._hash(f"{name}#{i}"), name) for name in shard_names for i in range(virtual_nodes))
+        self._hashes = [point[0] for point in points]
+        self._names = [point[1] for point in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:16], 16)
+
+    def shard_for(self, persona_id: str) -> str:
+        index = bisect.bisect(self._hashes, self._hash(persona_id)) % len(self._hashes)
+        return self._names[index]
+
+
+class ShardManager:
+    """Split the persona panel into shard databases and merge their survey results back.
+
+    Every shard is a complete survey database with its own personas and a copy
+    of one shared survey run, so a node runs it with
+    DATABASE_PATH=<shard> python src/main.py survey --resume <run_id>.
+    Merging is idempotent: answers and history entries already in the primary
+    database are skipped, and ones that disagree with it are reported as
+    conflicts instead of overwriting it.
+    """
+
+    MANIFEST_FILE = "manifest.json"
+
+    def __init__(self, database_path: str = None, shards_dir: str = None):
+        self.database_path = database_path or Settings.DATABASE_PATH
+        self.database = PersonaDatabase(self.database_path)
+        self.shards_dir = shards_dir or Settings.SHARDS_DIR
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.shards_dir, self.MANIFEST_FILE)
+
+    def load_manifest(self) -> Dict[str, Any]:
+        with open(self._manifest_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def partition(self, shard_count: int, survey_file: str = None, run_id: str = None,
+                  config: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Write one shard database per node and register the shared survey run in each"""
+        if shard_count < 1:
+            raise ValueError("Shard count must be at least 1")
+        if os.path.exists(self._manifest_path()):
+            raise FileExistsError(f"{self.shards_dir} already holds shards; merge them or choose another directory")
+
+        personas = self.database.get_all_personas()
+        if not personas:
+            raise ValueError("No personas found to shard")
+
+        names = [f"shard_{i:02d}" for i in range(shard_count)]
+        ring = ShardRing(names)
+        assignment: Dict[str, List[Persona]] = {name: [] for name in names}
+        for persona in personas:
+            assignment[ring.shard_for(persona.id)].append(persona)
+
+        survey_file = survey_file or Settings.SURVEY_FILE
+        run_id = run_id or f"ai_adoption_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        os.makedirs(self.shards_dir, exist_ok=True)
+
+        shards = []
+        for name in names:
+            shard_file = f"{name}.db"
+            shard_db = PersonaDatabase(os.path.join(self.shards_dir, shard_file))
+            shard_db.save_personas(assignment[name])
+            shard_db.save_survey_run(run_id, survey_file, [persona.id for persona in assignment[name]],
+                                     config or {}, status="pending")
+            shards.append({"name": name, "file": shard_file, "personas": len(assignment[name])})
+            print(f"  {name}: {len(assignment[name])} personas")
+
+        manifest = {
+            "run_id": run_id,
+            "survey_file": survey_file,
+            "primary_database": self.database_path,
+            "virtual_nodes": Settings.SHARD_VIRTUAL_NODES,
+            "created_at": datetime.now().isoformat(),
+            "shards": shards
+        }
+        with open(self._manifest_path(), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        print(f"✓ Split {len(personas)} personas into {shard_count} shards in {self.shards_dir}")
+        return manifest
+
+    def merge(self) -> Dict[str, Any]:
+        """Fold every finished shard's answers, history and ledger into the primary database"""
+        manifest = self.load_manifest()
+        # Make sure the primary has the ledger table before rows are copied into it
+        CallLedger(self.database_path)
+        primary = {persona.id: persona for persona in self.database.get_all_personas()}
+
+        report = {"run_id": manifest["run_id"], "shards_merged": 0, "missing_shards": [],
+                  "personas_added": 0, "history_added": 0, "responses_added": 0, "calls_added": 0,
+                  "conflicts": []}
+        for shard in manifest["shards"]:
+            shard_path = os.path.join(self.shards_dir, shard["file"])
+            if not os.path.exists(shard_path):
+                report["missing_shards"].append(shard["name"])
+                print(f"  {shard['name']}: missing, skipped")
+                continue
+            counts = self._merge_shard(shard["name"], shard_path, primary, report["conflicts"])
+            for key, value in counts.items():
+                report[key] += value
+            report["shards_merged"] += 1
+            print(f"  {shard['name']}: {counts['responses_added']} answers, {counts['history_added']} history entries")
+
+        self._merge_runs(manifest)
+        print(f"✓ Merged {report['shards_merged']} shards: {report['responses_added']} answers added, "
+              f"{len(report['conflicts'])} conflicts")
+        return report
+
+    def _merge_shard(self, name: str, shard_path: str, primary: Dict[str, Persona],
+                     conflicts: List[Dict[str, Any]]) -> Dict[str, int]:
+        counts = {"personas_added": 0, "history_added": 0, "responses_added": 0, "calls_added": 0}
+
+        changed = []
+        for persona in PersonaDatabase(shard_path).get_all_personas():
+            existing = primary.get(persona.id)
+            if existing is None:
+                primary[persona.id] = persona
+                changed.append(persona)
+                counts["personas_added"] += 1
+                counts["history_added"] += len(persona.response_history)
+                continue
+            if any(getattr(existing, field) != getattr(persona, field) for field in PERSONA_FIELDS):
+                conflicts.append({"shard": name, "kind": "persona", "persona_id": persona.id})
+                continue
+
+            entries = {entry.get("survey_id"): entry for entry in existing.response_history}
+            added = 0
+            for entry in persona.response_history:
+                survey_id = entry.get("survey_id")
+                if survey_id not in entries:
+                    existing.response_history.append(entry)
+                    entries[survey_id] = entry
+                    added += 1
+                elif entries[survey_id].get("responses") != entry.get("responses"):
+                    conflicts.append({"shard": name, "kind": "history", "persona_id": persona.id,
+                                      "survey_id": survey_id})
+            if added:
+                existing.last_updated = max(existing.last_updated, persona.last_updated)
+                changed.append(existing)
+                counts["history_added"] += added
+        if changed:
+            self.database.save_personas(changed)
+
+        with sqlite3.connect(self.database_path) as conn:
+            conn.execute("ATTACH DATABASE ? AS shard", (shard_path,))
+            matches = " AND ".join(f"m.{column} IS s.{column}" for column in RESPONSE_KEY)
+            for row in conn.execute(f'''
+                SELECT {", ".join(f"s.{column}" for column in RESPONSE_KEY)}
+                FROM shard.survey_responses s JOIN main.survey_responses m ON {matches}
+                WHERE m.response != s.response
+            ''').fetchall():
+                conflicts.append({"shard": name, "kind": "response", **dict(zip(RESPONSE_KEY, row))})
+
+            before = conn.total_changes
+            conn.execute(f'''
+                INSERT INTO main.survey_responses ({", ".join(RESPONSE_COLUMNS)})
+                SELECT {", ".join(f"s.{column}" for column in RESPONSE_COLUMNS)} FROM shard.survey_responses s
+                WHERE NOT EXISTS (SELECT 1 FROM main.survey_responses m WHERE {matches})
+            ''')
+            counts["responses_added"] = conn.total_changes - before
+
+            # Shards that never made an API call have no ledger table
+            if conn.execute("SELECT 1 FROM shard.sqlite_master WHERE type = 'table' AND name = 'llm_calls'").fetchone():
+                call_matches = " AND ".join(f"m.{column} IS s.{column}" for column in CALL_KEY)
+                before = conn.total_changes
+                conn.execute(f'''
+                    INSERT INTO main.llm_calls ({", ".join(CallLedger.COLUMNS)})
+                    SELECT {", ".join(f"s.{column}" for column in CallLedger.COLUMNS)} FROM shard.llm_calls s
+                    WHERE NOT EXISTS (SELECT 1 FROM main.llm_calls m WHERE {call_matches})
+                ''')
+                counts["calls_added"] = conn.total_changes - before
+            conn.commit()
+            conn.execute("DETACH DATABASE shard")
+        return counts
+
+    def _merge_runs(self, manifest: Dict[str, Any]):
+        """Record the shared run in the primary database, completed once every persona has finished it"""
+        run_id = manifest["run_id"]
+        persona_ids, config = [], {}
+        for shard in manifest["shards"]:
+            shard_path = os.path.join(self.shards_dir, shard["file"])
+            if os.path.exists(shard_path):
+                run = PersonaDatabase(shard_path).get_survey_run(run_id)
+                if run:
+                    persona_ids.extend(run["persona_ids"])
+                    config = config or run["config"]
+
+        members = set(persona_ids)
+        finished = len([persona for persona in self.database.get_all_personas() if persona.id in members
+                        and any(entry.get("survey_id") == run_id for entry in persona.response_history)])
+        status = "completed" if finished == len(persona_ids) and not self._missing(manifest) else "incomplete"
+        with sqlite3.connect(self.database_path) as conn:
+            # Unlike a resumed run, a merged run takes the persona list of every shard merged so far
+            conn.execute('''
+                INSERT INTO survey_runs (survey_id, survey_file, status, persona_ids, config, personas_completed)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (survey_id) DO UPDATE SET status = excluded.status, persona_ids = excluded.persona_ids,
+                    personas_completed = excluded.personas_completed, updated_at = CURRENT_TIMESTAMP
+            ''', (run_id, manifest["survey_file"], status, json.dumps(persona_ids), json.dumps(config), finished))
+            conn.commit()
+
+    def _missing(self, manifest: Dict[str, Any]) -> bool:
+        return any(not os.path.exists(os.path.join(self.shards_dir, shard["file"])) for shard in manifest["shards"])
@@ -1,4 +1,13 @@
 from .questions import SurveyQuestions
 from .engine import SurveyEngine
+from .async_engine import AsyncSurveyEngine
+from .batch import BatchSurveyRunner
+from .packing import PackedSurveyRunner
+from .estimator import SurveyEstimator
+from .task_queue import SurveyTaskQueue
+from .worker import SurveyWorker, enqueue_survey
+from .scheduler import SurveyScheduler, parse_deadline
 
-__all__ = ['SurveyQuestions', 'SurveyEngine']
\ No newline at end of file
+__all__ = ['SurveyQuestions', 'SurveyEngine', 'AsyncSurveyEngine', 'BatchSurveyRunner', 'PackedSurveyRunner',
+           'SurveyEstimator', 'SurveyTaskQueue', 'SurveyWorker', 'enqueue_survey',
+           'SurveyScheduler', 'parse_deadline']
\ No newline at end of file
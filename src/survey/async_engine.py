@@ -0,0 +1,177 @@
+import asyncio
+import time
+from typing import Dict, List, Any
+from personas import Persona
+from ai import AsyncGPTClient, CircuitOpenError
+from config.settings import Settings
+from .engine import SurveyEngine
+
+class AsyncSurveyEngine(SurveyEngine):
+    """Survey engine that keeps several persona surveys in flight at once"""
+
+    def __init__(self, questions_file: str, database_path: str, concurrency: int = None,
+                 page_size: int = None, replicates: int = None, run_id: str = None):
+        super().__init__(questions_file, database_path, gpt_client=AsyncGPTClient(), page_size=page_size,
+                         replicates=replicates, run_id=run_id)
+        self.concurrency = max(1, concurrency or Settings.MAX_CONCURRENT_PERSONAS)
+
+    async def _call_through_breaker_async(self, request):
+        """Await request(), pausing and resuming while the circuit breaker is open"""
+        reasked = False
+        while True:
+            try:
+                return await request()
+            except CircuitOpenError as e:
+                await asyncio.sleep(self._circuit_pause(e))
+            except Exception as e:
+                if not self._should_reask(e, reasked):
+                    raise
+                reasked = True
+
+    async def _fetch_paged_answers_async(self, persona: Persona, questions_list: List[Dict[str, Any]]) -> Dict[int, str]:
+        """Answer questions page by page; anything missing is asked individually later"""
+        answers = {}
+        if self.page_size is None:
+            return answers
+
+        questions_list = [q for q in questions_list if self._pageable(q)]
+        pages = self._page_questions(questions_list)
+        for page in pages:
+            try:
+                with self._call_context(persona, kind="page"):
+                    answers.update(await self._call_through_breaker_async(
+                        lambda: self.gpt_client.get_persona_survey_page(persona.get_prompt_context(), page)
+                    ))
+            except Exception as e:
+                print(f"  {persona.id}: page request failed, asking questions individually: {e}")
+
+        self._count_paged_answers(answers, len(questions_list), len(pages))
+        return answers
+
+    async def _ask_question_async(self, persona: Persona, question: Dict[str, Any]) -> tuple:
+        """Async counterpart of _ask_question, dispatching through the same _question_request"""
+        kind, request, unpack = self._question_request(persona, question)
+        with self._call_context(persona, question, kind=kind):
+            return unpack(await self._call_through_breaker_async(request))
+
+    async def run_survey_for_persona_async(self, persona: Persona, progress_callback=None) -> Dict[str, Any]:
+        """Run complete survey for a single persona without blocking the event loop.
+
+        SQLite reads and writes run on worker threads (asyncio.to_thread) so one
+        persona's database work does not stall the others' requests.
+        """
+        completed = await asyncio.to_thread(self._completed_result, persona)
+        if completed:
+            return completed
+
+        print(f"Starting survey for persona {persona.id}: {persona.get_description()}")
+
+        survey_responses = await asyncio.to_thread(self._restore_responses, persona)
+        start_time = time.time()
+
+        questions_list = self.questions.get_questions()
+        total_questions = len(questions_list)
+        pending = [q for q in questions_list if str(q["question"]) not in survey_responses]
+        paged_answers = await self._fetch_paged_answers_async(persona, pending)
+
+        for i, question in enumerate(questions_list, 1):
+            if str(question["question"]) in survey_responses:
+                continue
+            try:
+                if progress_callback:
+                    progress_callback(persona.id, i, total_questions)
+
+                if question["question"] in paged_answers:
+                    response, distribution, replicates = paged_answers[question["question"]], None, None
+                else:
+                    response, distribution, replicates = await self._ask_question_async(persona, question)
+
+                await asyncio.to_thread(self._record_response, persona, question, response, survey_responses,
+                                        distribution, replicates)
+
+                print(f"  {persona.id} Q{question['question']}: {response[:60]}")
+
+            except Exception as e:
+                print(f"  {persona.id} Q{question['question']}: Error getting response: {e}")
+                self._record_error(question, e, survey_responses)
+
+        return await asyncio.to_thread(self._finish_persona, persona, survey_responses, start_time, total_questions)
+
+    async def run_survey_for_all_personas_async(self, personas: List[Persona], progress_callback=None) -> List[Dict[str, Any]]:
+        """Run survey for all personas with at most `concurrency` surveys in flight"""
+        print(f"Starting survey for {len(personas)} personas ({self.concurrency} concurrent)...")
+        print(f"Survey ID: {self.survey_id}")
+
+        total_personas = len(personas)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        run_start = time.time()
+        self.start_run(personas)
+
+        async def survey_one(index: int, persona: Persona) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    print(f"\n[{index}/{total_personas}] Processing persona {persona.id}")
+                    return await self.run_survey_for_persona_async(
+                        persona,
+                        lambda pid, q_num, q_total: progress_callback(index, total_personas, pid, q_num, q_total) if progress_callback else None
+                    )
+                except Exception as e:
+                    print(f"Failed to complete survey for persona {persona.id}: {e}")
+                    return self._persona_failure_result(persona, e)
+
+        # gather() preserves input order, so results line up with `personas`
+        results = await asyncio.gather(
+            *(survey_one(i, persona) for i, persona in enumerate(personas, 1))
+        )
+
+        self.last_run_wall_time = time.time() - run_start
+        self.finish_run(results)
+        return list(results)
+
+    def run_survey_for_all_personas(self, personas: List[Persona], progress_callback=None) -> List[Dict[str, Any]]:
+        """Run survey for all personas concurrently (blocking wrapper)"""
+        return asyncio.run(self.run_survey_for_all_personas_async(personas, progress_callback))
+
+    def run_survey_for_persona(self, persona: Persona, progress_callback=None) -> Dict[str, Any]:
+        """Run complete survey for a single persona (blocking wrapper)"""
+        return asyncio.run(self.run_survey_for_persona_async(persona, progress_callback))
+
+    def test_single_persona(self, persona: Persona, question_limit: int = 3) -> Dict[str, Any]:
+        """Test survey with a single persona and limited questions"""
+        print(f"Testing survey with persona {persona.id} (first {question_limit} questions)")
+
+        questions_list = self.questions.get_questions()[:question_limit]
+        start_time = time.time()
+
+        async def ask_all() -> Dict[str, Any]:
+            survey_responses = {}
+            for question in questions_list:
+                try:
+                    with self._call_context(persona, question, kind="test"):
+                        response = await self.gpt_client.get_persona_response(
+                            persona.get_prompt_context(),
+                            question
+                        )
+                    survey_responses[str(question["question"])] = {
+                        "question": question["text"],
+                        "response": response,
+                        "type": question["type"]
+                    }
+                    print(f"Question {question['question']}: {response}\n")
+                except Exception as e:
+                    print(f"Error: {e}\n")
+                    survey_responses[str(question["question"])] = {
+                        "question": question["text"],
+                        "response": f"ERROR: {e}",
+                        "type": question["type"]
+                    }
+            return survey_responses
+
+        survey_responses = asyncio.run(ask_all())
+
+        return {
+            "persona_id": persona.id,
+            "test_responses": survey_responses,
+            "completion_time_seconds": round(time.time() - start_time, 2),
+            "questions_tested": len(questions_list)
+        }
@@ -0,0 +1,196 @@
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from personas import Persona
+from ai.generation import generation_params
+from .engine import SurveyEngine
+
+class BatchSurveyRunner:
+    """Run a full survey through the OpenAI Batch API instead of live requests"""
+
+    TERMINAL_STATUSES = ["completed", "failed", "expired", "cancelled"]
+
+    def __init__(self, engine: SurveyEngine, work_dir: str):
+        # Each batch line asks one question for one plain-text answer
+        if engine.replicates > 1 or engine.scale_logprobs:
+            raise ValueError("Batch runs ask every question once without logprobs; "
+                             "turn off SURVEY_REPLICATES and SCALE_LOGPROBS (or --replicates/--scale-logprobs)")
+        self.engine = engine
+        self.work_dir = work_dir
+        os.makedirs(work_dir, exist_ok=True)
+
+    @staticmethod
+    def make_custom_id(survey_id: str, persona_id: str, question_number: int) -> str:
+        """Stable ID tying a batch line back to (survey, persona, question)"""
+        return f"{survey_id}:{persona_id}:{question_number}"
+
+    @staticmethod
+    def parse_custom_id(custom_id: str) -> Tuple[str, str, int]:
+        survey_id, rest = custom_id.split(":", 1)
+        persona_id, question_number = rest.rsplit(":", 1)
+        return survey_id, persona_id, int(question_number)
+
+    def input_path(self, survey_id: str) -> str:
+        return os.path.join(self.work_dir, f"{survey_id}_input.jsonl")
+
+    def results_path(self, survey_id: str) -> str:
+        return os.path.join(self.work_dir, f"{survey_id}_results.jsonl")
+
+    def prepare(self, personas: List[Persona]) -> str:
+        """Write one Batch API request per (persona, question); returns the file path"""
+        client = self.engine.gpt_client
+        survey_id = self.engine.survey_id
+        path = self.input_path(survey_id)
+
+        with open(path, "w", encoding="utf-8") as f:
+            for persona in personas:
+                for question in self.engine.questions.get_questions():
+                    messages = client.build_persona_messages(persona.get_prompt_context(), question)
+                    custom_id = self.make_custom_id(survey_id, persona.id, question["question"])
+                    request = client.build_batch_request(custom_id, messages, **generation_params(question))
+                    f.write(json.dumps(request) + "\n")
+
+        print(f"Wrote {len(personas) * self.engine.questions.get_question_count()} batch requests to {path}")
+        return path
+
+    def submit(self, input_path: str) -> str:
+        """Upload the input file and create the batch"""
+        batch_id = self.engine.gpt_client.submit_batch(input_path, metadata={"survey_id": self.engine.survey_id})
+        print(f"Submitted batch {batch_id}")
+        return batch_id
+
+    def wait(self, batch_id: str, poll_interval: float = 60) -> Optional[str]:
+        """Poll until the batch finishes; returns the local results file path"""
+        client = self.engine.gpt_client
+
+        while True:
+            batch = client.get_batch(batch_id)
+            counts = getattr(batch, "request_counts", None)
+            if counts:
+                print(f"Batch {batch_id}: {batch.status} ({counts.completed}/{counts.total} done, {counts.failed} failed)")
+            else:
+                print(f"Batch {batch_id}: {batch.status}")
+
+            if batch.status in self.TERMINAL_STATUSES:
+                break
+            time.sleep(poll_interval)
+
+        survey_id = (getattr(batch, "metadata", None) or {}).get("survey_id", self.engine.survey_id)
+        results_path = self.results_path(survey_id)
+
+        # Errored lines live in a separate file; concatenate both for ingestion
+        parts = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                part_path = client.download_file(file_id, f"{results_path}.{file_id}")
+                parts.append(part_path)
+
+        if not parts:
+            print(f"Batch {batch_id} finished with status '{batch.status}' and no results")
+            return None
+
+        with open(results_path, "w", encoding="utf-8") as out:
+            for part_path in parts:
+                with open(part_path, "r", encoding="utf-8") as f:
+                    out.write(f.read())
+                os.remove(part_path)
+
+        return results_path
+
+    def ingest(self, results_path: str) -> List[Dict[str, Any]]:
+        """Validate batch results and store them like live responses.
+
+        Answers already stored for a run are kept, so ingesting a results file
+        again adds nothing. A file spanning several runs is recorded run by run.
+        """
+        engine = self.engine
+        by_run: Dict[str, Dict[str, Dict[int, Dict[str, Any]]]] = {}
+
+        with open(results_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                result = json.loads(line)
+                survey_id, persona_id, question_number = self.parse_custom_id(result["custom_id"])
+                by_run.setdefault(survey_id, {}).setdefault(persona_id, {})[question_number] = result
+
+        results = []
+        for survey_id, by_persona in by_run.items():
+            engine.survey_id = survey_id
+            results.extend(self._ingest_run(by_persona))
+        return results
+
+    def _ingest_run(self, by_persona: Dict[str, Dict[int, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Store one run's results and register or finish the run"""
+        engine = self.engine
+        results, personas = [], []
+        for persona_id, answers in by_persona.items():
+            persona = engine.database.get_persona(persona_id)
+            if persona is None:
+                print(f"Skipping results for unknown persona {persona_id}")
+                continue
+
+            survey_responses = engine._stored_survey_responses(persona)
+            for question in engine.questions.get_questions():
+                if str(question["question"]) in survey_responses:
+                    continue
+                result = answers.get(question["question"])
+                if result is not None:
+                    self._log_result(persona.id, question["question"], result)
+                try:
+                    content = self._extract_content(result)
+                    response = engine.gpt_client._validate_response(content, question)
+                    engine._record_response(persona, question, response, survey_responses)
+                except Exception as e:
+                    engine._record_error(question, e, survey_responses)
+
+            personas.append(persona)
+            results.append(engine._finish_persona(persona, survey_responses, time.time(),
+                                                  engine.questions.get_question_count()))
+
+        if results:
+            # Results prepared by another process may belong to a run this database hasn't seen
+            if engine.database.get_survey_run(engine.survey_id) is None:
+                engine.start_run(personas)
+            engine.finish_run(results)
+        return results
+
+    def _log_result(self, persona_id: str, question_number: int, result: Dict[str, Any]):
+        """Put the batch request behind a result in the call ledger, with its usage and discounted cost"""
+        ledger = self.engine.gpt_client.ledger
+        if ledger is None:
+            return
+        response = result.get("response") or {}
+        error = None
+        if result.get("error") or response.get("status_code") != 200:
+            error = RuntimeError((result.get("error") or {}).get("message")
+                                 or f"Batch request failed with status {response.get('status_code')}")
+        ledger.record_batch(self.engine.survey_id, persona_id, question_number,
+                            self.engine.gpt_client.endpoints.primary.model, response.get("body"), error)
+
+    @staticmethod
+    def _extract_content(result: Optional[Dict[str, Any]]) -> str:
+        if result is None:
+            raise ValueError("No batch result for this question")
+        if result.get("error"):
+            raise ValueError(result["error"].get("message", str(result["error"])))
+
+        response = result.get("response") or {}
+        if response.get("status_code") != 200:
+            raise ValueError(f"Batch request failed with status {response.get('status_code')}")
+
+        return response["body"]["choices"][0]["message"]["content"].strip()
+
+    def run(self, personas: List[Persona], batch_id: str = None, results_path: str = None,
+            poll_interval: float = 60) -> List[Dict[str, Any]]:
+        """Prepare, submit, wait for and ingest a batch (resuming from any given step)"""
+        if not results_path:
+            if not batch_id:
+                self.engine.start_run(personas)
+                batch_id = self.submit(self.prepare(personas))
+            results_path = self.wait(batch_id, poll_interval)
+            if not results_path:
+                return []
+
+        return self.ingest(results_path)
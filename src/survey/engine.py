@@ -1,88 +1,402 @@
+import contextvars
+import statistics
+import threading
 import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from personas import Persona, PersonaDatabase
-from ai import GPTClient
+from ai import GPTClient, CircuitOpenError
+from ai.circuit_breaker import is_endpoint_failure
+from ai.ledger import call_context
+from config.settings import Settings
 from .questions import SurveyQuestions
 
 class SurveyEngine:
     """Main survey orchestration engine"""
     
-    def __init__(self, questions_file: str, database_path: str):
+    def __init__(self, questions_file: str, database_path: str, gpt_client: GPTClient = None,
+                 page_size: int = None, replicates: int = None, run_id: str = None,
+                 question_concurrency: int = None):
+        self.questions_file = questions_file
         self.questions = SurveyQuestions(questions_file)
         self.database = PersonaDatabase(database_path)
-        self.gpt_client = GPTClient()
-        self.survey_id = f"ai_adoption_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        self.gpt_client = gpt_client or GPTClient()
+        self.gpt_client.prompts.set_survey(self.questions.get_questions())
+        self.gpt_client.use_ledger(database_path)
+        self.last_run_wall_time = None
+        
+        # Resuming keeps the run's survey ID and the answer options it started with
+        self.resumed_run = None
+        self.resume_stats = {"personas_skipped": 0, "answers_restored": 0}
+        scale_logprobs = Settings.SCALE_LOGPROBS
+        if run_id:
+            self.resumed_run = self.database.get_survey_run(run_id)
+            if self.resumed_run is None:
+                raise ValueError(f"Unknown survey run: {run_id}")
+            config = self.resumed_run["config"]
+            page_size = page_size if page_size is not None else config.get("page_size")
+            replicates = replicates or config.get("replicates")
+            scale_logprobs = config.get("scale_logprobs", scale_logprobs)
+        self.survey_id = run_id or f"ai_adoption_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        
+        # None = one request per question, 0 = whole survey per request, k = k questions per request
+        self.page_size = page_size
+        self.page_stats = {"page_requests": 0, "paged_answers": 0, "reasked": 0}
+        self.circuit_paused_seconds = 0.0
+        # Fan-out and scheduler threads update the counters above together
+        self._stats_lock = threading.Lock()
+        
+        # Scale questions answered with a full option distribution from one logprobs call
+        self.scale_logprobs = scale_logprobs
+        # Independent answers per question, all from one request via the API's n parameter
+        self.replicates = max(1, replicates or Settings.SURVEY_REPLICATES)
+        # A persona's questions in flight at once (1 = one after another)
+        self.question_concurrency = max(1, question_concurrency or Settings.QUESTION_CONCURRENCY)
+    
+    def run_config(self) -> Dict[str, Any]:
+        """Options that decide how answers are produced; a resumed run reuses them"""
+        return {
+            "page_size": self.page_size,
+            "replicates": self.replicates,
+            "scale_logprobs": self.scale_logprobs,
+            "prompt_layout": self.gpt_client.prompts.layout
+        }
+    
+    def start_run(self, personas: List[Persona]):
+        """Register this run in survey_runs so it can be resumed by its survey ID"""
+        self.database.save_survey_run(self.survey_id, self.questions_file, [p.id for p in personas],
+                                      self.run_config())
+    
+    def finish_run(self, results: List[Dict[str, Any]]):
+        """Mark the run completed, or incomplete if any persona still has unanswered questions"""
+        completed = len([r for r in results if "error" not in r
+                         and r.get("successful_responses") == r.get("total_questions")])
+        self.database.update_survey_run(self.survey_id, "completed" if completed == len(results) else "incomplete",
+                                        completed)
+    
+    def _completed_result(self, persona: Persona) -> Optional[Dict[str, Any]]:
+        """Result for a persona this run already finished without errors, so a resumed run skips it"""
+        if self.resumed_run is None:
+            return None
+        for entry in persona.response_history:
+            if entry.get("survey_id") != self.survey_id:
+                continue
+            responses = entry["responses"]
+            if any("error" in r for r in responses.values()) or len(responses) < self.questions.get_question_count():
+                return None
+            with self._stats_lock:
+                self.resume_stats["personas_skipped"] += 1
+            print(f"Skipping persona {persona.id}: already surveyed in run {self.survey_id}")
+            return {
+                "persona_id": persona.id,
+                "survey_id": self.survey_id,
+                "responses": responses,
+                "completion_time_seconds": 0,
+                "total_questions": len(responses),
+                "successful_responses": len(responses),
+                "resumed": True
+            }
+        return None
+    
+    def _restore_responses(self, persona: Persona) -> Dict[str, Any]:
+        """Answers this run already stored for the persona; a resumed run only asks the rest"""
+        if self.resumed_run is None:
+            return {}
+        survey_responses = self._stored_survey_responses(persona)
+        with self._stats_lock:
+            self.resume_stats["answers_restored"] += len(survey_responses)
+        return survey_responses
+    
+    def _stored_survey_responses(self, persona: Persona) -> Dict[str, Any]:
+        """The persona's answers stored under this run, as survey_responses entries"""
+        survey_responses = {}
+        stored = self.database.get_stored_responses(self.survey_id, persona.id)
+        for question in self.questions.get_questions():
+            rows = stored.get(question["question"])
+            if not rows:
+                continue
+            entry = survey_responses[str(question["question"])] = {
+                "question": question["text"],
+                "response": rows[0]["response"],
+                "type": question["type"]
+            }
+            if rows[0]["distribution"]:
+                entry.update(distribution=rows[0]["distribution"], expected_value=rows[0]["expected_value"])
+            if len(rows) > 1:
+                replicates = [row["response"] for row in rows]
+                entry.update(self._summarize_replicates(question, replicates), replicates=replicates)
+        return survey_responses
+    
+    def _circuit_pause(self, error: CircuitOpenError) -> float:
+        """How long to pause while the API circuit is open; re-raises once the run's pause budget is spent"""
+        with self._stats_lock:
+            remaining = Settings.CIRCUIT_MAX_PAUSE_SECONDS - self.circuit_paused_seconds
+            if remaining <= 0:
+                raise error
+            pause = min(error.retry_in, remaining)
+            self.circuit_paused_seconds += pause
+        print(f"  API unavailable, pausing survey for {pause:.0f}s before probing again...")
+        return pause
+    
+    def _should_reask(self, error: Exception, reasked: bool) -> bool:
+        """Re-ask after an outage error: once, or for as long as the breaker is tripped"""
+        if not is_endpoint_failure(error):
+            return False
+        return not reasked or not self.gpt_client.circuit_closed()
+    
+    def _call_through_breaker(self, request):
+        """Run request(), pausing and resuming while the circuit breaker is open"""
+        reasked = False
+        while True:
+            try:
+                return request()
+            except CircuitOpenError as e:
+                time.sleep(self._circuit_pause(e))
+            except Exception as e:
+                # Failures that trip the breaker are waited out rather than recorded as errors
+                if not self._should_reask(e, reasked):
+                    raise
+                reasked = True
+    
+    def _call_context(self, persona: Persona = None, question: Dict[str, Any] = None, kind: str = "question"):
+        """Tag the LLM calls made in this block in the call ledger"""
+        return call_context(survey_id=self.survey_id, persona_id=persona.id if persona else None,
+                            question_number=question["question"] if question else None, kind=kind)
+    
+    def _uses_distribution(self, question: Dict[str, Any]) -> bool:
+        return self.scale_logprobs and question["type"] == "scale"
+    
+    def _question_request(self, persona: Persona, question: Dict[str, Any]) -> tuple:
+        """How this run asks one question: (ledger kind, client call, unpack into (response, distribution, replicates)).
+        
+        Shared by the sync and async engines; only the way the call is awaited differs.
+        """
+        context = persona.get_prompt_context()
+        if self._uses_distribution(question):
+            return ("distribution",
+                    lambda: self.gpt_client.get_scale_distribution(context, question),
+                    lambda distribution: (distribution["argmax"], distribution, None))
+        if self.replicates > 1:
+            return ("replicates",
+                    lambda: self.gpt_client.get_persona_responses(context, question, self.replicates),
+                    lambda replicates: (self._summarize_replicates(question, replicates)["response"], None, replicates))
+        return ("question",
+                lambda: self.gpt_client.get_persona_response(context, question),
+                lambda response: (response, None, None))
+    
+    def _ask_question(self, persona: Persona, question: Dict[str, Any]) -> tuple:
+        """Answer one question the way this run asks it, waiting out API outages: (response, distribution, replicates)"""
+        kind, request, unpack = self._question_request(persona, question)
+        with self._call_context(persona, question, kind=kind):
+            return unpack(self._call_through_breaker(request))
+    
+    def _ask_concurrently(self, persona: Persona, questions_list: List[Dict[str, Any]], ask,
+                          progress_callback=None, answered: int = 0, total_questions: int = None) -> Dict[int, Any]:
+        """Ask questions on up to question_concurrency threads; each answer (or exception) by question number.
+        
+        Progress is reported against the whole survey: `answered` questions (restored or paged)
+        count as done before the first of these finishes.
+        """
+        total_questions = total_questions or answered + len(questions_list)
+        outcomes = {}
+        if not questions_list:
+            return outcomes
+        
+        with ThreadPoolExecutor(max_workers=min(self.question_concurrency, len(questions_list))) as executor:
+            # Each thread gets a copy of the caller's context, so outer call_context tags still apply
+            futures = {executor.submit(contextvars.copy_context().run, ask, persona, question): question
+                       for question in questions_list}
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    outcomes[futures[future]["question"]] = future.result()
+                except Exception as e:
+                    outcomes[futures[future]["question"]] = e
+                if progress_callback:
+                    progress_callback(persona.id, answered + done, total_questions)
+        return outcomes
+    
+    @staticmethod
+    def _take_outcome(outcomes: Dict[int, Any], question: Dict[str, Any]):
+        """A concurrently fetched answer, re-raising its error so it is handled like a sequential one"""
+        outcome = outcomes[question["question"]]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    
+    def _pageable(self, question: Dict[str, Any]) -> bool:
+        """Questions asked as distributions or replicates get their own requests"""
+        return not self._uses_distribution(question) and self.replicates == 1
+    
+    @staticmethod
+    def _summarize_replicates(question: Dict[str, Any], replicates: List[str]) -> Dict[str, Any]:
+        """Modal answer and agreement (its share of replicates); spread for scale answers"""
+        if question["type"] == "open-ended":
+            # Free text never repeats exactly, so agreement isn't meaningful
+            return {"response": replicates[0], "agreement": None}
+        
+        response, count = Counter(replicates).most_common(1)[0]
+        summary = {"response": response, "agreement": round(count / len(replicates), 3)}
+        if question["type"] == "scale":
+            try:
+                summary["stdev"] = round(statistics.pstdev(float(answer) for answer in replicates), 3)
+            except ValueError:
+                pass
+        return summary
+    
+    def _page_questions(self, questions_list: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Split questions into request pages"""
+        size = self.page_size or len(questions_list)
+        return [questions_list[i:i + size] for i in range(0, len(questions_list), size)]
+    
+    def _count_paged_answers(self, answers: Dict[int, str], total_questions: int, pages: int):
+        with self._stats_lock:
+            self.page_stats["page_requests"] += pages
+            self.page_stats["paged_answers"] += len(answers)
+            self.page_stats["reasked"] += total_questions - len(answers)
+    
+    def _fetch_paged_answers(self, persona: Persona, questions_list: List[Dict[str, Any]]) -> Dict[int, str]:
+        """Answer questions page by page; anything missing is asked individually later"""
+        answers = {}
+        if self.page_size is None:
+            return answers
+        
+        questions_list = [q for q in questions_list if self._pageable(q)]
+        pages = self._page_questions(questions_list)
+        for page in pages:
+            try:
+                with self._call_context(persona, kind="page"):
+                    answers.update(self._call_through_breaker(
+                        lambda: self.gpt_client.get_persona_survey_page(persona.get_prompt_context(), page)
+                    ))
+            except Exception as e:
+                print(f"  Page request failed, asking questions individually: {e}")
+        
+        self._count_paged_answers(answers, len(questions_list), len(pages))
+        return answers
+    
+    def _record_response(self, persona: Persona, question: Dict[str, Any], response: str,
+                         survey_responses: Dict[str, Any], distribution: Dict[str, Any] = None,
+                         replicates: List[str] = None):
+        """Store a validated response in memory and in the database (one row per replicate)"""
+        entry = survey_responses[str(question["question"])] = {
+            "question": question["text"],
+            "response": response,
+            "type": question["type"]
+        }
+        if distribution and distribution["distribution"]:
+            entry.update(distribution=distribution["distribution"], expected_value=distribution["expected_value"])
+        if replicates:
+            entry.update(self._summarize_replicates(question, replicates), replicates=replicates)
+        
+        for index, answer in enumerate(replicates or [response]):
+            self.database.save_survey_response(
+                persona.id,
+                self.survey_id,
+                question["question"],
+                question["text"],
+                answer,
+                question["type"],
+                distribution,
+                replicate_index=index
+            )
+    
+    def _record_error(self, question: Dict[str, Any], error: Exception, survey_responses: Dict[str, Any]):
+        """Store an error placeholder for a question that could not be answered"""
+        survey_responses[str(question["question"])] = {
+            "question": question["text"],
+            "response": "ERROR: Could not generate response",
+            "type": question["type"],
+            "error": str(error)
+        }
+    
+    def _finish_persona(self, persona: Persona, survey_responses: Dict[str, Any],
+                        start_time: float, total_questions: int, end_time: float = None) -> Dict[str, Any]:
+        """Write responses to persona history and build the per-persona result (timed until end_time, or now)"""
+        # A resumed persona replaces its earlier, partial entry for this run
+        persona.response_history = [entry for entry in persona.response_history
+                                    if entry.get("survey_id") != self.survey_id]
+        persona.add_survey_response(self.survey_id, survey_responses)
+        self.database.save_persona(persona)
+        
+        completion_time = (end_time or time.time()) - start_time
+        
+        result = {
+            "persona_id": persona.id,
+            "survey_id": self.survey_id,
+            "responses": survey_responses,
+            "completion_time_seconds": round(completion_time, 2),
+            "total_questions": total_questions,
+            "successful_responses": len([r for r in survey_responses.values() if "error" not in r])
+        }
+        
+        print(f"Completed survey for {persona.id} in {completion_time:.1f} seconds")
+        return result
+    
+    def _persona_failure_result(self, persona: Persona, error: Exception) -> Dict[str, Any]:
+        """Build the result entry for a persona whose survey could not run"""
+        return {
+            "persona_id": persona.id,
+            "survey_id": self.survey_id,
+            "error": str(error),
+            "completion_time_seconds": 0,
+            "total_questions": self.questions.get_question_count(),
+            "successful_responses": 0
+        }
     
     def run_survey_for_persona(self, persona: Persona, progress_callback=None) -> Dict[str, Any]:
         """Run complete survey for a single persona"""
+        completed = self._completed_result(persona)
+        if completed:
+            return completed
+        
         print(f"Starting survey for persona {persona.id}: {persona.get_description()}")
         
-        survey_responses = {}
+        survey_responses = self._restore_responses(persona)
         start_time = time.time()
         
         questions_list = self.questions.get_questions()
         total_questions = len(questions_list)
+        pending = [q for q in questions_list if str(q["question"]) not in survey_responses]
+        paged_answers = self._fetch_paged_answers(persona, pending)
+        
+        # Fan the remaining questions out at once; answers are still recorded in question order below
+        fanned_out = {}
+        if self.question_concurrency > 1:
+            to_ask = [q for q in pending if q["question"] not in paged_answers]
+            fanned_out = self._ask_concurrently(persona, to_ask, self._ask_question, progress_callback,
+                                                answered=total_questions - len(to_ask),
+                                                total_questions=total_questions)
         
         for i, question in enumerate(questions_list, 1):
+            if str(question["question"]) in survey_responses:
+                continue
             try:
-                if progress_callback:
+                if progress_callback and not fanned_out:
                     progress_callback(persona.id, i, total_questions)
                 
                 print(f"  Question {question['question']}: {question['text'][:50]}...")
                 
-                # Get persona's response via GPT-4o
-                response = self.gpt_client.get_persona_response(
-                    persona.get_prompt_context(),
-                    question
-                )
-                
-                # Store response
-                survey_responses[str(question["question"])] = {
-                    "question": question["text"],
-                    "response": response,
-                    "type": question["type"]
-                }
+                # Get persona's response via GPT-4o (unless its page already answered it)
+                if question["question"] in paged_answers:
+                    response, distribution, replicates = paged_answers[question["question"]], None, None
+                elif question["question"] in fanned_out:
+                    response, distribution, replicates = self._take_outcome(fanned_out, question)
+                else:
+                    response, distribution, replicates = self._ask_question(persona, question)
                 
-                # Save to database
-                self.database.save_survey_response(
-                    persona.id,
-                    self.survey_id,
-                    question["question"],
-                    question["text"],
-                    response,
-                    question["type"]
-                )
+                # Store response and save to database
+                self._record_response(persona, question, response, survey_responses, distribution, replicates)
                 
                 print(f"    Response: {response}")
                 
             except Exception as e:
                 print(f"    Error getting response: {e}")
-                # Store error response
-                survey_responses[str(question["question"])] = {
-                    "question": question["text"],
-                    "response": "ERROR: Could not generate response",
-                    "type": question["type"],
-                    "error": str(e)
-                }
+                self._record_error(question, e, survey_responses)
         
         # Update persona with survey responses
-        persona.add_survey_response(self.survey_id, survey_responses)
-        self.database.save_persona(persona)
-        
-        completion_time = time.time() - start_time
-        
-        result = {
-            "persona_id": persona.id,
-            "survey_id": self.survey_id,
-            "responses": survey_responses,
-            "completion_time_seconds": round(completion_time, 2),
-            "total_questions": total_questions,
-            "successful_responses": len([r for r in survey_responses.values() if "error" not in r])
-        }
-        
-        print(f"Completed survey for {persona.id} in {completion_time:.1f} seconds")
-        return result
+        return self._finish_persona(persona, survey_responses, start_time, total_questions)
     
     def run_survey_for_all_personas(self, personas: List[Persona], progress_callback=None) -> List[Dict[str, Any]]:
         """Run survey for all personas"""
@@ -91,6 +405,8 @@ class SurveyEngine:
         
         results = []
         total_personas = len(personas)
+        run_start = time.time()
+        self.start_run(personas)
         
         for i, persona in enumerate(personas, 1):
             try:
@@ -104,15 +420,10 @@ class SurveyEngine:
                 
             except Exception as e:
                 print(f"Failed to complete survey for persona {persona.id}: {e}")
-                results.append({
-                    "persona_id": persona.id,
-                    "survey_id": self.survey_id,
-                    "error": str(e),
-                    "completion_time_seconds": 0,
-                    "total_questions": self.questions.get_question_count(),
-                    "successful_responses": 0
-                })
+                results.append(self._persona_failure_result(persona, e))
         
+        self.last_run_wall_time = time.time() - run_start
+        self.finish_run(results)
         return results
     
     def get_survey_statistics(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -126,8 +437,9 @@ class SurveyEngine:
         
         total_time = sum(r.get("completion_time_seconds", 0) for r in results)
         avg_time_per_persona = total_time / total_personas if total_personas > 0 else 0
+        wall_time = self.last_run_wall_time if self.last_run_wall_time is not None else total_time
         
-        return {
+        stats = {
             "survey_id": self.survey_id,
             "total_personas": total_personas,
             "successful_surveys": successful_surveys,
@@ -138,8 +450,70 @@ class SurveyEngine:
             "response_rate": (successful_responses / total_questions * 100) if total_questions > 0 else 0,
             "total_time_seconds": round(total_time, 2),
             "average_time_per_persona": round(avg_time_per_persona, 2),
-            "questions_per_survey": self.questions.get_question_count()
+            "wall_clock_seconds": round(wall_time, 2),
+            "questions_per_survey": self.questions.get_question_count(),
+            "token_usage": self.gpt_client.get_usage_stats(),
+            "prompts": self.gpt_client.get_prompt_stats(),
+            "cache": self.gpt_client.get_cache_stats(),
+            "concurrency": self.gpt_client.get_concurrency_stats(),
+            "http_pool": self.gpt_client.get_pool_stats(),
+            "coalescing": self.gpt_client.get_coalescing_stats(),
+            "circuit": dict(self.gpt_client.get_circuit_stats(),
+                            paused_seconds=round(self.circuit_paused_seconds, 1)),
+            "endpoints": self.gpt_client.get_endpoint_stats(),
+            "ledger": self.gpt_client.ledger.run_summary(self.survey_id) if self.gpt_client.ledger else None,
+            "generation": self.gpt_client.get_generation_stats()
         }
+        
+        if self.resumed_run is not None:
+            stats["resume"] = dict(self.resume_stats)
+        
+        if self.page_size is not None:
+            stats["paging"] = dict(self.page_stats)
+        
+        if self.replicates > 1:
+            stats["replicates"] = self._replicate_statistics(results)
+        
+        if self.scale_logprobs:
+            stats["scale_distributions"] = sum(
+                1 for r in results for response in r.get("responses", {}).values() if "distribution" in response
+            )
+        
+        hedging = self.gpt_client.get_hedging_stats()
+        if hedging is not None:
+            stats["hedging"] = hedging
+        
+        return stats
+    
+    def _replicate_statistics(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Per-question agreement between replicates, averaged over personas"""
+        by_question = {}
+        for result in results:
+            for number, response in result.get("responses", {}).items():
+                if response.get("agreement") is None:
+                    continue
+                question = by_question.setdefault(number, {"type": response["type"], "agreement": [], "stdev": []})
+                question["agreement"].append(response["agreement"])
+                if "stdev" in response:
+                    question["stdev"].append(response["stdev"])
+        
+        summary = {}
+        for number, question in by_question.items():
+            summary[number] = {"type": question["type"], "personas": len(question["agreement"]),
+                               "mean_agreement": round(statistics.mean(question["agreement"]), 3)}
+            if question["stdev"]:
+                summary[number]["mean_stdev"] = round(statistics.mean(question["stdev"]), 3)
+        
+        agreements = [q["mean_agreement"] for q in summary.values()]
+        return {
+            "per_question": self.replicates,
+            "mean_agreement": round(statistics.mean(agreements), 3) if agreements else None,
+            "by_question": summary
+        }
+    
+    def _get_test_response(self, persona: Persona, question: Dict[str, Any]) -> str:
+        with self._call_context(persona, question, kind="test"):
+            return self.gpt_client.get_persona_response(persona.get_prompt_context(), question)
     
     def test_single_persona(self, persona: Persona, question_limit: int = 3) -> Dict[str, Any]:
         """Test survey with a single persona and limited questions"""
@@ -149,14 +523,18 @@ class SurveyEngine:
         survey_responses = {}
         start_time = time.time()
         
+        fanned_out = {}
+        if self.question_concurrency > 1:
+            fanned_out = self._ask_concurrently(persona, questions_list, self._get_test_response)
+        
         for question in questions_list:
             try:
                 print(f"Question {question['question']}: {question['text']}")
                 
-                response = self.gpt_client.get_persona_response(
-                    persona.get_prompt_context(),
-                    question
-                )
+                if question["question"] in fanned_out:
+                    response = self._take_outcome(fanned_out, question)
+                else:
+                    response = self._get_test_response(persona, question)
                 
                 survey_responses[str(question["question"])] = {
                     "question": question["text"],
@@ -0,0 +1,194 @@
+from typing import Any, Dict, List, Optional
+from personas import Persona
+from ai.endpoints import load_endpoint_configs
+from ai.generation import generation_params
+from ai.ledger import CallLedger, compute_cost
+from ai.prompts import PROMPT_CACHE_MIN_TOKENS, PromptTemplates
+from ai.tokens import count_prompt_tokens, count_text_tokens, exact_token_counts, tokenizer_name
+from config.settings import Settings
+from .packing import PackedSurveyRunner, pack_groups
+
+# Typical answer lengths when the ledger has no history for a question
+OPEN_ENDED_COMPLETION_TOKENS = 100
+CHECKBOX_TYPICAL_SELECTIONS = 2
+
+# Latency model without ledger history: time to first token plus generation time
+BASE_LATENCY_SECONDS = 0.5
+SECONDS_PER_COMPLETION_TOKEN = 0.02
+
+# Providers cache prompt prefixes in steps of this many tokens
+PROMPT_CACHE_STEP_TOKENS = 128
+
+
+class SurveyEstimator:
+    """Predicts a run's requests, tokens, cost and wall-clock time per engine mode without calling the API.
+
+    Prompts are rendered exactly as the engines would send them and counted
+    with the model's tokenizer (tiktoken, when installed). Completion lengths
+    and latency come from the call ledger's history when there is one, and
+    from per-type defaults otherwise. Cost uses Settings.MODEL_PRICES; time
+    is bounded by latency and by the configured request and token limits,
+    summed over all endpoints (full buckets let the first minute's worth through at once).
+    """
+
+    MODES = ["serial", "async", "batch", "packed"]
+
+    def __init__(self, questions: List[Dict[str, Any]], ledger: CallLedger = None,
+                 replicates: int = None, scale_logprobs: bool = None, question_limit: int = None):
+        # The whole questionnaire is part of every prompt, even when only the first questions are asked
+        self.survey_questions = list(questions)
+        self.questions = self.survey_questions[:question_limit] if question_limit else self.survey_questions
+        self.replicates = max(1, replicates or Settings.SURVEY_REPLICATES)
+        self.scale_logprobs = Settings.SCALE_LOGPROBS if scale_logprobs is None else scale_logprobs
+
+        configs = load_endpoint_configs()
+        self.model = configs[0].get("model") or Settings.OPENAI_MODEL
+        self.requests_per_second = sum(c.get("requests_per_second") or Settings.REQUESTS_PER_SECOND for c in configs)
+        self.tokens_per_minute = sum(c.get("tokens_per_minute") or Settings.TOKENS_PER_MINUTE for c in configs)
+        # The request buckets start full, as do the token buckets (one minute's worth each)
+        self.request_burst = sum(c.get("burst") or Settings.RATE_LIMIT_BURST for c in configs)
+
+        self.prompts = PromptTemplates(model=self.model)
+        self.prompts.set_survey(self.survey_questions)
+        self.completion_history = ledger.completion_history() if ledger else {}
+        self.latency_history = ledger.average_latency() if ledger else None
+
+    def _cacheable_prefix_tokens(self) -> int:
+        """Prompt tokens every request after the first can read from the provider's cache"""
+        prefix = self.prompts.prefix_tokens()
+        if prefix < PROMPT_CACHE_MIN_TOKENS:
+            return 0
+        return prefix // PROMPT_CACHE_STEP_TOKENS * PROMPT_CACHE_STEP_TOKENS
+
+    def expected_completion_tokens(self, question: Dict[str, Any]) -> float:
+        """Tokens one answer to this question is expected to take"""
+        max_tokens = generation_params(question)["max_tokens"]
+        if question["question"] in self.completion_history:
+            return min(self.completion_history[question["question"]], max_tokens)
+
+        options = question.get("options", [])
+        option_tokens = [count_text_tokens(option, self.model) for option in options]
+        if question["type"] == "scale":
+            expected = 1
+        elif question["type"] == "multiple choice" and options:
+            expected = sum(option_tokens) / len(option_tokens)
+        elif question["type"] == "checkbox" and options:
+            selections = min(CHECKBOX_TYPICAL_SELECTIONS, len(options))
+            expected = sum(option_tokens) / len(option_tokens) * selections + selections - 1
+        else:
+            expected = OPEN_ENDED_COMPLETION_TOKENS
+        return min(expected, max_tokens)
+
+    def _latency(self, completion_tokens: float) -> float:
+        if self.latency_history is not None:
+            return self.latency_history
+        return BASE_LATENCY_SECONDS + completion_tokens * SECONDS_PER_COMPLETION_TOKEN
+
+    def _single_requests(self, personas: List[Persona], questions: List[Dict[str, Any]],
+                         live: bool = True) -> List[Dict[str, float]]:
+        """One request per (persona, question); replicates and logprobs only apply to live engines"""
+        requests = []
+        for question in questions:
+            distribution = live and self.scale_logprobs and question["type"] == "scale"
+            n = self.replicates if live and not distribution else 1
+            completion = 1 if distribution else self.expected_completion_tokens(question) * n
+            for persona in personas:
+                messages = self.prompts.messages(persona.get_prompt_context(), self.prompts.question_prompt(question))
+                requests.append({"prompt": count_prompt_tokens(messages, self.model), "completion": completion,
+                                 "latency": self._latency(completion)})
+        return requests
+
+    def _pack_groups(self, personas: List[Persona], question: Dict[str, Any], pack_size: int) -> List[List[Persona]]:
+        """Same grouping as PackedSurveyRunner, counted with the model's tokenizer"""
+        base_tokens = count_prompt_tokens(self.prompts.packed_messages(self.prompts.packed_prompt({}, question)),
+                                          self.model)
+        return pack_groups(personas, pack_size, base_tokens, lambda text: count_text_tokens(text, self.model))
+
+    def _packed_requests(self, personas: List[Persona], pack_size: int) -> List[Dict[str, float]]:
+        requests = []
+        for question in self.questions:
+            # Like PackedSurveyRunner._packable: replicated and logprob questions are asked singly, as live
+            distribution = self.scale_logprobs and question["type"] == "scale"
+            if question["type"] not in PackedSurveyRunner.PACKED_TYPES or self.replicates > 1 or distribution:
+                requests.extend(self._single_requests(personas, [question]))
+                continue
+            answer = self.expected_completion_tokens(question)
+            for group in self._pack_groups(personas, question, pack_size):
+                descriptions = {persona.id: persona.get_description() for persona in group}
+                messages = self.prompts.packed_messages(self.prompts.packed_prompt(descriptions, question))
+                # JSON object of {"persona_id": "answer", ...}
+                completion = 2 + sum(answer + count_text_tokens(f'"{pid}": "", ', self.model) for pid in descriptions)
+                requests.append({"prompt": count_prompt_tokens(messages, self.model), "completion": completion,
+                                 "latency": self._latency(completion)})
+        return requests
+
+    def _summarize(self, mode: str, requests: List[Dict[str, float]], parallelism: int = 1) -> Dict[str, Any]:
+        prompt_tokens = sum(r["prompt"] for r in requests)
+        completion_tokens = round(sum(r["completion"] for r in requests))
+        # Batch requests are not assumed to hit the prompt cache
+        cached_tokens = 0 if mode == "batch" else self._cacheable_prefix_tokens() * max(len(requests) - 1, 0)
+
+        cost = compute_cost(self.model, prompt_tokens, completion_tokens, cached_tokens)
+        if cost is not None and mode == "batch":
+            cost *= Settings.BATCH_PRICE_DISCOUNT
+
+        estimate = {
+            "mode": mode,
+            "requests": len(requests),
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "completion_tokens": completion_tokens,
+            "cost_usd": round(cost, 4) if cost is not None else None,
+            "duration_seconds": None,
+            "bottleneck": "Batch API completion window" if mode == "batch" else None
+        }
+        if mode != "batch" and requests:
+            limits = {
+                "latency": sum(r["latency"] for r in requests) / parallelism,
+                "requests per second": max(len(requests) - self.request_burst, 0) / self.requests_per_second,
+                "tokens per minute": max(prompt_tokens + completion_tokens - self.tokens_per_minute, 0)
+                                     / self.tokens_per_minute * 60
+            }
+            estimate["bottleneck"] = max(limits, key=limits.get)
+            estimate["duration_seconds"] = round(limits[estimate["bottleneck"]], 1)
+        return estimate
+
+    def estimate(self, personas: List[Persona], mode: str = "serial", concurrency: int = None,
+                 pack_size: int = None) -> Dict[str, Any]:
+        """Predicted requests, tokens, cost and duration of surveying these personas in one mode"""
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown mode: {mode}")
+        if mode == "packed":
+            return self._summarize(mode, self._packed_requests(personas, max(1, pack_size or Settings.PACK_SIZE)))
+
+        requests = self._single_requests(personas, self.questions, live=mode != "batch")
+        if mode == "async":
+            concurrency = max(1, concurrency or Settings.MAX_CONCURRENT_PERSONAS)
+            return self._summarize(mode, requests, parallelism=min(concurrency, max(len(personas), 1)))
+        return self._summarize(mode, requests)
+
+    def estimate_all(self, personas: List[Persona], concurrency: int = None,
+                     pack_size: int = None) -> Dict[str, Any]:
+        """Estimates for every engine mode, plus the assumptions they rest on"""
+        return {
+            "model": self.model,
+            "tokenizer": tokenizer_name(self.model),
+            # Without tiktoken every token count, and so every cost, is a chars-per-token guess
+            "approximate": not exact_token_counts(self.model),
+            "personas": len(personas),
+            "questions": len(self.questions),
+            "requests_per_second": self.requests_per_second,
+            "tokens_per_minute": self.tokens_per_minute,
+            "calibrated": bool(self.completion_history) or self.latency_history is not None,
+            "modes": {mode: self.estimate(personas, mode, concurrency, pack_size) for mode in self.MODES}
+        }
+
+    @staticmethod
+    def format_duration(seconds: Optional[float]) -> str:
+        if seconds is None:
+            return "up to 24h"
+        if seconds < 60:
+            return f"{seconds:.0f}s"
+        if seconds < 3600:
+            return f"{seconds / 60:.1f} min"
+        return f"{seconds / 3600:.1f} h"
@@ -0,0 +1,183 @@
+import time
+from typing import Any, Callable, Dict, List
+from personas import Persona
+from ai import GPTClient
+from ai.tokens import estimate_prompt_tokens, estimate_text_tokens
+from config.settings import Settings
+from .engine import SurveyEngine
+
+def pack_groups(personas: List[Persona], pack_size: int, base_tokens: int,
+                count_tokens: Callable[[str], int]) -> List[List[Persona]]:
+    """Group personas so each packed request stays within pack size, completion room and prompt token limits.
+
+    base_tokens is the packed prompt without any people; count_tokens counts a
+    person's line, with whichever tokenizer the caller budgets with.
+    """
+    limit = min(pack_size, max(1, (Settings.MAX_TOKENS - 20) // GPTClient.PAGE_TOKENS_DEFAULT))
+
+    groups, group, group_tokens = [], [], base_tokens
+    for persona in personas:
+        persona_tokens = count_tokens(f"[{persona.id}] {persona.get_description()}\n")
+        if group and (len(group) >= limit or group_tokens + persona_tokens > Settings.PACKING_MAX_PROMPT_TOKENS):
+            groups.append(group)
+            group, group_tokens = [], base_tokens
+        group.append(persona)
+        group_tokens += persona_tokens
+
+    if group:
+        groups.append(group)
+    return groups
+
+
+class PackedSurveyRunner:
+    """Answer closed questions for several personas per request, then demultiplex"""
+
+    PACKED_TYPES = ["scale", "multiple choice"]
+
+    def __init__(self, engine: SurveyEngine, pack_size: int = None):
+        self.engine = engine
+        self.pack_size = max(1, pack_size or Settings.PACK_SIZE)
+        self.stats = {"packed_requests": 0, "packed_answers": 0, "fallback_answers": 0}
+
+    def _pack_groups(self, personas: List[Persona], question: Dict[str, Any]) -> List[List[Persona]]:
+        base_tokens = estimate_prompt_tokens(self.engine.gpt_client.build_packed_messages({}, question))
+        return pack_groups(personas, self.pack_size, base_tokens, estimate_text_tokens)
+
+    def _packable(self, question: Dict[str, Any]) -> bool:
+        """Closed questions this run asks for one plain answer; replicated and logprob questions are asked singly"""
+        return (question["type"] in self.PACKED_TYPES and self.engine.replicates == 1
+                and not self.engine._uses_distribution(question))
+
+    def _ask_packed(self, group: List[Persona], question: Dict[str, Any]) -> Dict[str, str]:
+        try:
+            with self.engine._call_context(question=question, kind="packed"):
+                answers = self.engine._call_through_breaker(lambda: self.engine.gpt_client.get_packed_responses(
+                    {persona.id: persona.get_description() for persona in group},
+                    question
+                ))
+        except Exception as e:
+            print(f"  Packed request for Q{question['question']} failed, asking individually: {e}")
+            answers = {}
+        self.stats["packed_requests"] += 1
+        self.stats["packed_answers"] += len(answers)
+        return answers
+
+    def run(self, personas: List[Persona], progress_callback=None) -> List[Dict[str, Any]]:
+        """Survey personas, packing closed questions and asking the rest individually"""
+        engine = self.engine
+        questions_list = engine.questions.get_questions()
+        total_questions = len(questions_list)
+        total_personas = len(personas)
+        run_start = time.time()
+
+        print(f"Starting packed survey for {total_personas} personas (up to {self.pack_size} per request)...")
+        print(f"Survey ID: {engine.survey_id}")
+        engine.start_run(personas)
+
+        # When resuming, finished personas are skipped and stored answers are not asked again
+        completed = {persona.id: engine._completed_result(persona) for persona in personas}
+        active = [persona for persona in personas if not completed[persona.id]]
+        responses_by_persona: Dict[str, Dict[str, Any]] = {persona.id: engine._restore_responses(persona)
+                                                           for persona in active}
+        index_by_persona = {persona.id: i for i, persona in enumerate(personas, 1)}
+        # Every persona starts with the first packed request and is done at its last answer
+        finished_at = {persona.id: run_start for persona in active}
+
+        for q_index, question in enumerate(questions_list, 1):
+            pending = [persona for persona in active
+                       if str(question["question"]) not in responses_by_persona[persona.id]]
+            packable = self._packable(question)
+            packed_answers = {}
+            if packable:
+                for group in self._pack_groups(pending, question):
+                    packed_answers.update(self._ask_packed(group, question))
+
+            for persona in pending:
+                if progress_callback:
+                    progress_callback(index_by_persona[persona.id], total_personas, persona.id, q_index, total_questions)
+
+                survey_responses = responses_by_persona[persona.id]
+                try:
+                    distribution = replicates = None
+                    if persona.id in packed_answers:
+                        response = packed_answers[persona.id]
+                    else:
+                        if packable:
+                            self.stats["fallback_answers"] += 1
+                        # Asked the way the run asks every question, so all its answers are of one kind
+                        response, distribution, replicates = engine._ask_question(persona, question)
+
+                    engine._record_response(persona, question, response, survey_responses,
+                                            distribution, replicates)
+                except Exception as e:
+                    print(f"  {persona.id} Q{question['question']}: Error getting response: {e}")
+                    engine._record_error(question, e, survey_responses)
+                finished_at[persona.id] = time.time()
+
+        engine.last_run_wall_time = time.time() - run_start
+
+        results = []
+        for persona in personas:
+            if completed[persona.id]:
+                results.append(completed[persona.id])
+                continue
+            try:
+                results.append(engine._finish_persona(persona, responses_by_persona[persona.id], run_start,
+                                                      total_questions, end_time=finished_at[persona.id]))
+            except Exception as e:
+                print(f"Failed to complete survey for persona {persona.id}: {e}")
+                results.append(engine._persona_failure_result(persona, e))
+
+        engine.finish_run(results)
+        return results
+
+    def consistency_check(self, personas: List[Persona]) -> Dict[str, Any]:
+        """Compare packed and one-persona-per-request answers on a sample (nothing is stored)"""
+        client = self.engine.gpt_client
+        per_question = {}
+        total_compared = 0
+        total_agreed = 0
+
+        for question in self.engine.questions.get_questions():
+            if not self._packable(question):
+                continue
+
+            packed = {}
+            for group in self._pack_groups(personas, question):
+                packed.update(self._ask_packed(group, question))
+
+            compared = agreed = 0
+            scale_differences = []
+            for persona in personas:
+                if persona.id not in packed:
+                    continue
+                try:
+                    single = client.get_persona_response(persona.get_prompt_context(), question)
+                except Exception as e:
+                    print(f"  {persona.id} Q{question['question']}: unpacked request failed: {e}")
+                    continue
+
+                compared += 1
+                agreed += int(single == packed[persona.id])
+                if question["type"] == "scale":
+                    try:
+                        scale_differences.append(abs(float(single) - float(packed[persona.id])))
+                    except ValueError:
+                        pass
+
+            per_question[str(question["question"])] = {
+                "type": question["type"],
+                "compared": compared,
+                "agreement_rate": round(agreed / compared * 100, 1) if compared else None,
+                "mean_abs_difference": round(sum(scale_differences) / len(scale_differences), 2) if scale_differences else None
+            }
+            total_compared += compared
+            total_agreed += agreed
+
+        return {
+            "sample_size": len(personas),
+            "pack_size": self.pack_size,
+            "answers_compared": total_compared,
+            "agreement_rate": round(total_agreed / total_compared * 100, 1) if total_compared else None,
+            "questions": per_question
+        }
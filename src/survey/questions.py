@@ -41,6 +41,11 @@ class SurveyQuestions:
         if question["type"] in ["scale", "multiple choice", "checkbox"]:
             if "options" not in question or not question["options"]:
                 raise ValueError(f"Question type '{question['type']}' requires options")
+        
+        # Optional per-question overrides of the type's generation profile
+        unknown = set(question.get("generation", {})) - {"max_tokens", "stop", "logit_bias"}
+        if unknown:
+            raise ValueError(f"Unknown generation setting(s) for question {question['question']}: {', '.join(sorted(unknown))}")
     
     def get_questions(self) -> List[Dict[str, Any]]:
         """Get all questions"""
@@ -0,0 +1,200 @@
+import contextvars
+import math
+import re
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+from personas import Persona
+from ai.ledger import model_prices
+from config.settings import Settings
+from .engine import SurveyEngine
+from .estimator import SurveyEstimator
+
+def parse_deadline(text: str, now: datetime = None) -> datetime:
+    """'09:00' (its next occurrence), '90m', '2h', '45s' (from now) or an ISO date and time"""
+    now = now or datetime.now()
+    text = text.strip()
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([smh])", text)
+    if match:
+        return now + timedelta(seconds=float(match.group(1)) * {"s": 1, "m": 60, "h": 3600}[match.group(2)])
+    match = re.fullmatch(r"(\d{1,2}):(\d{2})", text)
+    if match:
+        deadline = now.replace(hour=int(match.group(1)), minute=int(match.group(2)), second=0, microsecond=0)
+        return deadline if deadline > now else deadline + timedelta(days=1)
+    return datetime.fromisoformat(text)
+
+def stratified_order(personas: List[Persona], fields: List[str] = None) -> List[Persona]:
+    """Interleave strata in proportion to their size, so any prefix of the order mirrors the panel"""
+    fields = fields or Settings.SCHEDULER_STRATA
+    strata: Dict[tuple, List[Persona]] = {}
+    for persona in personas:
+        strata.setdefault(tuple(getattr(persona, field) for field in fields), []).append(persona)
+
+    # The i-th of n personas in a stratum goes at position (i + 0.5) / n of the run
+    keyed = [((index + 0.5) / len(members), stratum, index, persona)
+             for stratum, members in enumerate(strata.values()) for index, persona in enumerate(members)]
+    return [entry[3] for entry in sorted(keyed, key=lambda entry: entry[:3])]
+
+
+class SurveyScheduler:
+    """Runs a survey within a spending budget and/or by a deadline, stopping cleanly between personas.
+
+    Personas are surveyed in stratum-balanced order on a pool of threads
+    sharing the engine's rate limiters. Spend comes from the client's live
+    per-call costs, each priced for the model that served it; cost and time
+    per persona start from SurveyEstimator's prediction and follow the
+    observed personas once there are any. A persona is only started if it
+    fits both constraints, so a stopped run holds whole personas in balanced
+    proportions and can be finished with --resume.
+    Concurrency is the least that meets the deadline (the maximum without one).
+    """
+
+    def __init__(self, engine: SurveyEngine, budget_usd: float = None, deadline: datetime = None,
+                 max_concurrency: int = None, strata: List[str] = None,
+                 report_callback: Callable[[Dict[str, Any]], None] = None):
+        self.engine = engine
+        self.budget_usd = budget_usd
+        self.deadline = deadline
+        self.max_concurrency = max(1, max_concurrency or Settings.SCHEDULER_MAX_CONCURRENCY)
+        self.strata = strata
+        self.report_callback = report_callback
+
+        self.estimator = SurveyEstimator(engine.questions.get_questions(), ledger=engine.gpt_client.ledger,
+                                         replicates=engine.replicates, scale_logprobs=engine.scale_logprobs)
+        self.model = self.estimator.model
+        if budget_usd is not None:
+            unpriced = [model for model in engine.gpt_client.endpoints.models if model_prices(model) is None]
+            if unpriced:
+                raise ValueError(f"No price for {', '.join(unpriced)} in MODEL_PRICES, so a budget can't be enforced")
+
+        self.prior: Dict[str, Any] = {}
+        self.stop_reason: Optional[str] = None
+        self.skipped = 0
+        self.surveyed = 0
+        self.persona_seconds: List[float] = []
+        self._baseline = engine.gpt_client.get_usage_stats()
+
+    def spent(self) -> float:
+        """USD spent by the engine's client since the scheduler was created, each call at its model's price"""
+        return self.engine.gpt_client.get_usage_stats()["cost_usd"] - self._baseline["cost_usd"]
+
+    def _cost_per_persona(self, in_flight: int) -> float:
+        if not self.surveyed:
+            return self.prior.get("cost_usd") or 0.0
+        # Personas still running are counted as half done
+        return self.spent() / (self.surveyed + in_flight / 2)
+
+    def _seconds_per_persona(self) -> float:
+        if not self.persona_seconds:
+            return self.prior.get("duration_seconds") or 0.0
+        return sum(self.persona_seconds) / len(self.persona_seconds)
+
+    def _target_concurrency(self, remaining: int) -> int:
+        """Fewest personas in flight that finish the remaining ones by the deadline"""
+        if self.deadline is None:
+            return self.max_concurrency
+        seconds_left = (self.deadline - datetime.now()).total_seconds()
+        if seconds_left <= 0:
+            return self.max_concurrency
+        needed = math.ceil(remaining * self._seconds_per_persona() / seconds_left)
+        return min(max(needed, 1), self.max_concurrency)
+
+    def _admission_check(self, in_flight: int) -> Optional[str]:
+        """Why another persona can't be started now, if it can't"""
+        if self.budget_usd is not None:
+            if self.spent() + (in_flight + 1) * self._cost_per_persona(in_flight) > self.budget_usd:
+                return "budget"
+        if self.deadline is not None:
+            if datetime.now() + timedelta(seconds=self._seconds_per_persona()) > self.deadline:
+                return "deadline"
+        return None
+
+    def status(self, remaining: int, in_flight: int, started: float) -> Dict[str, Any]:
+        """Spend so far and projected spend and finish time for the whole run"""
+        spent = self.spent()
+        elapsed = time.time() - started
+        if self.surveyed and elapsed > 0:
+            seconds_left = remaining / (self.surveyed / elapsed)
+        else:
+            seconds_left = remaining * self._seconds_per_persona() / self._target_concurrency(remaining)
+        return {
+            "surveyed": self.surveyed,
+            "remaining": remaining,
+            "in_flight": in_flight,
+            "concurrency": self._target_concurrency(remaining),
+            "spent_usd": round(spent, 4),
+            "projected_cost_usd": round(spent + remaining * self._cost_per_persona(in_flight), 4),
+            "projected_finish": datetime.now() + timedelta(seconds=seconds_left),
+            "budget_usd": self.budget_usd,
+            "deadline": self.deadline,
+            "stop_reason": self.stop_reason
+        }
+
+    def _report(self, status: Dict[str, Any]):
+        line = (f"  [schedule] {status['surveyed']} surveyed, {status['remaining']} left, "
+                f"${status['spent_usd']:.4f} spent, projected ${status['projected_cost_usd']:.4f}")
+        if self.budget_usd is not None:
+            line += f" of ${self.budget_usd:.2f}"
+        line += f", finish ~{status['projected_finish']:%H:%M:%S}"
+        if self.deadline is not None:
+            line += f" (deadline {self.deadline:%H:%M:%S})"
+        print(f"{line}, concurrency {status['concurrency']}")
+        if self.report_callback:
+            self.report_callback(status)
+
+    def run(self, personas: List[Persona]) -> List[Dict[str, Any]]:
+        """Survey personas until done, or until the next one would break the budget or deadline"""
+        order = stratified_order(personas, self.strata)
+        self.engine.start_run(order)
+        self.prior = self.estimator.estimate(order[:1], "serial")
+
+        print(f"Scheduling {len(order)} personas for run {self.engine.survey_id}"
+              f"{f', budget ${self.budget_usd:.2f}' if self.budget_usd is not None else ''}"
+              f"{f', deadline {self.deadline:%Y-%m-%d %H:%M:%S}' if self.deadline else ''}")
+
+        queue = deque(order)
+        in_flight = {}
+        results = []
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            while queue or in_flight:
+                remaining = len(queue) + len(in_flight)
+                while queue and not self.stop_reason and len(in_flight) < self._target_concurrency(remaining):
+                    self.stop_reason = self._admission_check(len(in_flight))
+                    if self.stop_reason:
+                        break
+                    persona = queue.popleft()
+                    future = executor.submit(contextvars.copy_context().run, self.engine.run_survey_for_persona, persona)
+                    in_flight[future] = persona
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    persona = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        print(f"Failed to complete survey for persona {persona.id}: {e}")
+                        result = self.engine._persona_failure_result(persona, e)
+                    results.append(result)
+                    # Personas finished in an earlier session cost nothing and say nothing about pace
+                    if not result.get("resumed"):
+                        self.surveyed += 1
+                        self.persona_seconds.append(result["completion_time_seconds"])
+                self._report(self.status(len(queue) + len(in_flight), len(in_flight), started))
+
+        self.engine.last_run_wall_time = time.time() - started
+        if queue:
+            # Only whole personas were surveyed; the rest stay in the run for --resume
+            completed = len([r for r in results if "error" not in r
+                             and r.get("successful_responses") == r.get("total_questions")])
+            self.engine.database.update_survey_run(self.engine.survey_id, "incomplete", completed)
+            print(f"Stopped to stay within the {self.stop_reason}: {len(queue)} personas not surveyed "
+                  f"(finish with: survey --resume {self.engine.survey_id})")
+        else:
+            self.engine.finish_run(results)
+        self.skipped = len(queue)
+        return results
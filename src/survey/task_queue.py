@@ -0,0 +1,222 @@
+import os
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from config.settings import Settings
+
+class SurveyTaskQueue:
+    """Durable queue of (survey run, persona, question) tasks in the survey database.
+
+    Workers lease tasks for a visibility timeout and extend the lease with
+    heartbeats while they work. A task whose lease runs out (its worker died)
+    becomes visible again, so delivery is at-least-once. Failed and expired
+    tasks are retried until they have been attempted QUEUE_MAX_ATTEMPTS times.
+
+    Pass wal=True from code that enqueues or works tasks: it switches the whole
+    survey database to write-ahead logging (a persistent setting of the file) so
+    workers can read while another one writes. Read-only callers leave it alone.
+    """
+
+    def __init__(self, db_path: str, wal: bool = False):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if wal:
+            self.enable_wal()
+        self.init_database()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode, so lease() can take the write lock up front with BEGIN IMMEDIATE
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def enable_wal(self):
+        """Put the survey database in WAL mode, which stays set for every later connection"""
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+
+    def init_database(self):
+        """Initialize the task table and the record of personas already finalized"""
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS survey_tasks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    survey_id TEXT NOT NULL,
+                    persona_id TEXT NOT NULL,
+                    question_number INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_expires_at REAL,
+                    last_error TEXT,
+                    updated_at REAL,
+                    UNIQUE (survey_id, persona_id, question_number)
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_survey_tasks_status ON survey_tasks (status, lease_expires_at)')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS survey_task_finalized (
+                    survey_id TEXT NOT NULL,
+                    persona_id TEXT NOT NULL,
+                    finalized_at REAL,
+                    PRIMARY KEY (survey_id, persona_id)
+                )
+            ''')
+
+    def enqueue(self, survey_id: str, persona_ids: List[str], question_numbers: List[int]) -> Dict[str, int]:
+        """Add one task per (persona, question); existing tasks are kept and failed ones retried.
+
+        Returns how many tasks were added and how many failed ones were queued again.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            before = conn.total_changes
+            conn.executemany(
+                'INSERT OR IGNORE INTO survey_tasks (survey_id, persona_id, question_number, updated_at) '
+                'VALUES (?, ?, ?, ?)',
+                [(survey_id, persona_id, number, now) for persona_id in persona_ids for number in question_numbers]
+            )
+            added = conn.total_changes - before
+            requeued = conn.execute("UPDATE survey_tasks SET status = 'pending', attempts = 0, updated_at = ? "
+                                    "WHERE survey_id = ? AND status = 'failed'", (now, survey_id)).rowcount
+            # Personas with work queued again are finalized again once it is done
+            conn.execute("DELETE FROM survey_task_finalized WHERE survey_id = ? AND persona_id IN "
+                         "(SELECT persona_id FROM survey_tasks WHERE survey_id = ? AND status = 'pending')",
+                         (survey_id, survey_id))
+            conn.execute('COMMIT')
+        return {"added": added, "requeued": requeued}
+
+    def lease(self, worker_id: str, limit: int = 1, lease_seconds: float = None,
+              max_attempts: int = None) -> List[Dict[str, Any]]:
+        """Claim up to `limit` visible tasks: pending ones, or leased ones whose lease expired.
+
+        An expired task that has already been leased max_attempts times is left
+        for fail_expired(), so a task that keeps crashing or hanging its worker
+        is not retried forever.
+        """
+        lease_seconds = lease_seconds or Settings.QUEUE_LEASE_SECONDS
+        max_attempts = max_attempts or Settings.QUEUE_MAX_ATTEMPTS
+        now = time.time()
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute('''
+                SELECT * FROM survey_tasks
+                WHERE status = 'pending' OR (status = 'leased' AND lease_expires_at < ? AND attempts < ?)
+                ORDER BY id LIMIT ?
+            ''', (now, max_attempts, limit)).fetchall()
+            conn.executemany('''
+                UPDATE survey_tasks
+                SET status = 'leased', lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1, updated_at = ?
+                WHERE id = ?
+            ''', [(worker_id, now + lease_seconds, now, row["id"]) for row in rows])
+            conn.execute('COMMIT')
+        return [dict(row, attempts=row["attempts"] + 1, lease_owner=worker_id) for row in rows]
+
+    def fail_expired(self, max_attempts: int = None) -> List[Tuple[str, str]]:
+        """Give up on tasks whose last allowed lease expired; returns (run, persona) for each of them"""
+        max_attempts = max_attempts or Settings.QUEUE_MAX_ATTEMPTS
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute("SELECT id, survey_id, persona_id FROM survey_tasks "
+                                "WHERE status = 'leased' AND lease_expires_at < ? AND attempts >= ?",
+                                (now, max_attempts)).fetchall()
+            conn.executemany("UPDATE survey_tasks SET status = 'failed', lease_owner = NULL, lease_expires_at = NULL, "
+                             "last_error = ?, updated_at = ? WHERE id = ?",
+                             [("Lease expired on the last attempt (worker crashed or hung)", now, row[0])
+                              for row in rows])
+            conn.execute('COMMIT')
+        return [(row[1], row[2]) for row in rows]
+
+    def heartbeat(self, worker_id: str, lease_seconds: float = None) -> int:
+        """Extend every lease this worker holds; returns how many it still holds"""
+        lease_seconds = lease_seconds or Settings.QUEUE_LEASE_SECONDS
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute("UPDATE survey_tasks SET lease_expires_at = ?, updated_at = ? "
+                                  "WHERE status = 'leased' AND lease_owner = ?", (now + lease_seconds, now, worker_id))
+            return cursor.rowcount
+
+    def complete(self, task_id: int, worker_id: str) -> bool:
+        """Mark a task done; False if the lease was lost to another worker in the meantime"""
+        with self._connect() as conn:
+            cursor = conn.execute("UPDATE survey_tasks SET status = 'done', lease_owner = NULL, updated_at = ? "
+                                  "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                                  (time.time(), task_id, worker_id))
+            return cursor.rowcount == 1
+
+    def fail(self, task_id: int, worker_id: str, error: str, max_attempts: int = None) -> Optional[str]:
+        """Return a task to the queue, or give up on it after max_attempts; returns its new status"""
+        max_attempts = max_attempts or Settings.QUEUE_MAX_ATTEMPTS
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute("SELECT attempts FROM survey_tasks WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                               (task_id, worker_id)).fetchone()
+            status = None
+            if row:
+                status = "failed" if row[0] >= max_attempts else "pending"
+                conn.execute("UPDATE survey_tasks SET status = ?, lease_owner = NULL, lease_expires_at = NULL, "
+                             "last_error = ?, updated_at = ? WHERE id = ?",
+                             (status, error[:500], time.time(), task_id))
+            conn.execute('COMMIT')
+        return status
+
+    def release(self, worker_id: str) -> int:
+        """Hand back a stopping worker's leases without counting them as attempts"""
+        with self._connect() as conn:
+            cursor = conn.execute("UPDATE survey_tasks SET status = 'pending', lease_owner = NULL, "
+                                  "lease_expires_at = NULL, attempts = MAX(attempts - 1, 0), updated_at = ? "
+                                  "WHERE status = 'leased' AND lease_owner = ?", (time.time(), worker_id))
+            return cursor.rowcount
+
+    def open_tasks(self, survey_id: str = None, persona_id: str = None) -> int:
+        """Tasks not yet done or failed, optionally for one run (and persona)"""
+        sql = "SELECT COUNT(*) FROM survey_tasks WHERE status IN ('pending', 'leased')"
+        params = []
+        if survey_id:
+            sql += " AND survey_id = ?"
+            params.append(survey_id)
+        if persona_id:
+            sql += " AND persona_id = ?"
+            params.append(persona_id)
+        with self._connect() as conn:
+            return conn.execute(sql, params).fetchone()[0]
+
+    def claim_finalization(self, survey_id: str, persona_id: str) -> bool:
+        """True for exactly one caller once none of the persona's tasks are open"""
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            claimed = False
+            if not conn.execute("SELECT 1 FROM survey_tasks WHERE survey_id = ? AND persona_id = ? "
+                                "AND status IN ('pending', 'leased') LIMIT 1", (survey_id, persona_id)).fetchone():
+                cursor = conn.execute("INSERT OR IGNORE INTO survey_task_finalized (survey_id, persona_id, finalized_at) "
+                                      "VALUES (?, ?, ?)", (survey_id, persona_id, time.time()))
+                claimed = cursor.rowcount == 1
+            conn.execute('COMMIT')
+        return claimed
+
+    def failed_tasks(self, survey_id: str, persona_id: str) -> Dict[int, str]:
+        """Questions given up on for a persona, with their last error"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT question_number, last_error FROM survey_tasks "
+                                "WHERE survey_id = ? AND persona_id = ? AND status = 'failed'",
+                                (survey_id, persona_id)).fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def failed_personas(self, survey_id: str) -> int:
+        """Personas in a run with at least one question given up on"""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(DISTINCT persona_id) FROM survey_tasks "
+                                "WHERE survey_id = ? AND status = 'failed'", (survey_id,)).fetchone()[0]
+
+    def progress(self) -> Dict[str, Dict[str, int]]:
+        """Task counts by status for each run in the queue"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT survey_id, status, COUNT(*) FROM survey_tasks "
+                                "GROUP BY survey_id, status").fetchall()
+        progress: Dict[str, Dict[str, int]] = {}
+        for survey_id, status, count in rows:
+            progress.setdefault(survey_id, {"pending": 0, "leased": 0, "done": 0, "failed": 0})[status] = count
+        return progress
@@ -0,0 +1,160 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Dict, List
+from personas import Persona, PersonaDatabase
+from ai import GPTClient
+from config.settings import Settings
+from .engine import SurveyEngine
+from .task_queue import SurveyTaskQueue
+
+def enqueue_survey(engine: SurveyEngine, personas: List[Persona], queue: SurveyTaskQueue = None) -> Dict[str, int]:
+    """Register the engine's run and queue one task per (persona, question); returns immediately
+
+    Returns the queue's counts of tasks added and failed tasks queued again.
+    """
+    queue = queue or SurveyTaskQueue(engine.database.db_path, wal=True)
+    engine.start_run(personas)
+    question_numbers = [question["question"] for question in engine.questions.get_questions()]
+    return queue.enqueue(engine.survey_id, [persona.id for persona in personas], question_numbers)
+
+
+class SurveyWorker:
+    """Pulls (run, persona, question) tasks from the queue and answers them.
+
+    Start as many workers (processes, or hosts sharing the database) as the API
+    limits allow; the shared rate-limit state keeps them within budget together.
+    A persona's answers go to its response_history once its last task is
+    finished, and a run is marked completed once none of its tasks are open.
+    """
+
+    def __init__(self, database_path: str, worker_id: str = None, lease_seconds: float = None,
+                 gpt_client: GPTClient = None):
+        self.database = PersonaDatabase(database_path)
+        self.queue = SurveyTaskQueue(database_path, wal=True)
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.lease_seconds = lease_seconds or Settings.QUEUE_LEASE_SECONDS
+        self.gpt_client = gpt_client
+        self.engines: Dict[str, SurveyEngine] = {}
+        self.stats = {"completed": 0, "retried": 0, "failed": 0, "already_answered": 0, "lost_leases": 0}
+        self._stop = threading.Event()
+
+    def _engine(self, survey_id: str) -> SurveyEngine:
+        """One engine per run, resumed from survey_runs so it answers with the run's options"""
+        if survey_id not in self.engines:
+            run = self.database.get_survey_run(survey_id)
+            if run is None:
+                raise ValueError(f"Unknown survey run: {survey_id}")
+            self.gpt_client = self.gpt_client or GPTClient()
+            self.engines[survey_id] = SurveyEngine(run["survey_file"], self.database.db_path,
+                                                   gpt_client=self.gpt_client, run_id=survey_id)
+        return self.engines[survey_id]
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            self.queue.heartbeat(self.worker_id, self.lease_seconds)
+
+    def stop(self):
+        """Finish the current task, hand back any others and return from run()"""
+        self._stop.set()
+
+    def run(self, drain: bool = True, poll_interval: float = None) -> Dict[str, int]:
+        """Process tasks until no open ones are left (or until stopped, with drain=False)"""
+        poll_interval = poll_interval or Settings.QUEUE_POLL_SECONDS
+        self._stop.clear()
+        threading.Thread(target=self._heartbeat, daemon=True).start()
+        print(f"Worker {self.worker_id} started")
+
+        try:
+            while not self._stop.is_set():
+                self._fail_expired()
+                tasks = self.queue.lease(self.worker_id, lease_seconds=self.lease_seconds)
+                if not tasks:
+                    # Tasks leased by other workers may still come back if those workers die
+                    if drain and self.queue.open_tasks() == 0:
+                        break
+                    self._stop.wait(poll_interval)
+                    continue
+                for task in tasks:
+                    self._process(task)
+        finally:
+            self._stop.set()
+            self.queue.release(self.worker_id)
+
+        print(f"Worker {self.worker_id} finished: {self.stats['completed']} tasks completed, "
+              f"{self.stats['retried']} retried, {self.stats['failed']} failed")
+        return dict(self.stats)
+
+    def _fail_expired(self):
+        """Give up on tasks whose last lease ran out and finalize their personas"""
+        expired = self.queue.fail_expired()
+        self.stats["failed"] += len(expired)
+        for survey_id, persona_id in sorted(set(expired)):
+            print(f"  {persona_id}: last lease in run {survey_id} expired, giving up on its task")
+            persona = self.database.get_persona(persona_id)
+            if persona is not None:
+                self._finalize_persona(self._engine(survey_id), persona)
+
+    def _process(self, task: Dict[str, Any]):
+        engine, persona = None, None
+        try:
+            engine = self._engine(task["survey_id"])
+            question = engine.questions.get_question_by_number(task["question_number"])
+            persona = self.database.get_persona(task["persona_id"])
+            if persona is None:
+                raise ValueError(f"Persona {task['persona_id']} not found")
+            if task["question_number"] in self.database.get_stored_responses(task["survey_id"], persona.id):
+                # An earlier lease holder stored the answer but didn't get to mark the task done
+                self.stats["already_answered"] += 1
+            else:
+                response, distribution, replicates = engine._ask_question(persona, question)
+                engine._record_response(persona, question, response, {}, distribution, replicates)
+                print(f"  {persona.id} Q{question['question']}: {response[:60]}")
+        except Exception as e:
+            status = self.queue.fail(task["id"], self.worker_id, str(e))
+            self.stats["failed" if status == "failed" else "retried"] += 1
+            print(f"  {task['persona_id']} Q{task['question_number']}: {e} ({status or 'lease lost'})")
+            if status != "failed":
+                return
+        else:
+            if self.queue.complete(task["id"], self.worker_id):
+                self.stats["completed"] += 1
+            else:
+                self.stats["lost_leases"] += 1
+
+        if persona is not None:
+            self._finalize_persona(engine, persona)
+
+    def _finalize_persona(self, engine: SurveyEngine, persona: Persona):
+        """Write the persona's answers to its history once none of its tasks are open.
+
+        A worker whose lease expired can finish a task after another worker redid
+        it, so both reach this point; only the one that claims the persona writes.
+        """
+        if not self.queue.claim_finalization(engine.survey_id, persona.id):
+            return
+
+        questions = engine.questions.get_questions()
+        restored = engine._restore_responses(persona)
+        failed = self.queue.failed_tasks(engine.survey_id, persona.id)
+        survey_responses = {}
+        for question in questions:
+            number = question["question"]
+            if str(number) in restored:
+                survey_responses[str(number)] = restored[str(number)]
+            elif number in failed:
+                engine._record_error(question, RuntimeError(failed[number]), survey_responses)
+        engine._finish_persona(persona, survey_responses, time.time(), len(questions))
+
+        if not self.queue.open_tasks(engine.survey_id):
+            run = self.database.get_survey_run(engine.survey_id)
+            failed_personas = self.queue.failed_personas(engine.survey_id)
+            self.database.update_survey_run(engine.survey_id, "incomplete" if failed_personas else "completed",
+                                            len(run["persona_ids"]) - failed_personas)
+
+
+def run_worker_process(database_path: str, drain: bool = True) -> Dict[str, int]:
+    """Entry point for one worker process"""
+    return SurveyWorker(database_path).run(drain=drain)
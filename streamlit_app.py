@@ -12,9 +12,10 @@ import plotly.graph_objects as go
 sys.path.insert(0, 'src')
 
 from personas import PersonaGenerator, PersonaDatabase, PersonaImporter, Persona
-from survey import SurveyEngine, SurveyQuestions
+from survey import SurveyEngine, SurveyQuestions, SurveyEstimator, enqueue_survey
 from data import DataExporter
 from ai import GPTClient
+from ai.ledger import CallLedger
 from config.settings import Settings
 
 # Page configuration
@@ -496,6 +497,16 @@ def show_survey_questions():
         st.error(f"Error loading survey questions: {e}")
         st.info("Make sure survey.json file exists and is properly formatted.")
 
+@st.cache_data(ttl=600, show_spinner="Estimating cost...")
+def estimate_survey_cost(persona_ids: tuple, test_mode: bool, database_path: str, survey_file: str):
+    """Estimate for the selected personas; cached, since every rerun of the page would render every prompt again"""
+    database = PersonaDatabase(database_path)
+    personas = [persona for persona in (database.get_persona(pid) for pid in persona_ids) if persona]
+    estimator = SurveyEstimator(SurveyQuestions(survey_file).get_questions(),
+                                ledger=CallLedger(database_path) if Settings.LLM_LEDGER_ENABLED else None,
+                                question_limit=3 if test_mode else None)
+    return estimator.estimate_all(personas)
+
 def show_run_survey():
     """Survey execution interface"""
     st.subheader("Run Survey")
@@ -532,6 +543,11 @@ def show_run_survey():
                 max_value=len(personas), 
                 value=0
             )
+            
+            # Interrupted runs pick up where they stopped
+            unfinished = [run["survey_id"] for run in st.session_state.database.get_survey_runs()
+                          if run["status"] != "completed"]
+            resume_run = st.selectbox("Resume interrupted run:", ["(new run)"] + unfinished) if unfinished else "(new run)"
     
     with col2:
         st.info("""
@@ -546,17 +562,56 @@ def show_run_survey():
         - Recommended for final data collection
         """)
     
-    # Cost estimation
-    if survey_mode == "Full Survey":
-        estimated_personas = len(personas) if persona_limit == 0 else persona_limit
-        estimated_cost = estimated_personas * 18 * 0.003  # Rough estimate
-        st.write(f"**Estimated cost:** ~${estimated_cost:.2f}")
+    # Cost and duration estimate from the rendered prompts (no API calls)
+    test_mode = survey_mode == "Test (3 questions)"
+    selected = [p for p in personas if p.id == persona_limit] if test_mode else personas[:persona_limit or None]
+    estimate = estimate_survey_cost(tuple(p.id for p in selected), test_mode, Settings.DATABASE_PATH,
+                                    Settings.SURVEY_FILE)
+    serial = estimate["modes"]["serial"]
+    if serial["cost_usd"] is not None:
+        st.write(f"**Estimated cost:** ~${serial['cost_usd']:.2f}, "
+                 f"about {SurveyEstimator.format_duration(serial['duration_seconds'])}"
+                 f"{' (approximate token counts: tiktoken is not installed)' if estimate['approximate'] else ''}")
+    with st.expander("Estimate by engine mode"):
+        st.dataframe(pd.DataFrame([
+            {
+                "Mode": mode,
+                "Requests": row["requests"],
+                "Prompt tokens": row["prompt_tokens"],
+                "Cached tokens": row["cached_tokens"],
+                "Completion tokens": row["completion_tokens"],
+                "Cost (USD)": row["cost_usd"],
+                "Duration": SurveyEstimator.format_duration(row["duration_seconds"]),
+                "Bound by": row["bottleneck"]
+            }
+            for mode, row in estimate["modes"].items()
+        ]), use_container_width=True)
+        st.caption(f"{estimate['model']}, tokens counted with {estimate['tokenizer']}"
+                   f"{' (approximate; pip install tiktoken for exact counts)' if estimate['approximate'] else ''}; "
+                   f"limits {estimate['requests_per_second']:g} requests/s and {estimate['tokens_per_minute']:,} tokens/min"
+                   f"{'; calibrated from past runs' if estimate['calibrated'] else ''}")
     
     if st.button("🚀 Start Survey", type="primary"):
         if survey_mode == "Test (3 questions)":
             run_test_survey(persona_limit)
         else:
-            run_full_survey(persona_limit if persona_limit > 0 else None)
+            run_full_survey(persona_limit if persona_limit > 0 else None,
+                            resume_run if resume_run != "(new run)" else None)
+    
+    # Worker processes keep going when this page is closed
+    if survey_mode == "Full Survey" and st.button("📥 Queue for workers"):
+        run_id = resume_run if resume_run != "(new run)" else None
+        if run_id:
+            run = st.session_state.database.get_survey_run(run_id)
+            queued = [p for p in personas if p.id in run["persona_ids"]]
+            engine = SurveyEngine(run["survey_file"], Settings.DATABASE_PATH, run_id=run_id)
+        else:
+            queued = selected
+            engine = SurveyEngine(Settings.SURVEY_FILE, Settings.DATABASE_PATH)
+        counts = enqueue_survey(engine, queued)
+        requeued = f" and retried {counts['requeued']} failed ones" if counts["requeued"] else ""
+        st.success(f"Queued {counts['added']} new tasks{requeued} as run {engine.survey_id}. "
+                   f"Start workers with `python src/main.py worker --processes N`.")
 
 def show_survey_status():
     """Show survey completion status"""
@@ -742,6 +797,7 @@ def show_settings():
             st.write(f"Max tokens: {Settings.MAX_TOKENS}")
             st.write(f"Temperature: {Settings.TEMPERATURE}")
             st.write(f"Rate limit: {Settings.REQUESTS_PER_SECOND} req/sec")
+            st.write(f"Token limit: {Settings.TOKENS_PER_MINUTE:,} tokens/min")
         
         with col2:
             st.write("**Paths:**")
@@ -762,7 +818,9 @@ def run_test_survey(persona_id):
     status_text = st.empty()
     
     try:
-        engine = SurveyEngine(Settings.SURVEY_FILE, Settings.DATABASE_PATH)
+        # All test questions at once, so the test takes about as long as its slowest question
+        engine = SurveyEngine(Settings.SURVEY_FILE, Settings.DATABASE_PATH,
+                              question_concurrency=Settings.INTERACTIVE_QUESTION_CONCURRENCY)
         
         status_text.text(f"Testing survey with {persona.id}...")
         
@@ -789,11 +847,17 @@ def run_test_survey(persona_id):
     except Exception as e:
         st.error(f"Test survey failed: {e}")
 
-def run_full_survey(persona_limit):
-    """Run full survey for all or limited personas"""
+def run_full_survey(persona_limit, resume_run=None):
+    """Run full survey for all or limited personas (or finish an interrupted run)"""
     personas = st.session_state.database.get_all_personas()
-    
-    if persona_limit:
+    survey_file = Settings.SURVEY_FILE
+    
+    if resume_run:
+        run = st.session_state.database.get_survey_run(resume_run)
+        by_id = {persona.id: persona for persona in personas}
+        personas = [by_id[persona_id] for persona_id in run["persona_ids"] if persona_id in by_id]
+        survey_file = run["survey_file"]
+    elif persona_limit:
         personas = personas[:persona_limit]
     
     progress_bar = st.progress(0)
@@ -801,7 +865,8 @@ def run_full_survey(persona_limit):
     results_container = st.empty()
     
     try:
-        engine = SurveyEngine(Settings.SURVEY_FILE, Settings.DATABASE_PATH)
+        engine = SurveyEngine(survey_file, Settings.DATABASE_PATH, run_id=resume_run)
+        engine.start_run(personas)
         
         results = []
         total_personas = len(personas)
@@ -822,10 +887,15 @@ def run_full_survey(persona_limit):
                 else:
                     st.success(f"✅ {persona.id}: {result['successful_responses']}/{result['total_questions']} responses")
         
+        engine.finish_run(results)
+        
         # Final statistics
         stats = engine.get_survey_statistics(results)
         
         st.success("🎉 Survey completed!")
+        if "resume" in stats:
+            st.caption(f"Resumed run {engine.survey_id}: {stats['resume']['personas_skipped']} personas already done, "
+                       f"{stats['resume']['answers_restored']} stored answers reused")
         
         col1, col2, col3 = st.columns(3)
         
@@ -838,6 +908,10 @@ def run_full_survey(persona_limit):
         with col3:
             st.metric("Avg per Persona", f"{stats['average_time_per_persona']:.1f}s")
         
+        pool = stats["http_pool"]
+        st.caption(f"HTTP pool: {pool['connection_reuse_rate']:.1f}% of requests reused a connection "
+                   f"({pool['new_connections']} opened, {pool['tls_seconds']:.2f}s in TLS handshakes)")
+        
         st.session_state.survey_completed = True
         
     except Exception as e:
@@ -6,8 +6,43 @@ Tests core functionality without requiring OpenAI API
 
 import sys
 import os
+from contextlib import contextmanager
 sys.path.insert(0, 'src')
 
+@contextmanager
+def mock_api(settings=None, **server_options):
+    """Run a mock OpenAI server with Settings pointed at it and every database and state file in a temp dir.
+
+    Yields (server, temp_dir). Values in `settings` override the defaults; a
+    callable value is called with the server, for settings that need its URL.
+    """
+    import tempfile
+    import shutil
+    from config.settings import Settings
+    from ai.mock_server import MockOpenAIServer
+    
+    temp_dir = tempfile.mkdtemp()
+    server = MockOpenAIServer(**{"latency_ms": 5, "latency_sigma": 0, **server_options}).start()
+    overrides = {"OPENAI_API_KEY": "sk-mock", "OPENAI_BASE_URL": server.base_url,
+                 "RESPONSE_CACHE_POLICY": "bypass", "TOKENS_PER_MINUTE": 10 ** 6,
+                 "DATABASE_PATH": os.path.join(temp_dir, "personas.db"),
+                 "RESPONSE_CACHE_PATH": os.path.join(temp_dir, "response_cache.db"),
+                 "RATE_LIMIT_STATE_FILE": os.path.join(temp_dir, "rate_limit_requests.json"),
+                 "TOKEN_LIMIT_STATE_FILE": os.path.join(temp_dir, "rate_limit_tokens.json")}
+    for name, value in (settings or {}).items():
+        overrides[name] = value(server) if callable(value) else value
+    originals = {name: getattr(Settings, name) for name in overrides}
+    for name, value in overrides.items():
+        setattr(Settings, name, value)
+    
+    try:
+        yield server, temp_dir
+    finally:
+        for name, value in originals.items():
+            setattr(Settings, name, value)
+        server.stop()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
 def test_persona_generation():
     """Test persona generation"""
     print("Testing persona generation...")
@@ -142,6 +177,935 @@ def test_data_export():
         print(f"✗ Data export test failed: {e}")
         shutil.rmtree(temp_dir, ignore_errors=True)
 
+def test_rate_limiter():
+    """Test shared token bucket rate limiter"""
+    print("\nTesting rate limiter...")
+    
+    import time
+    import tempfile
+    from ai.rate_limiter import TokenBucket
+    
+    state_file = os.path.join(tempfile.mkdtemp(), "bucket.json")
+    
+    # Two buckets on one state file share a single budget
+    first = TokenBucket(rate=20, capacity=2, state_file=state_file)
+    second = TokenBucket(rate=20, capacity=2, state_file=state_file)
+    
+    start = time.time()
+    for _ in range(3):
+        first.acquire()
+        second.acquire()
+    elapsed = time.time() - start
+    
+    # 6 tokens with a burst of 2 at 20/s needs at least 0.2s
+    assert elapsed >= 0.18, f"bucket did not throttle ({elapsed:.2f}s)"
+    print(f"✓ Shared bucket throttled 6 requests to {elapsed:.2f}s")
+    
+    os.remove(state_file)
+
+def test_response_cache():
+    """Test on-disk response cache policies"""
+    print("\nTesting response cache...")
+    
+    import tempfile
+    import shutil
+    from ai.response_cache import ResponseCache
+    
+    temp_dir = tempfile.mkdtemp()
+    db_path = os.path.join(temp_dir, "cache.db")
+    
+    try:
+        messages = [{"role": "user", "content": "How Tech Savvy do you consider yourself to be?"}]
+        key = ResponseCache.fingerprint(messages, "gpt-4o", 0.7, 500)
+        
+        cache = ResponseCache(db_path)
+        assert cache.get(key) is None
+        cache.put(key, "4", "gpt-4o")
+        assert cache.get(key) == "4"
+        assert cache.get_stats()["hits"] == 1 and cache.get_stats()["misses"] == 1
+        
+        # A different temperature is a different prompt fingerprint
+        assert ResponseCache.fingerprint(messages, "gpt-4o", 0.0, 500) != key
+        
+        read_only = ResponseCache(db_path, policy="read-only")
+        read_only.put(key, "5", "gpt-4o")
+        assert read_only.get(key) == "4"
+        
+        refresh = ResponseCache(db_path, policy="refresh")
+        assert refresh.get(key) is None
+        refresh.put(key, "5", "gpt-4o")
+        assert cache.get(key) == "5"
+        
+        print("✓ Cache hits, misses and policies behave as expected")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def test_batch_roundtrip():
+    """Test a Batch API run against the mock server: prepare, submit, wait and ingest"""
+    print("\nTesting batch survey round trip...")
+    
+    from personas import PersonaGenerator
+    from survey import SurveyEngine, BatchSurveyRunner
+    
+    with mock_api() as (server, temp_dir):
+        engine = SurveyEngine("survey.json", os.path.join(temp_dir, "batch.db"))
+        personas = PersonaGenerator().generate_personas(2)
+        for persona in personas:
+            engine.database.save_persona(persona)
+        
+        runner = BatchSurveyRunner(engine, temp_dir)
+        results = runner.run(personas, poll_interval=0.01)
+        stats = engine.get_survey_statistics(results)
+        
+        assert stats["response_rate"] == 100
+        assert server.stats["chat_requests"] == 0
+        stored = engine.database.get_survey_responses(personas[0].id, engine.survey_id)
+        assert len(stored) == engine.questions.get_question_count()
+        assert engine.database.get_persona(personas[0].id).response_history
+        assert engine.database.get_survey_run(engine.survey_id)["status"] == "completed"
+        
+        # Every batch result is in the call ledger, at the batch discount
+        calls = engine.gpt_client.ledger.run_summary(engine.survey_id)
+        assert calls["calls"] == len(personas) * engine.questions.get_question_count()
+        assert calls["prompt_tokens"] > 0 and calls["cost_usd"] > 0
+        
+        # Ingesting the same results again stores nothing twice
+        again = runner.ingest(runner.results_path(engine.survey_id))
+        assert again[0]["successful_responses"] == engine.questions.get_question_count()
+        assert len(engine.database.get_survey_responses(personas[0].id, engine.survey_id)) == len(stored)
+        assert engine.gpt_client.ledger.run_summary(engine.survey_id)["calls"] == calls["calls"]
+        
+        # Batch lines carry one plain answer each, so replicates are refused rather than dropped
+        try:
+            BatchSurveyRunner(SurveyEngine("survey.json", os.path.join(temp_dir, "batch.db"), replicates=3), temp_dir)
+            assert False, "replicates should be rejected for batch runs"
+        except ValueError:
+            pass
+        
+        print(f"✓ Ingested {stats['successful_responses']} batch responses for {len(results)} personas")
+
+def test_mock_server():
+    """Test a survey run against the local mock OpenAI server"""
+    print("\nTesting survey against the mock OpenAI server...")
+    
+    from personas import PersonaGenerator
+    from survey import SurveyEngine
+    
+    with mock_api(latency_sigma=0.5, rate_429=0.2, retry_after_ms=20) as (server, temp_dir):
+        engine = SurveyEngine("survey.json", os.path.join(temp_dir, "mock.db"))
+        persona = PersonaGenerator().generate_personas(1)[0]
+        engine.database.save_persona(persona)
+        
+        result = engine.run_survey_for_persona(persona)
+        assert result["successful_responses"] == result["total_questions"]
+        
+        # Answers are a pure function of persona and question
+        question = engine.questions.get_questions()[0]
+        messages = engine.gpt_client.build_persona_messages(persona.get_prompt_context(), question)
+        first = server.completion({"messages": messages})["choices"][0]["message"]["content"]
+        second = server.completion({"messages": messages})["choices"][0]["message"]["content"]
+        assert first == second
+        
+        # Keep-alive: later requests reuse the shared pool's connection
+        stats = engine.get_survey_statistics([result])
+        assert stats["http_pool"]["connection_reuse_rate"] > 0
+        
+        # Every request after the first reuses the shared instruction prefix
+        assert stats["prompts"]["prefix_cacheable"]
+        assert stats["token_usage"]["cached_tokens"] > 0
+        # Every English word is at least one token, so this holds whatever the tokenizer
+        from ai.prompts import PROMPT_CACHE_MIN_TOKENS
+        assert len(engine.gpt_client.prompts.shared_prefix().split()) >= PROMPT_CACHE_MIN_TOKENS
+        
+        # Per-type budgets are tighter than MAX_TOKENS yet fit every answer
+        assert stats["generation"]["truncated"] == 0
+        assert stats["generation"]["reserved_tokens_saved"] > 0
+        
+        print(f"✓ Answered {result['successful_responses']} questions "
+              f"({server.stats['throttled']} of {server.stats['chat_requests']} requests throttled)")
+
+def test_async_engine():
+    """Test the async engine: bounded persona concurrency, input order and limiter pacing"""
+    print("\nTesting async survey engine...")
+    
+    import time
+    from personas import PersonaGenerator
+    from survey import AsyncSurveyEngine
+    from ai.mock_server import MockResponder
+    
+    class RecordingResponder(MockResponder):
+        """Notes when each respondent's requests were answered"""
+        def __init__(self):
+            self.seen = {}
+    
+        def answer(self, body, salt=0):
+            respondent, _ = self._respondent_and_prompt(body)
+            self.seen.setdefault(respondent, []).append(time.time())
+            return super().answer(body, salt)
+    
+    responder = RecordingResponder()
+    rate, burst = 40, 5
+    settings = {"REQUESTS_PER_SECOND": rate, "RATE_LIMIT_BURST": burst}
+    with mock_api(latency_ms=20, responder=responder, settings=settings) as (server, temp_dir):
+        engine = AsyncSurveyEngine("survey.json", os.path.join(temp_dir, "async.db"), concurrency=2)
+        personas = PersonaGenerator().generate_personas(4)
+        engine.database.save_personas(personas)
+    
+        start = time.time()
+        results = engine.run_survey_for_all_personas(personas)
+        elapsed = time.time() - start
+    
+        assert [r["persona_id"] for r in results] == [p.id for p in personas]
+        assert all(r["successful_responses"] == r["total_questions"] for r in results)
+    
+        # Never more than `concurrency` personas between their first and last answer
+        spans = [(min(times), max(times)) for times in responder.seen.values()]
+        peak = max(sum(1 for first, last in spans if first <= moment <= last) for moment, _ in spans)
+        assert len(spans) == len(personas) and peak == 2
+    
+        # The shared token bucket holds the run to RATE_LIMIT_BURST plus REQUESTS_PER_SECOND
+        requests = server.stats["chat_requests"]
+        assert elapsed >= (requests - burst) / rate * 0.9, f"{requests} requests in {elapsed:.2f}s"
+    
+        print(f"✓ {len(personas)} personas, at most {peak} in flight, {requests} requests paced to {elapsed:.2f}s")
+
+def test_survey_paging():
+    """Test JSON survey pages, and asking individually whatever a page leaves out"""
+    print("\nTesting survey paging...")
+    
+    import json
+    from personas import PersonaGenerator
+    from survey import SurveyEngine
+    from ai.mock_server import MockResponder
+    
+    class UnreliablePages(MockResponder):
+        """The second page isn't JSON; every other page drops one answer and garbles a scale answer"""
+        def __init__(self):
+            self.pages = 0
+    
+        def answer(self, body, salt=0):
+            content = super().answer(body, salt)
+            if (body.get("response_format") or {}).get("type") != "json_object":
+                return content
+            self.pages += 1
+            if self.pages == 2:
+                return "Sorry, here are my answers: 4, 2, 5"
+            answers = json.loads(content)
+            del answers[next(iter(answers))]
+            garbled = next((number for number, answer in answers.items() if answer.isdigit()), None)
+            if garbled:
+                answers[garbled] = "somewhere in between"
+            return json.dumps(answers)
+    
+    responder = UnreliablePages()
+    with mock_api(responder=responder, settings={"REQUESTS_PER_SECOND": 1000, "RATE_LIMIT_BURST": 100}) as (server, temp_dir):
+        # page_size=0 asks every question in one page
+        whole = SurveyEngine("survey.json", os.path.join(temp_dir, "paging.db"), page_size=0)
+        first, second = PersonaGenerator().generate_personas(2)
+        result = whole.run_survey_for_persona(first)
+        questions = whole.questions.get_question_count()
+        paging = whole.get_survey_statistics([result])["paging"]
+        assert result["successful_responses"] == questions
+        assert paging["page_requests"] == 1 and 1 <= paging["reasked"] <= 2
+        assert server.stats["chat_requests"] == 1 + paging["reasked"]
+    
+        paged = SurveyEngine("survey.json", os.path.join(temp_dir, "paging.db"), page_size=4)
+        requests = server.stats["chat_requests"]
+        result = paged.run_survey_for_persona(second)
+        paging = paged.get_survey_statistics([result])["paging"]
+        pages = -(-questions // 4)
+        assert result["successful_responses"] == questions
+        assert paging["page_requests"] == pages
+        assert paging["paged_answers"] + paging["reasked"] == questions
+        # The unparseable page is re-asked in full, so well over one answer per page is missing
+        assert paging["reasked"] > pages
+        assert server.stats["chat_requests"] - requests == pages + paging["reasked"]
+    
+        print(f"✓ {pages} pages answered {paging['paged_answers']} of {questions} questions, "
+              f"{paging['reasked']} asked individually")
+
+def test_packed_survey():
+    """Test packing several personas per request, with fallback for personas a reply leaves out"""
+    print("\nTesting packed survey...")
+    
+    import json
+    from personas import PersonaGenerator
+    from survey import SurveyEngine, PackedSurveyRunner
+    from ai.mock_server import MockResponder
+    
+    class ForgetfulPacks(MockResponder):
+        """Every packed reply leaves out the last persona in the request"""
+        def answer(self, body, salt=0):
+            content = super().answer(body, salt)
+            if (body.get("response_format") or {}).get("type") != "json_object":
+                return content
+            answers = json.loads(content)
+            answers.pop(list(answers)[-1])
+            return json.dumps(answers)
+    
+    settings = {"REQUESTS_PER_SECOND": 1000, "RATE_LIMIT_BURST": 100}
+    with mock_api(latency_ms=20, responder=ForgetfulPacks(), settings=settings) as (server, temp_dir):
+        engine = SurveyEngine("survey.json", os.path.join(temp_dir, "packed.db"))
+        personas = PersonaGenerator().generate_personas(5)
+        engine.database.save_personas(personas)
+    
+        runner = PackedSurveyRunner(engine, pack_size=3)
+        results = runner.run(personas)
+    
+        assert [r["persona_id"] for r in results] == [p.id for p in personas]
+        assert all(r["successful_responses"] == r["total_questions"] for r in results)
+        # Five personas in packs of three: two requests per closed question, each missing one persona
+        packed_questions = len([q for q in engine.questions.get_questions() if q["type"] in runner.PACKED_TYPES])
+        assert runner.stats["packed_requests"] == 2 * packed_questions
+        assert runner.stats["fallback_answers"] == runner.stats["packed_requests"]
+        assert runner.stats["packed_answers"] == 3 * packed_questions
+        assert engine.database.get_survey_run(engine.survey_id)["status"] == "completed"
+    
+        # Each persona is timed from the first request to its own last answer
+        times = [r["completion_time_seconds"] for r in results]
+        assert all(0 < seconds <= engine.last_run_wall_time + 0.01 for seconds in times)
+        assert times[0] < times[-1]
+    
+        # With replicates nothing is packed, so every answer to a question is a set of replicates
+        replicated = SurveyEngine("survey.json", os.path.join(temp_dir, "packed.db"), replicates=2)
+        replicated_runner = PackedSurveyRunner(replicated, pack_size=3)
+        replicated_runner.run(personas[:2])
+        assert replicated_runner.stats["packed_requests"] == 0
+        stored = replicated.database.get_stored_responses(replicated.survey_id, personas[0].id)
+        assert all(len(rows) == 2 for rows in stored.values())
+    
+        print(f"✓ {runner.stats['packed_answers']} packed answers from {runner.stats['packed_requests']} requests, "
+              f"{runner.stats['fallback_answers']} asked individually")
+
+def test_aimd_window():
+    """Test the AIMD window against 429s: growth on success, one halving per burst, Retry-After pause"""
+    print("\nTesting AIMD concurrency window...")
+    
+    import threading
+    import time
+    from ai import GPTClient
+    from ai.concurrency import AIMDController
+    from survey import SurveyQuestions
+    
+    settings = {"REQUESTS_PER_SECOND": 1000, "RATE_LIMIT_BURST": 100}
+    with mock_api(retry_after_ms=300, settings=settings) as (server, temp_dir):
+        client = GPTClient()
+        # A window of its own, so earlier tests' throttling doesn't leak in
+        client.concurrency = AIMDController(initial=8)
+        question = SurveyQuestions("survey.json").get_questions()[0]
+        ask = lambda: client.get_persona_response("You are a project manager in Berlin.", question)
+    
+        for _ in range(8):
+            ask()
+        grown = client.get_concurrency_stats()["window"]
+        assert grown > 8
+    
+        # Every request is throttled until the flag is lowered mid-retry
+        server.rate_429 = 1.0
+        answered = {}
+        start = time.time()
+        worker = threading.Thread(target=lambda: answered.update(response=ask(), at=time.time()))
+        worker.start()
+        time.sleep(0.45)
+        throttled = client.get_concurrency_stats()
+        server.rate_429 = 0.0
+        worker.join()
+    
+        # Two 429s within the cooldown are one congestion event: the window halves once
+        assert throttled["throttle_events"] == 2
+        assert abs(throttled["window"] - grown / 2) < 0.02
+        assert throttled["paused_seconds_remaining"] > 0
+        # Each retry waited out the 300ms Retry-After
+        assert answered["response"] and answered["at"] - start >= 0.6
+    
+        print(f"✓ Window grew to {grown}, halved to {throttled['window']} after "
+              f"{throttled['throttle_events']} throttles, answered after {answered['at'] - start:.2f}s")
+
+def test_generation_profiles():
+    """Test per-question-type completion budgets and survey.json overrides"""
+    print("\nTesting generation profiles...")
+    
+    from config.settings import Settings
+    from ai.generation import generation_params
+    
+    scale = {"question": 1, "text": "Rate it", "type": "scale", "options": ["1", "2", "3", "4", "5"]}
+    choice = {"question": 2, "text": "Pick one", "type": "multiple choice",
+              "options": ["Before 2023", "My Manager's / Organization's request"]}
+    open_ended = {"question": 3, "text": "Why?", "type": "open-ended",
+                  "generation": {"max_tokens": 300, "stop": ["\n\n"]}}
+    
+    assert generation_params(scale)["max_tokens"] == 2
+    assert "logit_bias" not in generation_params(scale)
+    assert generation_params(choice)["stop"] == ["\n"]
+    assert generation_params(choice)["max_tokens"] * 4 >= len(choice["options"][1])
+    assert generation_params(open_ended) == {"max_tokens": 300, "stop": ["\n\n"]}
+    
+    original_bias = Settings.SCALE_LOGIT_BIAS
+    Settings.SCALE_LOGIT_BIAS = 5
+    try:
+        bias = generation_params(scale)["logit_bias"]
+        assert len(bias) == 5 and set(bias.values()) == {5}
+    finally:
+        Settings.SCALE_LOGIT_BIAS = original_bias
+    
+    print(f"✓ Budgets: scale {generation_params(scale)['max_tokens']}, "
+          f"multiple choice {generation_params(choice)['max_tokens']}, open-ended override 300")
+
+def test_scale_distribution():
+    """Test logprob scale distributions and the survey_responses migration"""
+    print("\nTesting logprob scale distributions...")
+    
+    import sqlite3
+    from personas import PersonaGenerator
+    from survey import SurveyEngine
+    
+    with mock_api(settings={"SCALE_LOGPROBS": True}) as (server, temp_dir):
+        db_path = os.path.join(temp_dir, "scale.db")
+    
+        # A database created before the distribution columns existed
+        with sqlite3.connect(db_path) as conn:
+            conn.execute('''CREATE TABLE survey_responses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, persona_id TEXT NOT NULL, survey_id TEXT NOT NULL,
+                question_number INTEGER NOT NULL, question_text TEXT NOT NULL, response TEXT NOT NULL,
+                response_type TEXT NOT NULL, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    
+        engine = SurveyEngine("survey.json", db_path)
+        persona = PersonaGenerator().generate_personas(1)[0]
+        engine.database.save_persona(persona)
+    
+        result = engine.run_survey_for_persona(persona)
+        assert result["successful_responses"] == result["total_questions"]
+    
+        scale_rows = [r for r in engine.database.get_survey_responses(persona.id, engine.survey_id)
+                      if r["response_type"] == "scale"]
+        assert scale_rows
+        for row in scale_rows:
+            assert abs(sum(row["distribution"].values()) - 1) < 0.01
+            assert row["argmax"] == row["response"]
+            assert 1 <= row["expected_value"] <= 5
+    
+        print(f"✓ {len(scale_rows)} scale answers stored with distributions, "
+              f"e.g. expected value {scale_rows[0]['expected_value']} (argmax {scale_rows[0]['argmax']})")
+
+def test_replicates():
+    """Test n>1 replicate sampling: one request per question, one row per replicate"""
+    print("\nTesting replicate sampling...")
+    
+    from personas import PersonaGenerator
+    from survey import SurveyEngine
+    
+    with mock_api() as (server, temp_dir):
+        engine = SurveyEngine("survey.json", os.path.join(temp_dir, "replicates.db"), replicates=3)
+        persona = PersonaGenerator().generate_personas(1)[0]
+        engine.database.save_persona(persona)
+    
+        result = engine.run_survey_for_persona(persona)
+        assert result["successful_responses"] == result["total_questions"]
+        assert server.stats["chat_requests"] == result["total_questions"]
+    
+        rows = engine.database.get_survey_responses(persona.id, engine.survey_id)
+        assert len(rows) == 3 * result["total_questions"]
+        assert {row["replicate_index"] for row in rows} == {0, 1, 2}
+    
+        replicates = engine.get_survey_statistics([result])["replicates"]
+        assert 0 < replicates["mean_agreement"] <= 1
+    
+        print(f"✓ {len(rows)} answers from {server.stats['chat_requests']} requests, "
+              f"mean agreement {replicates['mean_agreement']:.2f}")
+
+def test_call_ledger():
+    """Test that every API request lands in the llm_calls ledger with tokens and cost"""
+    print("\nTesting call ledger...")
+    
+    from config.settings import Settings
+    from personas import PersonaGenerator
+    from survey import SurveyEngine
+    from ai.ledger import compute_cost
+    
+    assert compute_cost("gpt-4o-2024-08-06", 1000, 100, 0) == compute_cost("gpt-4o", 1000, 100, 0)
+    assert compute_cost("gpt-4o", 2048, 0, 1024) < compute_cost("gpt-4o", 2048, 0, 0)
+    assert compute_cost("unknown-model", 1000, 100) is None
+    
+    with mock_api() as (server, temp_dir):
+        engine = SurveyEngine("survey.json", os.path.join(temp_dir, "ledger.db"))
+        persona = PersonaGenerator().generate_personas(1)[0]
+        engine.database.save_persona(persona)
+    
+        result = engine.run_survey_for_persona(persona)
+        assert result["successful_responses"] == result["total_questions"]
+    
+        ledger = engine.gpt_client.ledger
+        summary = ledger.run_summary(engine.survey_id)
+        assert summary["calls"] == server.stats["chat_requests"]
+        assert summary["personas"] == 1 and summary["failed_calls"] == 0
+        assert summary["prompt_tokens"] > 0 and summary["cost_usd"] > 0
+    
+        questions = ledger.question_summary(engine.survey_id)
+        assert len(questions) == result["total_questions"]
+        assert ledger.cost_per_persona() > 0
+    
+        # The ledger lives in the engine's database only; the default one is never created
+        assert ledger.db_path == engine.database.db_path
+        assert not os.path.exists(Settings.DATABASE_PATH)
+    
+        print(f"✓ {summary['calls']} calls recorded, ${summary['cost_usd']:.4f} "
+              f"({summary['prompt_tokens']} prompt + {summary['completion_tokens']} completion tokens)")
+
+def test_survey_estimator():
+    """Test the offline estimate against a mock run recorded in the call ledger"""
+    print("\nTesting survey estimator...")
+    
+    from personas import PersonaGenerator
+    from survey import SurveyEngine, SurveyEstimator
+    
+    with mock_api() as (server, temp_dir):
+        engine = SurveyEngine("survey.json", os.path.join(temp_dir, "estimate.db"))
+        personas = PersonaGenerator().generate_personas(2)
+        questions = engine.questions.get_questions()
+    
+        # Before any run: defaults only
+        estimate = SurveyEstimator(questions).estimate_all(personas, pack_size=2)
+        serial, batch, packed = (estimate["modes"][mode] for mode in ["serial", "batch", "packed"])
+        assert serial["requests"] == len(personas) * len(questions)
+        assert packed["requests"] < serial["requests"]
+        assert batch["cost_usd"] < serial["cost_usd"] and batch["duration_seconds"] is None
+        assert serial["cached_tokens"] > 0
+        assert estimate["approximate"] == estimate["tokenizer"].startswith("heuristic")
+        test_estimate = SurveyEstimator(questions, question_limit=3).estimate(personas[:1])
+        assert test_estimate["requests"] == 3
+    
+        for persona in personas:
+            engine.database.save_persona(persona)
+            engine.run_survey_for_persona(persona)
+        actual = engine.gpt_client.ledger.run_summary(engine.survey_id)
+    
+        # Calibrated by the run just recorded, the estimate should match it closely
+        calibrated = SurveyEstimator(questions, ledger=engine.gpt_client.ledger)
+        predicted = calibrated.estimate(personas, "serial")
+        assert predicted["requests"] == actual["calls"]
+        assert abs(predicted["prompt_tokens"] - actual["prompt_tokens"]) <= 0.05 * actual["prompt_tokens"]
+        assert abs(predicted["completion_tokens"] - actual["completion_tokens"]) <= 0.1 * actual["completion_tokens"]
+    
+        print(f"✓ Estimated {predicted['prompt_tokens']} prompt / {predicted['completion_tokens']} completion tokens, "
+              f"recorded {actual['prompt_tokens']} / {actual['completion_tokens']} ({estimate['tokenizer']})")
+
+def test_resumable_run():
+    """Test resuming an interrupted run: finished personas are skipped, stored answers reused"""
+    print("\nTesting resumable survey runs...")
+    
+    from personas import PersonaGenerator
+    from survey import SurveyEngine
+    
+    with mock_api() as (server, temp_dir):
+        db_path = os.path.join(temp_dir, "resume.db")
+        first = SurveyEngine("survey.json", db_path)
+        done, partial = PersonaGenerator().generate_personas(2)
+        for persona in (done, partial):
+            first.database.save_persona(persona)
+    
+        # Interrupted run: one persona finished, the other stopped after three answers
+        first.start_run([done, partial])
+        first.run_survey_for_persona(done)
+        questions = first.questions.get_questions()
+        for question in questions[:3]:
+            first._record_response(partial, question, question.get("options", ["x"])[0], {})
+        # A second delivery of the same answer (an expired queue lease) is not stored as a replicate
+        first._record_response(partial, questions[0], "duplicate", {})
+        assert len(first.database.get_stored_responses(first.survey_id, partial.id)[questions[0]["question"]]) == 1
+        requests_before = server.stats["chat_requests"]
+    
+        resumed = SurveyEngine("survey.json", db_path, run_id=first.survey_id)
+        assert resumed.survey_id == first.survey_id
+        personas = [resumed.database.get_persona(p.id) for p in (done, partial)]
+        results = resumed.run_survey_for_all_personas(personas)
+    
+        assert server.stats["chat_requests"] - requests_before == len(questions) - 3
+        assert results[0]["resumed"] and results[1]["successful_responses"] == len(questions)
+        assert len(resumed.database.get_survey_responses(partial.id, first.survey_id)) == len(questions)
+        history = [e for e in resumed.database.get_persona(partial.id).response_history
+                   if e["survey_id"] == first.survey_id]
+        assert len(history) == 1 and len(history[0]["responses"]) == len(questions)
+        assert resumed.database.get_survey_run(first.survey_id)["status"] == "completed"
+    
+        stats = resumed.get_survey_statistics(results)["resume"]
+        assert stats == {"personas_skipped": 1, "answers_restored": 3}
+    
+        print(f"✓ Resumed {first.survey_id}: {len(questions) - 3} calls instead of {2 * len(questions)}")
+
+def test_task_queue():
+    """Test queue leases, expiry, retries and two workers draining a queued run"""
+    print("\nTesting survey task queue...")
+    
+    import sqlite3
+    import threading
+    import time
+    from personas import PersonaGenerator
+    from survey import SurveyEngine, SurveyTaskQueue, SurveyWorker, enqueue_survey
+    
+    with mock_api() as (server, temp_dir):
+        # Lease semantics, without any API calls
+        queue = SurveyTaskQueue(os.path.join(temp_dir, "queue.db"))
+        assert queue.enqueue("run", ["A"], [1, 2]) == {"added": 2, "requeued": 0}
+        assert queue.enqueue("run", ["A"], [1, 2]) == {"added": 0, "requeued": 0}
+        first = queue.lease("w1", limit=1, lease_seconds=0.05)
+        second = queue.lease("w2", limit=1)
+        assert len(first) == 1 and second[0]["question_number"] == 2
+        assert queue.lease("w2") == []
+        time.sleep(0.1)
+        stolen = queue.lease("w2", lease_seconds=60)
+        assert stolen[0]["id"] == first[0]["id"] and stolen[0]["attempts"] == 2
+        assert not queue.complete(first[0]["id"], "w1")
+        assert queue.fail(stolen[0]["id"], "w2", "boom", max_attempts=2) == "failed"
+        assert queue.failed_tasks("run", "A") == {1: "boom"}
+        assert queue.heartbeat("w2") == 1
+        assert not queue.claim_finalization("run", "A")
+        assert queue.complete(second[0]["id"], "w2") and queue.open_tasks("run", "A") == 0
+        assert queue.claim_finalization("run", "A") and not queue.claim_finalization("run", "A")
+        with sqlite3.connect(queue.db_path) as conn:
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+        assert queue.enqueue("run", ["A"], [1, 2]) == {"added": 0, "requeued": 1}
+    
+        # A task whose last allowed lease runs out is given up on, not leased again
+        hung = queue.lease("w3", lease_seconds=0.05, max_attempts=1)
+        assert hung[0]["question_number"] == 1
+        time.sleep(0.1)
+        assert queue.lease("w4", max_attempts=1) == []
+        assert queue.fail_expired(max_attempts=1) == [("run", "A")]
+        assert queue.open_tasks("run") == 0 and 1 in queue.failed_tasks("run", "A")
+    
+        # Two workers drain a queued run into the survey database
+        db_path = os.path.join(temp_dir, "survey.db")
+        engine = SurveyEngine("survey.json", db_path)
+        personas = PersonaGenerator().generate_personas(2)
+        for persona in personas:
+            engine.database.save_persona(persona)
+        added = enqueue_survey(engine, personas)["added"]
+        assert added == 2 * engine.questions.get_question_count()
+    
+        workers = [SurveyWorker(db_path, worker_id=f"worker{i}") for i in range(2)]
+        threads = [threading.Thread(target=worker.run, kwargs={"poll_interval": 0.05}) for worker in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=120)
+    
+        assert sum(worker.stats["completed"] for worker in workers) == added
+        assert server.stats["chat_requests"] == added
+        for persona in personas:
+            history = engine.database.get_persona(persona.id).response_history
+            assert len(history) == 1 and len(history[0]["responses"]) == engine.questions.get_question_count()
+        assert engine.database.get_survey_run(engine.survey_id)["status"] == "completed"
+    
+        print(f"✓ {added} tasks drained by 2 workers "
+              f"({', '.join(str(worker.stats['completed']) for worker in workers)})")
+
+def test_shard_merge():
+    """Test splitting personas into shards, surveying each and merging them back idempotently"""
+    print("\nTesting shard and merge...")
+    
+    import sqlite3
+    from personas import PersonaGenerator, PersonaDatabase
+    from survey import SurveyEngine
+    from research import ShardManager, ShardRing
+    
+    with mock_api() as (server, temp_dir):
+        # Adding a shard only moves the personas the new shard takes over
+        ids = [f"persona_{i}" for i in range(1000)]
+        before, after = ShardRing(["a", "b", "c"]), ShardRing(["a", "b", "c", "d"])
+        moved = [i for i in ids if before.shard_for(i) != after.shard_for(i)]
+        assert all(after.shard_for(i) == "d" for i in moved) and len(moved) < 400
+    
+        db_path = os.path.join(temp_dir, "primary.db")
+        shard_dir = os.path.join(temp_dir, "shards")
+        database = PersonaDatabase(db_path)
+        database.save_personas(PersonaGenerator().generate_personas(6))
+    
+        manager = ShardManager(db_path, shard_dir)
+        manifest = manager.partition(2, config={"page_size": 0})
+        run_id = manifest["run_id"]
+        assert sum(shard["personas"] for shard in manifest["shards"]) == 6
+    
+        # Each "node" resumes the shared run on its own shard
+        for shard in manifest["shards"]:
+            engine = SurveyEngine("survey.json", os.path.join(shard_dir, shard["file"]), run_id=run_id)
+            engine.start_run(engine.database.get_all_personas())
+            engine.finish_run(engine.run_survey_for_all_personas(engine.database.get_all_personas()))
+        questions = len(engine.questions.get_questions())
+    
+        report = manager.merge()
+        assert report["responses_added"] == 6 * questions and report["history_added"] == 6
+        assert not report["conflicts"] and report["calls_added"] > 0
+        assert database.get_survey_run(run_id)["status"] == "completed"
+    
+        again = manager.merge()
+        assert again["responses_added"] == again["history_added"] == again["calls_added"] == 0
+    
+        # A shard answer that disagrees with the merged one is reported, not copied
+        busiest = max(manifest["shards"], key=lambda shard: shard["personas"])
+        shard_path = os.path.join(shard_dir, busiest["file"])
+        with sqlite3.connect(shard_path) as conn:
+            persona_id, number = conn.execute("SELECT persona_id, question_number FROM survey_responses "
+                                              "LIMIT 1").fetchone()
+            conn.execute("UPDATE survey_responses SET response = 'changed' WHERE persona_id = ? "
+                         "AND question_number = ?", (persona_id, number))
+        conflicts = manager.merge()["conflicts"]
+        assert [c["kind"] for c in conflicts] == ["response"] and conflicts[0]["persona_id"] == persona_id
+        assert database.get_stored_responses(run_id, persona_id)[number][0]["response"] != "changed"
+    
+        print(f"✓ Merged 2 shards ({report['responses_added']} answers), re-merge idempotent, "
+              f"{len(moved)} of 1000 personas moved when adding a shard")
+
+def test_question_fan_out():
+    """Test asking one persona's questions concurrently: same order, isolated errors, less wall time"""
+    print("\nTesting per-question fan-out...")
+    
+    from personas import PersonaGenerator
+    from survey import SurveyEngine
+    
+    with mock_api(latency_ms=50, settings={"REQUESTS_PER_SECOND": 1000, "RATE_LIMIT_BURST": 100}) as (server, temp_dir):
+        db_path = os.path.join(temp_dir, "fanout.db")
+        sequential = SurveyEngine("survey.json", db_path)
+        parallel = SurveyEngine("survey.json", db_path, question_concurrency=8)
+        first, second = PersonaGenerator().generate_personas(2)
+        questions = parallel.questions.get_questions()
+    
+        # One question fails; the others are still answered
+        failing = questions[4]["question"]
+        ask = parallel._ask_question
+        def ask_or_fail(persona, question):
+            if question["question"] == failing:
+                raise RuntimeError("simulated failure")
+            return ask(persona, question)
+        parallel._ask_question = ask_or_fail
+    
+        baseline = sequential.run_survey_for_persona(first)
+        result = parallel.run_survey_for_persona(second)
+    
+        assert list(result["responses"]) == [str(q["question"]) for q in questions]
+        assert result["successful_responses"] == len(questions) - 1
+        assert "simulated failure" in result["responses"][str(failing)]["error"]
+        assert len(parallel.database.get_survey_responses(second.id, parallel.survey_id)) == len(questions) - 1
+        assert result["completion_time_seconds"] < baseline["completion_time_seconds"] / 2
+    
+        # Resuming re-asks only the failed question; progress still counts the restored answers
+        parallel.start_run([second])
+        resumed = SurveyEngine("survey.json", db_path, question_concurrency=8, run_id=parallel.survey_id)
+        progress = []
+        resumed.run_survey_for_persona(second, lambda *args: progress.append(args))
+        assert progress == [(second.id, len(questions), len(questions))]
+    
+        test = parallel.test_single_persona(first, question_limit=3)
+        assert list(test["test_responses"]) == [str(q["question"]) for q in questions[:3]]
+    
+        print(f"✓ {len(questions)} questions in {result['completion_time_seconds']}s "
+              f"instead of {baseline['completion_time_seconds']}s, one failure isolated")
+
+def test_survey_scheduler():
+    """Test budget- and deadline-bounded runs: balanced order, clean stops and resuming"""
+    print("\nTesting survey scheduler...")
+    
+    from collections import Counter
+    from datetime import datetime, timedelta
+    from config.settings import Settings
+    from personas import PersonaGenerator
+    from survey import SurveyEngine, SurveyScheduler, parse_deadline
+    from survey.scheduler import stratified_order
+    from ai.ledger import compute_cost
+    
+    now = datetime(2025, 1, 31, 10, 0)
+    assert parse_deadline("90m", now) == now + timedelta(minutes=90)
+    assert parse_deadline("09:00", now) == datetime(2025, 2, 1, 9, 0)
+    
+    personas = PersonaGenerator().generate_personas(12)
+    for persona, department in zip(personas, "AAAAAABBBCCC"):
+        persona.department, persona.location = department, "Remote"
+    assert Counter(p.department for p in stratified_order(personas)[:4]) == {"A": 2, "B": 1, "C": 1}
+    
+    with mock_api(settings={"REQUESTS_PER_SECOND": 1000, "RATE_LIMIT_BURST": 100}) as (server, temp_dir):
+        db_path = os.path.join(temp_dir, "schedule.db")
+        personas = PersonaGenerator().generate_personas(6)
+        calibration = SurveyEngine("survey.json", os.path.join(temp_dir, "calibration.db"))
+        calibration.run_survey_for_persona(personas[0])
+        usage = calibration.gpt_client.get_usage_stats()
+        persona_cost = compute_cost(Settings.OPENAI_MODEL, usage["prompt_tokens"], usage["completion_tokens"],
+                                    usage["cached_tokens"])
+        assert abs(usage["cost_usd"] - persona_cost) < 1e-6
+    
+        engine = SurveyEngine("survey.json", db_path)
+        engine.database.save_personas(personas)
+        budget = persona_cost * 2.5
+        scheduler = SurveyScheduler(engine, budget_usd=budget, max_concurrency=1)
+        results = scheduler.run(personas)
+    
+        assert scheduler.stop_reason == "budget" and 1 <= len(results) <= 3
+        assert scheduler.spent() <= budget * 1.2
+        assert all(r["successful_responses"] == r["total_questions"] for r in results)
+        assert engine.database.get_survey_run(engine.survey_id)["status"] == "incomplete"
+    
+        # A deadline that leaves no time for a persona starts none
+        resumed = SurveyEngine("survey.json", db_path, run_id=engine.survey_id)
+        assert SurveyScheduler(resumed, deadline=datetime.now()).run(personas) == []
+    
+        # Without a binding limit the resumed run finishes only the personas left over
+        finisher = SurveyScheduler(resumed, deadline=datetime.now() + timedelta(hours=1), max_concurrency=3)
+        finished = finisher.run([resumed.database.get_persona(p.id) for p in personas])
+        assert finisher.stop_reason is None and finisher.surveyed == len(personas) - len(results)
+        assert resumed.database.get_survey_run(engine.survey_id)["status"] == "completed"
+    
+        print(f"✓ Budget ${budget:.4f} stopped after {len(results)} personas (${scheduler.spent():.4f}), "
+              f"resumed run surveyed the other {finisher.surveyed}")
+
+def test_endpoint_pool():
+    """Test routing across two mock endpoints, one of them throttling"""
+    print("\nTesting multi-endpoint routing...")
+    
+    from personas import PersonaGenerator
+    from survey import SurveyEngine
+    from ai.mock_server import MockOpenAIServer
+    
+    busy = MockOpenAIServer(latency_ms=5, latency_sigma=0, rate_429=0.5, retry_after_ms=200).start()
+    endpoint_configs = lambda idle: [
+        {"name": "busy", "api_key": "sk-mock-1", "base_url": busy.base_url, "requests_per_second": 50, "burst": 10},
+        {"name": "idle", "api_key": "sk-mock-2", "base_url": idle.base_url, "requests_per_second": 50, "burst": 10}
+    ]
+    
+    try:
+        with mock_api(settings={"OPENAI_ENDPOINTS": endpoint_configs}) as (idle, temp_dir):
+            engine = SurveyEngine("survey.json", os.path.join(temp_dir, "endpoints.db"))
+            persona = PersonaGenerator().generate_personas(1)[0]
+            engine.database.save_persona(persona)
+        
+            result = engine.run_survey_for_persona(persona)
+            endpoints = engine.get_survey_statistics([result])["endpoints"]
+        
+            assert result["successful_responses"] == result["total_questions"]
+            assert endpoints["busy"]["requests"] > 0 and endpoints["idle"]["requests"] > 0
+            assert endpoints["idle"]["throttles"] == 0
+        
+            print(f"✓ Routed {endpoints['idle']['requests']} requests to the idle endpoint and "
+                  f"{endpoints['busy']['requests']} to the busy one ({endpoints['busy']['throttles']} failed over)")
+    finally:
+        busy.stop()
+
+def test_hedge_policy():
+    """Test hedge deadlines and caps"""
+    print("\nTesting hedge policy...")
+    
+    from ai.hedging import HedgePolicy
+    
+    policy = HedgePolicy(percentile=0.9, min_samples=10, max_ratio=0.2, max_extra_tokens=1000)
+    assert policy.deadline(500) is None
+    
+    for i in range(1, 11):
+        policy.record_latency(500, i / 10)
+    assert policy.deadline(500) == 1.0
+    assert policy.deadline(2000) is None  # learned per request kind
+    
+    for _ in range(10):
+        policy.start_request()
+    assert policy.try_hedge(400) and policy.try_hedge(400)
+    assert not policy.try_hedge(400)  # ratio cap: 2 hedges per 10 requests
+    
+    for _ in range(10):
+        policy.start_request()
+    assert not policy.try_hedge(400)  # spend cap: 800 + 400 > 1000
+    assert policy.try_hedge(100)
+    
+    print(f"✓ Hedge deadline and caps behave as expected ({policy.get_stats()['hedges_issued']} hedges)")
+
+def test_singleflight():
+    """Test coalescing of concurrent identical calls"""
+    print("\nTesting request coalescing...")
+    
+    import asyncio
+    import threading
+    import time
+    from ai.singleflight import SingleFlight
+    
+    flight = SingleFlight()
+    calls = []
+    results = []
+    
+    def upstream():
+        calls.append(1)
+        time.sleep(0.2)
+        return "4"
+    
+    threads = [threading.Thread(target=lambda: results.append(flight.do("same-prompt", upstream)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len(calls) == 1
+    assert [result for result, _ in results] == ["4"] * 5
+    assert sum(shared for _, shared in results) == 4
+    assert flight.get_stats()["duplicates_suppressed"] == 4
+    
+    # Finished calls are not remembered
+    flight.do("same-prompt", upstream)
+    assert len(calls) == 2
+    
+    # A cancelled async leader (a losing hedge) hands the call to a follower instead of cancelling it
+    async def upstream_async():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "5"
+    
+    async def cancel_leader():
+        leader = asyncio.create_task(flight.do_async("same-prompt", upstream_async))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.create_task(flight.do_async("same-prompt", upstream_async)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await asyncio.gather(*followers)
+    
+    followers = asyncio.run(cancel_leader())
+    assert [result for result, _ in followers] == ["5"] * 3
+    assert sorted(shared for _, shared in followers) == [False, True, True]
+    assert len(calls) == 4
+    assert flight.get_stats() == {"upstream_calls": 4, "duplicates_suppressed": 6, "in_flight": 0}
+    
+    print("✓ Five concurrent identical calls made one upstream request; a cancelled leader was taken over")
+
+def test_circuit_breaker():
+    """Test circuit breaker state transitions"""
+    print("\nTesting circuit breaker...")
+    
+    import time
+    from ai import CircuitOpenError
+    from ai.circuit_breaker import CircuitBreaker
+    
+    breaker = CircuitBreaker(failure_threshold=0.5, window=10, min_calls=4, open_seconds=0.2)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_success()
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == "open"
+    
+    try:
+        breaker.before_call()
+        assert False, "open breaker should fail fast"
+    except CircuitOpenError as e:
+        assert e.retry_in > 0
+    
+    # After the cool-down one probe goes through; a failed probe re-opens for longer
+    time.sleep(0.25)
+    breaker.before_call()
+    assert breaker.state == "half-open"
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.current_open_seconds == 0.4
+    
+    time.sleep(0.45)
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    
+    print(f"✓ Breaker opened {breaker.get_stats()['times_opened']} times and closed after a good probe")
+
 def test_configuration():
     """Test configuration loading"""
     print("\nTesting configuration...")
@@ -172,6 +1136,28 @@ def main():
         retrieved_personas = test_database()
         questions = test_survey_questions()
         test_data_export()
+        test_rate_limiter()
+        test_response_cache()
+        test_batch_roundtrip()
+        test_mock_server()
+        test_async_engine()
+        test_survey_paging()
+        test_packed_survey()
+        test_aimd_window()
+        test_generation_profiles()
+        test_scale_distribution()
+        test_replicates()
+        test_call_ledger()
+        test_survey_estimator()
+        test_resumable_run()
+        test_task_queue()
+        test_shard_merge()
+        test_question_fan_out()
+        test_survey_scheduler()
+        test_endpoint_pool()
+        test_hedge_policy()
+        test_singleflight()
+        test_circuit_breaker()
         test_configuration()
         
         print("\n=== Test Summary ===")
@@ -179,6 +1165,28 @@ def main():
         print("✓ Database operations: Working")
         print(f"✓ Survey questions: {'Working' if questions else 'Failed'}")
         print("✓ Data export: Working")
+        print("✓ Rate limiter: Working")
+        print("✓ Response cache: Working")
+        print("✓ Batch round trip: Working")
+        print("✓ Mock OpenAI server: Working")
+        print("✓ Async engine: Working")
+        print("✓ Survey paging: Working")
+        print("✓ Packed survey: Working")
+        print("✓ AIMD window: Working")
+        print("✓ Generation profiles: Working")
+        print("✓ Scale distributions: Working")
+        print("✓ Replicate sampling: Working")
+        print("✓ Call ledger: Working")
+        print("✓ Survey estimator: Working")
+        print("✓ Resumable runs: Working")
+        print("✓ Task queue and workers: Working")
+        print("✓ Shard and merge: Working")
+        print("✓ Question fan-out: Working")
+        print("✓ Survey scheduler: Working")
+        print("✓ Endpoint routing: Working")
+        print("✓ Hedge policy: Working")
+        print("✓ Request coalescing: Working")
+        print("✓ Circuit breaker: Working")
         print("✓ Configuration: Working")
         
         print("\n🎉 Core system functionality verified!")